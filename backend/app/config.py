@@ -1,5 +1,8 @@
 """資料庫配置 - 從環境變數讀取，重用現有 db_config.py 邏輯"""
 import os
+from functools import lru_cache
+from typing import Optional
+from pydantic import AliasChoices, Field
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -9,15 +12,69 @@ class Settings(BaseSettings):
     name: str
     port: str = "5432"
     sslmode: str = "require"
-    
+
+    # 唯讀副本（選用）：多台以逗號分隔，未設定時所有讀取都走主庫
+    replica_hosts: str = ""
+    replica_port: Optional[str] = None
+    # 寫入後這段時間內的讀取仍走主庫，避免讀不到剛寫入的資料
+    read_after_write_seconds: float = 5.0
+    # 副本連線等待上限（秒），逾時改走主庫
+    replica_wait_timeout: float = 1.0
+
+    # 連線池：啟動時先開 pool_min_size 條連線，最多 pool_max_size 條
+    pool_min_size: int = 1
+    pool_max_size: int = 10
+    pool_timeout: float = 30.0
+
+    # 帳款報表結果保留秒數（0 = 只合併同時進行的相同請求，不保留結果）
+    report_cache_ttl: float = 0.0
+
+    # 每月發票文件輸出目錄（每個月份一個子目錄）
+    invoice_dir: str = "invoices"
+    # 帳款匯出（背景工作 accounts_export）輸出目錄（每個工作一個子目錄）
+    export_dir: str = "exports"
+
+    # 隨 API 啟動的背景工作 worker 行程數（0 = 不啟動，改以 scripts.job_worker 另外執行）
+    job_workers: int = 1
+    # worker 沒收到通知時重新檢查排程的間隔秒數（重試的工作依 run_after 到期才會被取出）
+    job_poll_seconds: float = 5.0
+
+    # 正式環境啟動（python -m app.server）：worker 數（0 = CPU 核心數）、監聽位址與埠號（Render 會提供 PORT）
+    web_workers: int = 0
+    bind_host: str = "0.0.0.0"
+    bind_port: int = Field(8000, validation_alias=AliasChoices("PORT", "DB_BIND_PORT"))
+    # 資料庫允許本服務使用的連線總數；扣除保留給管理工具的連線與背景工作 worker 後平均分給各 worker
+    max_connections: int = 20
+    connection_reserve: int = 3
+    # 關閉時等待進行中請求完成的秒數
+    graceful_timeout: float = 30.0
+
+    # /health/ready 的門檻：超過任一項即回 503，負載平衡器暫停轉送流量給此實例
+    ready_probe_timeout: float = 2.0      # 探測查詢等待連線的秒數
+    ready_max_latency_ms: float = 500.0   # 探測查詢往返時間上限
+    ready_max_waiting: int = 5            # 等待連線的請求數上限
+    ready_max_error_rate: float = 0.2     # 近期 5xx 比例上限（請求數達 ready_min_requests 才判斷）
+    ready_min_requests: int = 20
+    ready_window_seconds: int = 60
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
         env_prefix = "DB_"
 
+@lru_cache
+def get_settings() -> Settings:
+    """取得設定（每個程序只讀取一次環境變數與 .env）"""
+    return Settings()
+
+def reload_settings() -> Settings:
+    """重新讀取環境變數與 .env（僅在需要時手動呼叫）"""
+    get_settings.cache_clear()
+    return get_settings()
+
 def get_db_config():
     """取得資料庫連線設定 - 重用現有邏輯"""
-    settings = Settings()
+    settings = get_settings()
     return {
         'host': settings.host,
         'dbname': settings.name,
@@ -27,4 +84,18 @@ def get_db_config():
         'sslmode': settings.sslmode
     }
 
-
+def get_replica_configs():
+    """取得唯讀副本連線設定（帳密與資料庫名稱沿用主庫）"""
+    settings = get_settings()
+    hosts = [h.strip() for h in settings.replica_hosts.split(",") if h.strip()]
+    return [
+        {
+            'host': host,
+            'dbname': settings.name,
+            'user': settings.user,
+            'password': settings.password,
+            'port': settings.replica_port or settings.port,
+            'sslmode': settings.sslmode
+        }
+        for host in hosts
+    ]
@@ -1,16 +1,251 @@
 """資料庫連線管理 - 重用現有 db_config.py 的邏輯"""
-import psycopg
+import itertools
+import logging
+import time
 from contextlib import contextmanager
-from app.config import get_db_config
+from contextvars import ContextVar
+from typing import Optional
+import psycopg
+from psycopg import IsolationLevel
+from psycopg.pq import TransactionStatus
+from psycopg_pool import ConnectionPool, PoolTimeout
+from app.config import get_settings, get_db_config, get_replica_configs
+
+logger = logging.getLogger(__name__)
+
+# 主庫與唯讀副本連線池（每個程序一份，啟動時由 init_pools 建立）
+_pool = None
+_replica_pools = []
+
+# 唯讀副本輪詢計數
+_replica_counter = itertools.count()
+
+# 目前請求的讀取是否改走主庫（寫入請求，或用戶端剛寫入過；由 read_your_writes 設定）
+_read_primary: ContextVar = ContextVar("db_read_primary", default=False)
+
+# 目前請求固定使用的讀取連線（由 pinned_reads 設定，第一次 get_read_cursor 時取得）
+_pinned_read: ContextVar = ContextVar("db_pinned_read", default=None)
+
+# 目前請求的資料庫往返次數（由 round_trip_counter 設定，未設定時不計數）
+_round_trips: ContextVar = ContextVar("db_round_trips", default=None)
+
+def _count_round_trips(n: int = 1):
+    counter = _round_trips.get()
+    if counter is not None:
+        counter[0] += n
+
+class CountingCursor(psycopg.Cursor):
+    """計算往返次數的游標：execute／executemany 各算一次，COPY 開始與結束各算一次"""
+
+    def execute(self, query, params=None, **kwargs):
+        self.connection.count_statement()
+        return super().execute(query, params, **kwargs)
+
+    def executemany(self, query, params_seq, **kwargs):
+        self.connection.count_statement()
+        return super().executemany(query, params_seq, **kwargs)
+
+    @contextmanager
+    def copy(self, statement, params=None, **kwargs):
+        self.connection.count_statement()
+        with super().copy(statement, params, **kwargs) as copy:
+            yield copy
+        _count_round_trips()
+
+class CountingServerCursor(psycopg.ServerCursor):
+    """計算往返次數的伺服器端游標：DECLARE 與取得欄位描述共兩次，每次 fetch 與關閉各一次"""
+
+    def execute(self, query, params=None, **kwargs):
+        self.connection.count_statement(2)
+        return super().execute(query, params, **kwargs)
+
+    def fetchone(self):
+        _count_round_trips()
+        return super().fetchone()
+
+    def fetchmany(self, size=0):
+        _count_round_trips()
+        return super().fetchmany(size)
+
+    def fetchall(self):
+        _count_round_trips()
+        return super().fetchall()
+
+    def close(self):
+        # 交易進行中才會送出 CLOSE；交易已結束時游標已隨之釋放
+        if not self.closed and self.connection.info.transaction_status == TransactionStatus.INTRANS:
+            _count_round_trips()
+        super().close()
+
+class _CountingPipeline:
+    """conn.pipeline() 產生的 pipeline：明確 sync 時計算往返"""
+
+    def __init__(self, conn, pipeline):
+        self._conn = conn
+        self._pipeline = pipeline
+
+    def sync(self):
+        self._conn.count_pipeline_sync()
+        self._pipeline.sync()
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+class CountingConnection(psycopg.Connection):
+    """計算往返次數的連線：只在這裡送出語句、提交、回滾與 pipeline 同步的位置計數，不依賴 psycopg 內部實作
+
+    - pipeline 外：每個語句一次；交易開頭 psycopg 另外送出的 BEGIN 再加一次
+    - pipeline 中：語句先排入佇列，於 sync、離開 pipeline 或 COMMIT 時合併為一次；
+      BEGIN 在 pipeline 中會立即同步，也算一次（結果須在離開 pipeline 後讀取）
+    - commit／rollback：交易進行中才會送出，各一次
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = CountingCursor
+        self.server_cursor_factory = CountingServerCursor
+        self._pipeline_depth = 0
+        self._pipeline_pending = False
+
+    def count_statement(self, round_trips: int = 1):
+        begins = not self.autocommit and self.info.transaction_status == TransactionStatus.IDLE
+        if self._pipeline_depth:
+            self._pipeline_pending = True
+            if begins:
+                _count_round_trips()
+        else:
+            _count_round_trips(round_trips + 1 if begins else round_trips)
+
+    def count_pipeline_sync(self):
+        if self._pipeline_pending:
+            _count_round_trips()
+            self._pipeline_pending = False
+
+    def _count_transaction_end(self):
+        if self.info.transaction_status != TransactionStatus.IDLE:
+            _count_round_trips()
+            self._pipeline_pending = False
+
+    def commit(self):
+        self._count_transaction_end()
+        super().commit()
+
+    def rollback(self):
+        self._count_transaction_end()
+        super().rollback()
+
+    @contextmanager
+    def pipeline(self):
+        self._pipeline_depth += 1
+        try:
+            with super().pipeline() as pipeline:
+                yield _CountingPipeline(self, pipeline)
+        finally:
+            # 離開 pipeline 時送出尚未同步的語句並等待結果
+            self.count_pipeline_sync()
+            self._pipeline_depth -= 1
+
+@contextmanager
+def round_trip_counter():
+    """在此範圍內（含交給執行緒池的同步端點）累計資料庫往返次數，產生 [次數]"""
+    counter = [0]
+    token = _round_trips.set(counter)
+    try:
+        yield counter
+    finally:
+        _round_trips.reset(token)
+
+def _create_pool(config, name: str) -> ConnectionPool:
+    settings = get_settings()
+    return ConnectionPool(
+        kwargs=config,
+        connection_class=CountingConnection,
+        # 取出前先確認連線仍可用（資料庫重啟或閒置斷線後不會把失效的連線交給請求）
+        check=ConnectionPool.check_connection,
+        min_size=settings.pool_min_size,
+        max_size=settings.pool_max_size,
+        timeout=settings.pool_timeout,
+        name=name,
+        open=False
+    )
+
+def init_pools():
+    """建立連線池並在背景開啟初始連線（重複呼叫不會重建）"""
+    global _pool, _replica_pools
+    if _pool is not None:
+        return
+    _pool = _create_pool(get_db_config(), "primary")
+    _replica_pools = [
+        _create_pool(config, f"replica-{i}")
+        for i, config in enumerate(get_replica_configs())
+    ]
+    # 不等待連線完成：資料庫暫時無法連線時不阻止啟動，連線池會在背景持續重試
+    for pool in [_pool, *_replica_pools]:
+        pool.open()
+
+def close_pools():
+    """關閉所有連線池（應用程式結束時呼叫）"""
+    global _pool, _replica_pools
+    for pool in [_pool, *_replica_pools]:
+        if pool is not None:
+            pool.close()
+    _pool = None
+    _replica_pools = []
+
+def warm_up():
+    """等待每個連線池的第一條連線並執行探測查詢，讓第一批請求不必等待建立連線"""
+    for pool in [get_pool(), *_replica_pools]:
+        try:
+            with pool.connection() as conn:
+                conn.execute("SELECT 1")
+        except Exception as e:
+            logger.warning("連線池 %s 暖機失敗：%s", pool.name, e)
+
+def get_pool() -> ConnectionPool:
+    """取得主庫連線池（尚未建立時自動建立）"""
+    if _pool is None:
+        init_pools()
+    return _pool
+
+def get_replica_pools() -> list:
+    """取得唯讀副本連線池（未設定副本時為空）"""
+    return list(_replica_pools)
 
 def get_connection():
-    """建立資料庫連線"""
+    """從連線池取得資料庫連線（用完須呼叫 release_connection 歸還）"""
     try:
-        config = get_db_config()
-        return psycopg.connect(**config)
+        return get_pool().getconn()
     except Exception as e:
         raise RuntimeError(f"資料庫連線失敗：{e}")
 
+def release_connection(conn):
+    """將連線歸還連線池（未提交的交易一律回滾）"""
+    if conn.info.transaction_status in (TransactionStatus.INTRANS, TransactionStatus.INERROR):
+        conn.rollback()
+    get_pool().putconn(conn)
+
+def is_recent_write(last_write_at: Optional[float]) -> bool:
+    """用戶端帶回的寫入時間（epoch 秒）是否仍在 read_after_write_seconds 內"""
+    if last_write_at is None:
+        return False
+    return time.time() - last_write_at < get_settings().read_after_write_seconds
+
+@contextmanager
+def read_your_writes(primary: bool):
+    """在此範圍內（含交給執行緒池的同步端點）primary 為 True 時讀取一律走主庫"""
+    token = _read_primary.set(primary)
+    try:
+        yield
+    finally:
+        _read_primary.reset(token)
+
+def _pick_read_pool() -> ConnectionPool:
+    """選擇唯讀連線池：有副本時輪流使用，目前用戶端剛寫入時退回主庫"""
+    primary = get_pool()
+    if not _replica_pools or _read_primary.get():
+        return primary
+    return _replica_pools[next(_replica_counter) % len(_replica_pools)]
+
 @contextmanager
 def get_cursor():
     """取得資料庫游標（自動處理連線與游標關閉）"""
@@ -23,6 +258,92 @@ def get_cursor():
         conn.rollback()
         raise
     finally:
-        conn.close()
+        release_connection(conn)
+
+def _acquire_read():
+    """取得讀取用連線，回傳 (pool, conn)：副本忙碌或離線時改走主庫"""
+    pool = _pick_read_pool()
+    if pool is _pool:
+        return pool, get_connection()
+    try:
+        return pool, pool.getconn(timeout=get_settings().replica_wait_timeout)
+    except PoolTimeout:
+        return _pool, get_connection()
+
+def _release_read(pool, conn):
+    """結束交易、還原交易設定後歸還（連線已失效時由連線池丟棄）"""
+    try:
+        conn.rollback()
+        conn.isolation_level = None
+        conn.read_only = None
+    except Exception:
+        pass
+    pool.putconn(conn)
+
+@contextmanager
+def pinned_reads(enabled: bool = True):
+    """在此範圍內（讀取請求）所有 get_read_cursor 共用同一條連線與同一個快照（REPEATABLE READ 唯讀交易），
+    ETag 的版本與資料因此來自同一台伺服器的同一時間點；產生 pin（enabled 為 False 時為 None），
+    結束後須以 release_pinned_read 歸還連線"""
+    if not enabled:
+        yield None
+        return
+    pin = {}
+    token = _pinned_read.set(pin)
+    try:
+        yield pin
+    finally:
+        _pinned_read.reset(token)
+
+def release_pinned_read(pin: dict):
+    """歸還 pinned_reads 取得的連線（未取得或已被 take_read_connection 接手時不做事）"""
+    if "conn" in pin:
+        _release_read(pin.pop("pool"), pin.pop("conn"))
+
+def release_current_read():
+    """提早歸還目前請求固定的讀取連線（請求之後不再讀取時使用，例如改為等待其他請求的查詢結果）"""
+    pin = _pinned_read.get()
+    if pin is not None:
+        release_pinned_read(pin)
+
+def take_read_connection():
+    """取得讀取連線並由呼叫端負責以 return_read_connection 歸還，回傳 (pool, conn)；
+    目前請求已固定讀取連線時直接接手（串流回應在請求處理結束後才讀取，仍使用同一個快照）"""
+    pin = _pinned_read.get()
+    if pin and "conn" in pin:
+        return pin.pop("pool"), pin.pop("conn")
+    return _acquire_read()
+
+def return_read_connection(pool, conn):
+    _release_read(pool, conn)
 
+@contextmanager
+def get_read_cursor():
+    """取得唯讀游標（GET 查詢使用，可能連到唯讀副本，副本忙碌或離線時改走主庫）"""
+    pin = _pinned_read.get()
+    if pin is not None:
+        if "conn" not in pin:
+            pool, conn = _acquire_read()
+            conn.isolation_level = IsolationLevel.REPEATABLE_READ
+            conn.read_only = True
+            pin["pool"], pin["conn"] = pool, conn
+        conn = pin["conn"]
+        try:
+            with conn.cursor() as cur:
+                yield cur
+        except Exception:
+            # 交易已中止：回滾後之後的讀取改用新的快照
+            conn.rollback()
+            raise
+        return
 
+    pool, conn = _acquire_read()
+    try:
+        with conn.cursor() as cur:
+            yield cur
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
@@ -1,9 +1,67 @@
 """FastAPI 應用入口"""
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import customers, companies, contracts, accounts, bank_ledger
+from fastapi.middleware.gzip import GZipMiddleware
+from app.database import (
+    init_pools, close_pools, warm_up, is_recent_write, read_your_writes, pinned_reads, release_pinned_read,
+    round_trip_counter
+)
+from app.config import get_settings
+from app.routers import customers, companies, contracts, accounts, bank_ledger, dashboard, jobs, typeahead
+from app.services.change_feed import change_feed
+from app.services.health import probe_database, readiness, request_stats
+from app.services.jobs import job_workers
+from app.services import reconciliation
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # 未安裝 brotli-asgi 時只提供 gzip
+    BrotliMiddleware = None
+
+# 回應超過此大小（bytes）才壓縮，小回應壓縮反而浪費 CPU
+COMPRESS_MIN_SIZE = 1024
+
+# 寫入回應的寫入時間標頭，用戶端帶回後讀取暫時走主庫
+LAST_WRITE_HEADER = "X-Last-Write"
+
+# SSE 每隔幾秒送一次註解行，避免閒置連線被代理伺服器切斷
+EVENTS_KEEPALIVE_SECONDS = 15
+
+class CompressionMiddleware:
+    """壓縮回應（用戶端支援時優先 brotli），SSE 串流不壓縮以免事件卡在壓縮緩衝區"""
+
+    def __init__(self, app):
+        self.app = app
+        if BrotliMiddleware is not None:
+            self.compressed_app = BrotliMiddleware(app, minimum_size=COMPRESS_MIN_SIZE, gzip_fallback=True)
+        else:
+            self.compressed_app = GZipMiddleware(app, minimum_size=COMPRESS_MIN_SIZE)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/api/events":
+            await self.app(scope, receive, send)
+        else:
+            await self.compressed_app(scope, receive, send)
 
-app = FastAPI(title="印表機記帳平台 API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """啟動時建立連線池並暖機、啟動變更通知與背景工作 worker，結束時依序關閉"""
+    init_pools()
+    # 資料庫無法連線時暖機最多等 pool_timeout 秒，放到執行緒以免卡住事件迴圈
+    await asyncio.to_thread(warm_up)
+    change_feed.start(asyncio.get_running_loop())
+    job_workers.start(get_settings().job_workers)
+    yield
+    await asyncio.to_thread(job_workers.stop)
+    change_feed.stop()
+    reconciliation.shutdown_executor()
+    close_pools()
+
+app = FastAPI(title="印表機記帳平台 API", version="1.0.0", lifespan=lifespan)
 
 # CORS 設定（允許前端連接）
 app.add_middleware(
@@ -12,21 +70,92 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[LAST_WRITE_HEADER],
 )
 
+app.add_middleware(CompressionMiddleware)
+
+def _last_write_at(request: Request):
+    try:
+        return float(request.headers[LAST_WRITE_HEADER])
+    except (KeyError, ValueError):
+        return None
+
+# read-your-writes：寫入回應帶 X-Last-Write（寫入時間），用戶端之後的請求帶回此標頭，
+# 在 DB_READ_AFTER_WRITE_SECONDS 內讀取走主庫；由用戶端攜帶，換到其他 worker／實例也有效
+@app.middleware("http")
+async def track_writes(request: Request, call_next):
+    is_write = request.method not in ("GET", "HEAD", "OPTIONS")
+    read_primary = is_write or is_recent_write(_last_write_at(request))
+    # 回應標頭 X-DB-Round-Trips：本次請求與資料庫的往返次數（串流回應只含開始輸出前的部分）
+    # 健康檢查本身不計入錯誤率
+    track = not request.url.path.startswith("/health")
+    # 讀取請求的查詢共用同一條連線與快照（ETag 與資料一致），請求結束後歸還
+    with round_trip_counter() as round_trips, read_your_writes(read_primary), pinned_reads(not is_write) as pin:
+        try:
+            response = await call_next(request)
+        except Exception:
+            if track:
+                request_stats.record(500)
+            raise
+        finally:
+            if pin:
+                await asyncio.to_thread(release_pinned_read, pin)
+    if track:
+        request_stats.record(response.status_code)
+    response.headers["X-DB-Round-Trips"] = str(round_trips[0])
+    if is_write:
+        response.headers[LAST_WRITE_HEADER] = f"{time.time():.3f}"
+    return response
+
 # 註冊路由
 app.include_router(customers.router, prefix="/api/customers", tags=["customers"])
 app.include_router(companies.router, prefix="/api/companies", tags=["companies"])
 app.include_router(contracts.router, prefix="/api/contracts", tags=["contracts"])
 app.include_router(accounts.router, prefix="/api/accounts", tags=["accounts"])
 app.include_router(bank_ledger.router, prefix="/api/bank-ledger", tags=["bank-ledger"])
+app.include_router(dashboard.router, prefix="/api/dashboard", tags=["dashboard"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(typeahead.router, prefix="/api/typeahead", tags=["typeahead"])
 
 @app.get("/")
 def root():
     return {"message": "印表機記帳平台 API"}
 
+@app.get("/api/events")
+async def stream_changes():
+    """以 SSE 推送資料變更事件：{"table", "op", "keys"}（每個寫入語句一個），
+    或要求重新載入的 {"table", "op": "resync"}（該表）／{"op": "resync"}（全部）"""
+    queue = change_feed.subscribe()
+
+    async def event_stream():
+        try:
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {payload}\n\n"
+        finally:
+            change_feed.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/health/ready")
+async def health_ready():
+    """就緒檢查：資料庫往返延遲、連線池使用量與近期錯誤率，超過門檻回 503"""
+    # 探測在預設執行緒池執行，不與同步端點搶 anyio 的執行緒名額，所有 worker 執行緒都卡住時仍能回應
+    database = await asyncio.to_thread(probe_database)
+    report = readiness(database)
+    return JSONResponse(report, status_code=200 if report["status"] == "ready" else 503)
+
 
@@ -0,0 +1,11 @@
+"""銀行帳本資料模型"""
+from pydantic import BaseModel
+from typing import List, Literal
+
+class ReconcileMatch(BaseModel):
+    bank_entry_id: int
+    source: Literal['leasing', 'buyout']
+    ar_id: int
+
+class ReconcileConfirm(BaseModel):
+    matches: List[ReconcileMatch]
@@ -1,6 +1,6 @@
 """合約資料模型 - 統一處理租賃/買斷"""
 from pydantic import BaseModel
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from datetime import date, datetime
 
 class ContractLeasingBase(BaseModel):
@@ -45,6 +45,7 @@ class ContractLeasing(ContractLeasingBase):
     needs_invoice: bool = False
     created_at: datetime
     updated_at: datetime
+    version: int = 1
     
     class Config:
         from_attributes = True
@@ -58,6 +59,7 @@ class ContractBuyout(ContractBuyoutBase):
     needs_invoice: bool = False
     created_at: datetime
     updated_at: datetime
+    version: int = 1
     
     class Config:
         from_attributes = True
@@ -67,3 +69,9 @@ class ContractResume(BaseModel):
     resume_date: Optional[date] = None
 
 
+
+
+class ContractBulkAction(BaseModel):
+    customer_code: Optional[str] = None
+    contract_codes: Optional[List[str]] = None
+    resume_date: Optional[date] = None
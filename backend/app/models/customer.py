@@ -33,6 +33,7 @@ class Customer(CustomerBase):
     id: int
     created_at: datetime
     updated_at: datetime
+    version: int = 1
     
     class Config:
         from_attributes = True
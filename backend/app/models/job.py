@@ -0,0 +1,27 @@
+"""背景工作資料模型"""
+from pydantic import BaseModel
+from typing import Any, Dict, Optional
+from datetime import datetime
+
+class JobCreate(BaseModel):
+    job_type: str
+    payload: Dict[str, Any] = {}
+
+class Job(BaseModel):
+    id: int
+    job_type: str
+    payload: Dict[str, Any]
+    status: str
+    attempts: int
+    max_attempts: int
+    run_after: datetime
+    progress_done: Optional[int] = None
+    progress_total: Optional[int] = None
+    progress_message: Optional[str] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    worker: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,25 @@
+"""應收帳款收款資料模型"""
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import date
+
+class PaymentReceipt(BaseModel):
+    contract_code: Optional[str] = None
+    customer_code: Optional[str] = None
+    amount: float
+    paid_date: date
+
+class PaymentBatch(BaseModel):
+    receipts: List[PaymentReceipt]
+
+class PaymentResult(BaseModel):
+    index: int
+    amount: float
+    applied_amount: float
+    unapplied_amount: float
+
+class PaymentBatchResult(BaseModel):
+    receipts: List[PaymentResult]
+    total_amount: float
+    applied_amount: float
+    updated_periods: int
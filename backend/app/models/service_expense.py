@@ -0,0 +1,23 @@
+"""服務費用資料模型"""
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import date
+
+class ServiceExpenseItem(BaseModel):
+    # 來源系統的服務單號，重複送出時以此更新既有資料
+    external_id: str = Field(..., min_length=1, max_length=100)
+    contract_code: str
+    service_date: date
+    confirm_date: Optional[date] = None
+    service_type: Optional[str] = None
+    repair_company_code: Optional[str] = None
+    total_amount: float = Field(..., ge=0)
+    payment_status: str = "未付款"
+
+class ServiceExpenseBatch(BaseModel):
+    items: List[ServiceExpenseItem]
+
+class ServiceExpenseBatchResult(BaseModel):
+    total: int
+    inserted: int
+    updated: int
@@ -1,162 +1,69 @@
 """帳款查詢 API - 實作完整查詢邏輯"""
-from fastapi import APIRouter, Query
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from typing import List, Literal, Optional
 from datetime import date
-from app.database import get_cursor
+from app.database import get_cursor, get_read_cursor
+from app.models.receivable import PaymentBatch, PaymentBatchResult
+from app.models.service_expense import ServiceExpenseBatch, ServiceExpenseBatchResult
+from app.services.account_queries import (
+    format_date, payable_row_to_dict, payables_statements, receivable_row_to_dict, receivables_statements,
+    row_to_dict, service_row_to_dict, service_statements
+)
+from app.services.http_cache import check_not_modified
+from app.services.invoice_run import load_invoices, month_start
+from app.services.jobs import enqueue_job
+from app.services.json_stream import stream_json_array
+from app.services.payment_service import OPEN_AR_STATUSES, apply_payments
+from app.services.service_expense_import import ServiceExpenseImportError, ingest_service_expenses
+from app.services.single_flight import coalesce
 
 router = APIRouter()
 
-def row_to_dict(row, columns):
-    """將資料庫查詢結果轉換為字典"""
-    return dict(zip(columns, row))
+STREAM_DESCRIPTION = "以串流方式逐段輸出（資料量大時記憶體用量固定，不與其他請求共用結果）"
+
+def _fetch_all(statements, convert):
+    """依序執行 statements（[(sql, params), ...]）並以 convert 轉換每一列"""
+    result = []
+    with get_read_cursor() as cur:
+        for sql, params in statements:
+            cur.execute(sql, params)
+            result.extend(convert(row) for row in cur)
+    return result
 
 @router.get("/receivables")
 def get_receivables(
+    request: Request,
+    response: Response,
     contract_code: Optional[str] = Query(None, description="合約編號（部分比對）"),
     customer_code: Optional[str] = Query(None, description="客戶代碼（部分比對）"),
     customer_name: Optional[str] = Query(None, description="客戶名稱（部分比對）"),
     from_date: Optional[str] = Query(None, description="起始日期 (YYYY-MM-DD)"),
     to_date: Optional[str] = Query(None, description="結束日期 (YYYY-MM-DD)"),
     payment_status: Optional[str] = Query(None, description="繳費狀況"),
-    type: Optional[str] = Query(None, description="類型（租賃/買斷）")
+    type: Optional[str] = Query(None, description="類型（租賃/買斷）"),
+    include_archived: bool = Query(False, description="是否包含已封存的歷史帳款"),
+    stream: bool = Query(False, description=STREAM_DESCRIPTION)
 ):
     """取得總應收帳款（合併租賃和買斷），支援多欄位查詢"""
-    filters = {
-        'contract_code': contract_code,
-        'customer_code': customer_code,
-        'customer_name': customer_name,
-        'from_date': from_date,
-        'to_date': to_date,
-        'payment_status': payment_status
-    }
-    
-    with get_cursor() as cur:
-        # 查詢租賃應收帳款
-        if not type or type == '租賃':
-            where_parts = []
-            params = []
-            
-            if contract_code:
-                where_parts.append("contract_code ILIKE %s")
-                params.append(f"%{contract_code}%")
-            
-            if customer_code:
-                where_parts.append("customer_code ILIKE %s")
-                params.append(f"%{customer_code}%")
-            
-            if customer_name:
-                where_parts.append("customer_name ILIKE %s")
-                params.append(f"%{customer_name}%")
-            
-            if from_date:
-                where_parts.append("start_date >= %s")
-                params.append(from_date)
-            
-            if to_date:
-                where_parts.append("start_date <= %s")
-                params.append(to_date)
-            
-            if payment_status:
-                where_parts.append("payment_status = %s")
-                params.append(payment_status)
-            
-            where_clause = " WHERE " + " AND ".join(where_parts) if where_parts else ""
-            
-            cur.execute(f"""
-                SELECT 
-                    id,
-                    '租賃' as type,
-                    contract_code,
-                    customer_code,
-                    customer_name,
-                    start_date as date,
-                    end_date,
-                    total_rent as amount,
-                    fee,
-                    received_amount,
-                    payment_status
-                FROM ar_leasing
-                {where_clause}
-                ORDER BY contract_code
-            """, tuple(params))
-            leasing_data = cur.fetchall()
-        else:
-            leasing_data = []
-        
-        # 查詢買斷應收帳款
-        if not type or type == '買斷':
-            where_parts = []
-            params = []
-            
-            if contract_code:
-                where_parts.append("contract_code ILIKE %s")
-                params.append(f"%{contract_code}%")
-            
-            if customer_code:
-                where_parts.append("customer_code ILIKE %s")
-                params.append(f"%{customer_code}%")
-            
-            if customer_name:
-                where_parts.append("customer_name ILIKE %s")
-                params.append(f"%{customer_name}%")
-            
-            if from_date:
-                where_parts.append("deal_date >= %s")
-                params.append(from_date)
-            
-            if to_date:
-                where_parts.append("deal_date <= %s")
-                params.append(to_date)
-            
-            if payment_status:
-                where_parts.append("payment_status = %s")
-                params.append(payment_status)
-            
-            where_clause = " WHERE " + " AND ".join(where_parts) if where_parts else ""
-            
-            cur.execute(f"""
-                SELECT 
-                    id,
-                    '買斷' as type,
-                    contract_code,
-                    customer_code,
-                    customer_name,
-                    deal_date as date,
-                    NULL as end_date,
-                    total_amount as amount,
-                    fee,
-                    received_amount,
-                    payment_status
-                FROM ar_buyout
-                {where_clause}
-                ORDER BY contract_code
-            """, tuple(params))
-            buyout_data = cur.fetchall()
-        else:
-            buyout_data = []
-    
-    # 合併資料並轉換為字典
-    columns = ['id', 'type', 'contract_code', 'customer_code', 'customer_name', 
-               'date', 'end_date', 'amount', 'fee', 'received_amount', 'payment_status']
-    
-    result = []
-    for row in leasing_data + buyout_data:
-        item = row_to_dict(row, columns)
-        # 轉換日期為字串格式
-        if item['date']:
-            item['date'] = item['date'].strftime('%Y-%m-%d') if hasattr(item['date'], 'strftime') else str(item['date'])
-        if item['end_date']:
-            item['end_date'] = item['end_date'].strftime('%Y-%m-%d') if hasattr(item['end_date'], 'strftime') else str(item['end_date'])
-        # 確保數值為 float
-        item['amount'] = float(item['amount']) if item['amount'] else 0.0
-        item['fee'] = float(item['fee']) if item['fee'] else 0.0
-        item['received_amount'] = float(item['received_amount']) if item['received_amount'] else 0.0
-        result.append(item)
-    
-    return result
+    not_modified = check_not_modified(request, response, "ar_leasing", "ar_buyout")
+    if not_modified:
+        return not_modified
+
+    args = (contract_code, customer_code, customer_name, from_date, to_date, payment_status, type, include_archived)
+    if stream:
+        return stream_json_array(receivables_statements(*args), receivable_row_to_dict)
+    return _query_receivables(*args)
+
+@coalesce
+def _query_receivables(contract_code, customer_code, customer_name, from_date, to_date, payment_status, type, include_archived=False):
+    """查詢應收帳款（相同條件的同時請求共用結果）"""
+    statements = receivables_statements(contract_code, customer_code, customer_name, from_date, to_date, payment_status, type, include_archived)
+    return _fetch_all(statements, receivable_row_to_dict)
 
 @router.get("/payables/unpaid")
 def get_unpaid_payables(
+    request: Request,
+    response: Response,
     contract_code: Optional[str] = Query(None, description="合約編號（部分比對）"),
     customer_code: Optional[str] = Query(None, description="客戶代碼（部分比對）"),
     customer_name: Optional[str] = Query(None, description="客戶名稱（部分比對）"),
@@ -164,175 +71,29 @@ def get_unpaid_payables(
     to_date: Optional[str] = Query(None, description="結束日期 (YYYY-MM-DD)"),
     payment_status: Optional[str] = Query(None, description="付款狀況"),
     payable_type: Optional[str] = Query(None, description="付款對象（業務/維護）"),
-    contract_type: Optional[str] = Query(None, description="合約類型（租賃/買斷）")
+    contract_type: Optional[str] = Query(None, description="合約類型（租賃/買斷）"),
+    stream: bool = Query(False, description=STREAM_DESCRIPTION)
 ):
     """取得未出帳款（應付帳款 - 未付款），支援多欄位查詢"""
-    with get_cursor() as cur:
-        result = []
-        
-        # 查詢租賃合約的未出帳款（業務）
-        if not contract_type or contract_type == '租賃':
-            if not payable_type or payable_type == '業務':
-                where_parts = ["sales_payment_status != '已付款'", "sales_amount > 0"]
-                params = []
-                
-                if contract_code:
-                    where_parts.append("contract_code ILIKE %s")
-                    params.append(f"%{contract_code}%")
-                if customer_code:
-                    where_parts.append("customer_code ILIKE %s")
-                    params.append(f"%{customer_code}%")
-                if customer_name:
-                    where_parts.append("customer_name ILIKE %s")
-                    params.append(f"%{customer_name}%")
-                if from_date:
-                    where_parts.append("start_date >= %s")
-                    params.append(from_date)
-                if to_date:
-                    where_parts.append("start_date <= %s")
-                    params.append(to_date)
-                if payment_status:
-                    where_parts.append("sales_payment_status = %s")
-                    params.append(payment_status)
-                
-                cur.execute(f"""
-                    SELECT 
-                        contract_code, '租賃' as contract_type,
-                        customer_code, customer_name, start_date as date,
-                        '業務' as payable_type, sales_company_code as company_code,
-                        sales_amount as amount, sales_payment_status as payment_status
-                    FROM contracts_leasing
-                    WHERE {' AND '.join(where_parts)}
-                """, tuple(params))
-                result.extend(cur.fetchall())
-        
-        # 查詢租賃合約的未出帳款（維護）
-        if not contract_type or contract_type == '租賃':
-            if not payable_type or payable_type == '維護':
-                where_parts = ["service_payment_status != '已付款'", "service_amount > 0"]
-                params = []
-                
-                if contract_code:
-                    where_parts.append("contract_code ILIKE %s")
-                    params.append(f"%{contract_code}%")
-                if customer_code:
-                    where_parts.append("customer_code ILIKE %s")
-                    params.append(f"%{customer_code}%")
-                if customer_name:
-                    where_parts.append("customer_name ILIKE %s")
-                    params.append(f"%{customer_name}%")
-                if from_date:
-                    where_parts.append("start_date >= %s")
-                    params.append(from_date)
-                if to_date:
-                    where_parts.append("start_date <= %s")
-                    params.append(to_date)
-                if payment_status:
-                    where_parts.append("service_payment_status = %s")
-                    params.append(payment_status)
-                
-                cur.execute(f"""
-                    SELECT 
-                        contract_code, '租賃' as contract_type,
-                        customer_code, customer_name, start_date as date,
-                        '維護' as payable_type, service_company_code as company_code,
-                        service_amount as amount, service_payment_status as payment_status
-                    FROM contracts_leasing
-                    WHERE {' AND '.join(where_parts)}
-                """, tuple(params))
-                result.extend(cur.fetchall())
-        
-        # 查詢買斷合約的未出帳款（業務）
-        if not contract_type or contract_type == '買斷':
-            if not payable_type or payable_type == '業務':
-                where_parts = ["sales_payment_status != '已付款'", "sales_amount > 0"]
-                params = []
-                
-                if contract_code:
-                    where_parts.append("contract_code ILIKE %s")
-                    params.append(f"%{contract_code}%")
-                if customer_code:
-                    where_parts.append("customer_code ILIKE %s")
-                    params.append(f"%{customer_code}%")
-                if customer_name:
-                    where_parts.append("customer_name ILIKE %s")
-                    params.append(f"%{customer_name}%")
-                if from_date:
-                    where_parts.append("deal_date >= %s")
-                    params.append(from_date)
-                if to_date:
-                    where_parts.append("deal_date <= %s")
-                    params.append(to_date)
-                if payment_status:
-                    where_parts.append("sales_payment_status = %s")
-                    params.append(payment_status)
-                
-                cur.execute(f"""
-                    SELECT 
-                        contract_code, '買斷' as contract_type,
-                        customer_code, customer_name, deal_date as date,
-                        '業務' as payable_type, sales_company_code as company_code,
-                        sales_amount as amount, sales_payment_status as payment_status
-                    FROM contracts_buyout
-                    WHERE {' AND '.join(where_parts)}
-                """, tuple(params))
-                result.extend(cur.fetchall())
-            
-            # 查詢買斷合約的未出帳款（維護）
-            if not payable_type or payable_type == '維護':
-                where_parts = ["service_payment_status != '已付款'", "service_amount > 0"]
-                params = []
-                
-                if contract_code:
-                    where_parts.append("contract_code ILIKE %s")
-                    params.append(f"%{contract_code}%")
-                if customer_code:
-                    where_parts.append("customer_code ILIKE %s")
-                    params.append(f"%{customer_code}%")
-                if customer_name:
-                    where_parts.append("customer_name ILIKE %s")
-                    params.append(f"%{customer_name}%")
-                if from_date:
-                    where_parts.append("deal_date >= %s")
-                    params.append(from_date)
-                if to_date:
-                    where_parts.append("deal_date <= %s")
-                    params.append(to_date)
-                if payment_status:
-                    where_parts.append("service_payment_status = %s")
-                    params.append(payment_status)
-                
-                cur.execute(f"""
-                    SELECT 
-                        contract_code, '買斷' as contract_type,
-                        customer_code, customer_name, deal_date as date,
-                        '維護' as payable_type, service_company_code as company_code,
-                        service_amount as amount, service_payment_status as payment_status
-                    FROM contracts_buyout
-                    WHERE {' AND '.join(where_parts)}
-                """, tuple(params))
-                result.extend(cur.fetchall())
-        
-        all_data = result
-    
-    # 轉換資料
-    columns = ['contract_code', 'contract_type', 'customer_code', 'customer_name', 
-               'date', 'payable_type', 'company_code', 'amount', 'payment_status']
-    
-    result = []
-    for row in all_data:
-        item = row_to_dict(row, columns)
-        # 轉換日期為字串格式
-        if item['date']:
-            item['date'] = item['date'].strftime('%Y-%m-%d') if hasattr(item['date'], 'strftime') else str(item['date'])
-        # 確保數值為 float
-        item['amount'] = float(item['amount']) if item['amount'] else 0.0
-        result.append(item)
-    
-    return result
+    not_modified = check_not_modified(request, response, "contracts_leasing", "contracts_buyout")
+    if not_modified:
+        return not_modified
+
+    args = (contract_code, customer_code, customer_name, from_date, to_date, payment_status, payable_type, contract_type)
+    if stream:
+        return stream_json_array(payables_statements(False, *args), payable_row_to_dict)
+    return _query_unpaid_payables(*args)
+
+@coalesce
+def _query_unpaid_payables(contract_code, customer_code, customer_name, from_date, to_date, payment_status, payable_type, contract_type):
+    """查詢未出帳款（相同條件的同時請求共用結果）"""
+    statements = payables_statements(False, contract_code, customer_code, customer_name, from_date, to_date, payment_status, payable_type, contract_type)
+    return _fetch_all(statements, payable_row_to_dict)
 
 @router.get("/payables/paid")
 def get_paid_payables(
+    request: Request,
+    response: Response,
     contract_code: Optional[str] = Query(None, description="合約編號（部分比對）"),
     customer_code: Optional[str] = Query(None, description="客戶代碼（部分比對）"),
     customer_name: Optional[str] = Query(None, description="客戶名稱（部分比對）"),
@@ -340,244 +101,303 @@ def get_paid_payables(
     to_date: Optional[str] = Query(None, description="結束日期 (YYYY-MM-DD)"),
     payment_status: Optional[str] = Query(None, description="付款狀況"),
     payable_type: Optional[str] = Query(None, description="付款對象（業務/維護）"),
-    contract_type: Optional[str] = Query(None, description="合約類型（租賃/買斷）")
+    contract_type: Optional[str] = Query(None, description="合約類型（租賃/買斷）"),
+    stream: bool = Query(False, description=STREAM_DESCRIPTION)
 ):
     """取得已出帳款（應付帳款 - 已付款），支援多欄位查詢"""
-    with get_cursor() as cur:
-        result = []
-        
-        # 查詢租賃合約的已出帳款（業務）
-        if not contract_type or contract_type == '租賃':
-            if not payable_type or payable_type == '業務':
-                where_parts = ["sales_payment_status = '已付款'", "sales_amount > 0"]
-                params = []
-                
-                if contract_code:
-                    where_parts.append("contract_code ILIKE %s")
-                    params.append(f"%{contract_code}%")
-                if customer_code:
-                    where_parts.append("customer_code ILIKE %s")
-                    params.append(f"%{customer_code}%")
-                if customer_name:
-                    where_parts.append("customer_name ILIKE %s")
-                    params.append(f"%{customer_name}%")
-                if from_date:
-                    where_parts.append("start_date >= %s")
-                    params.append(from_date)
-                if to_date:
-                    where_parts.append("start_date <= %s")
-                    params.append(to_date)
-                if payment_status:
-                    where_parts.append("sales_payment_status = %s")
-                    params.append(payment_status)
-                
-                cur.execute(f"""
-                    SELECT 
-                        contract_code, '租賃' as contract_type,
-                        customer_code, customer_name, start_date as date,
-                        '業務' as payable_type, sales_company_code as company_code,
-                        sales_amount as amount, sales_payment_status as payment_status
-                    FROM contracts_leasing
-                    WHERE {' AND '.join(where_parts)}
-                """, tuple(params))
-                result.extend(cur.fetchall())
-        
-        # 查詢租賃合約的已出帳款（維護）
-        if not contract_type or contract_type == '租賃':
-            if not payable_type or payable_type == '維護':
-                where_parts = ["service_payment_status = '已付款'", "service_amount > 0"]
-                params = []
-                
-                if contract_code:
-                    where_parts.append("contract_code ILIKE %s")
-                    params.append(f"%{contract_code}%")
-                if customer_code:
-                    where_parts.append("customer_code ILIKE %s")
-                    params.append(f"%{customer_code}%")
-                if customer_name:
-                    where_parts.append("customer_name ILIKE %s")
-                    params.append(f"%{customer_name}%")
-                if from_date:
-                    where_parts.append("start_date >= %s")
-                    params.append(from_date)
-                if to_date:
-                    where_parts.append("start_date <= %s")
-                    params.append(to_date)
-                if payment_status:
-                    where_parts.append("service_payment_status = %s")
-                    params.append(payment_status)
-                
-                cur.execute(f"""
-                    SELECT 
-                        contract_code, '租賃' as contract_type,
-                        customer_code, customer_name, start_date as date,
-                        '維護' as payable_type, service_company_code as company_code,
-                        service_amount as amount, service_payment_status as payment_status
-                    FROM contracts_leasing
-                    WHERE {' AND '.join(where_parts)}
-                """, tuple(params))
-                result.extend(cur.fetchall())
-        
-        # 查詢買斷合約的已出帳款（業務）
-        if not contract_type or contract_type == '買斷':
-            if not payable_type or payable_type == '業務':
-                where_parts = ["sales_payment_status = '已付款'", "sales_amount > 0"]
-                params = []
-                
-                if contract_code:
-                    where_parts.append("contract_code ILIKE %s")
-                    params.append(f"%{contract_code}%")
-                if customer_code:
-                    where_parts.append("customer_code ILIKE %s")
-                    params.append(f"%{customer_code}%")
-                if customer_name:
-                    where_parts.append("customer_name ILIKE %s")
-                    params.append(f"%{customer_name}%")
-                if from_date:
-                    where_parts.append("deal_date >= %s")
-                    params.append(from_date)
-                if to_date:
-                    where_parts.append("deal_date <= %s")
-                    params.append(to_date)
-                if payment_status:
-                    where_parts.append("sales_payment_status = %s")
-                    params.append(payment_status)
-                
-                cur.execute(f"""
-                    SELECT 
-                        contract_code, '買斷' as contract_type,
-                        customer_code, customer_name, deal_date as date,
-                        '業務' as payable_type, sales_company_code as company_code,
-                        sales_amount as amount, sales_payment_status as payment_status
-                    FROM contracts_buyout
-                    WHERE {' AND '.join(where_parts)}
-                """, tuple(params))
-                result.extend(cur.fetchall())
-            
-            # 查詢買斷合約的已出帳款（維護）
-            if not payable_type or payable_type == '維護':
-                where_parts = ["service_payment_status = '已付款'", "service_amount > 0"]
-                params = []
-                
-                if contract_code:
-                    where_parts.append("contract_code ILIKE %s")
-                    params.append(f"%{contract_code}%")
-                if customer_code:
-                    where_parts.append("customer_code ILIKE %s")
-                    params.append(f"%{customer_code}%")
-                if customer_name:
-                    where_parts.append("customer_name ILIKE %s")
-                    params.append(f"%{customer_name}%")
-                if from_date:
-                    where_parts.append("deal_date >= %s")
-                    params.append(from_date)
-                if to_date:
-                    where_parts.append("deal_date <= %s")
-                    params.append(to_date)
-                if payment_status:
-                    where_parts.append("service_payment_status = %s")
-                    params.append(payment_status)
-                
-                cur.execute(f"""
-                    SELECT 
-                        contract_code, '買斷' as contract_type,
-                        customer_code, customer_name, deal_date as date,
-                        '維護' as payable_type, service_company_code as company_code,
-                        service_amount as amount, service_payment_status as payment_status
-                    FROM contracts_buyout
-                    WHERE {' AND '.join(where_parts)}
-                """, tuple(params))
-                result.extend(cur.fetchall())
-        
-        all_data = result
-    
-    # 轉換資料
-    columns = ['contract_code', 'contract_type', 'customer_code', 'customer_name', 
-               'date', 'payable_type', 'company_code', 'amount', 'payment_status']
-    
-    result = []
-    for row in all_data:
-        item = row_to_dict(row, columns)
-        # 轉換日期為字串格式
-        if item['date']:
-            item['date'] = item['date'].strftime('%Y-%m-%d') if hasattr(item['date'], 'strftime') else str(item['date'])
-        # 確保數值為 float
-        item['amount'] = float(item['amount']) if item['amount'] else 0.0
-        result.append(item)
-    
-    return result
+    not_modified = check_not_modified(request, response, "contracts_leasing", "contracts_buyout")
+    if not_modified:
+        return not_modified
+
+    args = (contract_code, customer_code, customer_name, from_date, to_date, payment_status, payable_type, contract_type)
+    if stream:
+        return stream_json_array(payables_statements(True, *args), payable_row_to_dict)
+    return _query_paid_payables(*args)
+
+@coalesce
+def _query_paid_payables(contract_code, customer_code, customer_name, from_date, to_date, payment_status, payable_type, contract_type):
+    """查詢已出帳款（相同條件的同時請求共用結果）"""
+    statements = payables_statements(True, contract_code, customer_code, customer_name, from_date, to_date, payment_status, payable_type, contract_type)
+    return _fetch_all(statements, payable_row_to_dict)
 
 @router.get("/service")
 def get_service_expenses(
+    request: Request,
+    response: Response,
     contract_code: Optional[str] = Query(None, description="合約編號（部分比對）"),
     customer_code: Optional[str] = Query(None, description="客戶代碼（部分比對）"),
     customer_name: Optional[str] = Query(None, description="客戶名稱（部分比對）"),
     from_date: Optional[str] = Query(None, description="起始日期 (YYYY-MM-DD)"),
     to_date: Optional[str] = Query(None, description="結束日期 (YYYY-MM-DD)"),
     payment_status: Optional[str] = Query(None, description="繳費狀況"),
-    service_type: Optional[str] = Query(None, description="服務類型（部分比對）")
+    service_type: Optional[str] = Query(None, description="服務類型（部分比對）"),
+    stream: bool = Query(False, description=STREAM_DESCRIPTION)
 ):
     """取得服務費用，支援多欄位查詢"""
-    with get_cursor() as cur:
-        where_parts = []
-        params = []
-        
-        if contract_code:
-            where_parts.append("contract_code ILIKE %s")
-            params.append(f"%{contract_code}%")
-        
+    not_modified = check_not_modified(request, response, "service_expense")
+    if not_modified:
+        return not_modified
+
+    args = (contract_code, customer_code, customer_name, from_date, to_date, payment_status, service_type)
+    if stream:
+        return stream_json_array(service_statements(*args), service_row_to_dict)
+    return _query_service_expenses(*args)
+
+@coalesce
+def _query_service_expenses(contract_code, customer_code, customer_name, from_date, to_date, payment_status, service_type):
+    """查詢服務費用（相同條件的同時請求共用結果）"""
+    statements = service_statements(contract_code, customer_code, customer_name, from_date, to_date, payment_status, service_type)
+    return _fetch_all(statements, service_row_to_dict)
+
+@router.post("/service/batch", response_model=ServiceExpenseBatchResult)
+def post_service_expense_batch(batch: ServiceExpenseBatch):
+    """批次寫入服務費用（COPY 至暫存表驗證後 upsert；同一服務單號重複送出時更新既有資料）"""
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="服務費用資料不得為空")
+    try:
+        with get_cursor() as cur:
+            return ServiceExpenseBatchResult(**ingest_service_expenses(cur, batch.items))
+    except ServiceExpenseImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# 服務費用彙總維度：(分組運算式, 名稱運算式, 排序)
+_SERVICE_SUMMARY_GROUPS = {
+    'repair_company': ("s.repair_company_code", "MAX(c.name)", "total_amount DESC, key"),
+    'contract': ("s.contract_code", "MAX(s.customer_name)", "total_amount DESC, key"),
+    'month': ("to_char(date_trunc('month', s.service_date), 'YYYY-MM')", "NULL", "key"),
+}
+
+@router.get("/service/summary")
+def get_service_expense_summary(
+    request: Request,
+    response: Response,
+    group_by: Literal['repair_company', 'contract', 'month'] = Query('repair_company', description="彙總維度：維修公司／合約／月份"),
+    from_date: Optional[str] = Query(None, description="起始日期 (YYYY-MM-DD)"),
+    to_date: Optional[str] = Query(None, description="結束日期 (YYYY-MM-DD)"),
+    repair_company_code: Optional[str] = Query(None, description="維修公司代碼"),
+    contract_code: Optional[str] = Query(None, description="合約編號"),
+    payment_status: Optional[str] = Query(None, description="付款狀況")
+):
+    """服務費用彙總（依維修公司、合約或月份 GROUP BY），不必下載所有明細"""
+    not_modified = check_not_modified(request, response, "service_expense")
+    if not_modified:
+        return not_modified
+
+    return _query_service_summary(group_by, from_date, to_date, repair_company_code, contract_code, payment_status)
+
+@coalesce
+def _query_service_summary(group_by, from_date, to_date, repair_company_code, contract_code, payment_status):
+    """查詢服務費用彙總（相同條件的同時請求共用結果）"""
+    key_sql, name_sql, order_sql = _SERVICE_SUMMARY_GROUPS[group_by]
+    where_parts = []
+    params = []
+
+    if from_date:
+        where_parts.append("s.service_date >= %s")
+        params.append(from_date)
+    if to_date:
+        where_parts.append("s.service_date <= %s")
+        params.append(to_date)
+    if repair_company_code:
+        where_parts.append("s.repair_company_code = %s")
+        params.append(repair_company_code)
+    if contract_code:
+        where_parts.append("s.contract_code = %s")
+        params.append(contract_code)
+    if payment_status:
+        where_parts.append("s.payment_status = %s")
+        params.append(payment_status)
+
+    where_clause = " WHERE " + " AND ".join(where_parts) if where_parts else ""
+    join_clause = "LEFT JOIN companies c ON c.company_code = s.repair_company_code" if group_by == 'repair_company' else ""
+
+    return _fetch_all([(f"""
+        SELECT {key_sql} AS key, {name_sql} AS name, COUNT(*) AS count,
+               COALESCE(SUM(s.total_amount), 0) AS total_amount,
+               COALESCE(SUM(s.total_amount) FILTER (WHERE s.payment_status = '已付款'), 0) AS paid_amount,
+               MIN(s.service_date), MAX(s.service_date)
+        FROM service_expense s
+        {join_clause}
+        {where_clause}
+        GROUP BY 1
+        ORDER BY {order_sql}
+    """, tuple(params))], _service_summary_row_to_dict)
+
+def _service_summary_row_to_dict(row):
+    total = float(row[3])
+    paid = float(row[4])
+    return {
+        'key': row[0], 'name': row[1], 'count': row[2],
+        'total_amount': total, 'paid_amount': paid, 'unpaid_amount': total - paid,
+        'first_date': format_date(row[5]), 'last_date': format_date(row[6]),
+    }
+
+_AGING_COLUMNS = ['customer_code', 'customer_name', 'current_amount', 'days_1_30',
+                  'days_31_60', 'days_61_90', 'days_over_90', 'total']
+
+def _build_aging_query(as_of: date, customer_code: Optional[str], type: Optional[str]):
+    """組出帳齡分析的彙總 SQL（租賃以 end_date、買斷以 deal_date 計算逾期天數）"""
+    sources = []
+    params = []
+
+    # 餘額 = 應收 + 手續費 - 已收（與前端的未收金額相同）；僅計入已開始計費的期別
+    if not type or type == '租賃':
+        where_parts = ["payment_status = ANY(%s)", "start_date <= %s::date"]
+        params.extend([as_of, OPEN_AR_STATUSES, as_of])
+        if customer_code:
+            where_parts.append("customer_code ILIKE %s")
+            params.append(f"%{customer_code}%")
+        sources.append(f"""
+            SELECT customer_code, customer_name,
+                   %s::date - end_date AS days_past_due,
+                   COALESCE(total_rent, 0) + COALESCE(fee, 0) - COALESCE(received_amount, 0) AS balance
+            FROM ar_leasing
+            WHERE {' AND '.join(where_parts)}
+        """)
+
+    if not type or type == '買斷':
+        where_parts = ["payment_status = ANY(%s)", "deal_date <= %s::date"]
+        params.extend([as_of, OPEN_AR_STATUSES, as_of])
+        if customer_code:
+            where_parts.append("customer_code ILIKE %s")
+            params.append(f"%{customer_code}%")
+        sources.append(f"""
+            SELECT customer_code, customer_name,
+                   %s::date - deal_date AS days_past_due,
+                   COALESCE(total_amount, 0) + COALESCE(fee, 0) - COALESCE(received_amount, 0) AS balance
+            FROM ar_buyout
+            WHERE {' AND '.join(where_parts)}
+        """)
+
+    if not sources:
+        return None, []
+
+    sql = f"""
+        WITH open_ar AS ({' UNION ALL '.join(sources)})
+        SELECT
+            customer_code,
+            MAX(customer_name) AS customer_name,
+            COALESCE(SUM(balance) FILTER (WHERE days_past_due <= 0), 0) AS current_amount,
+            COALESCE(SUM(balance) FILTER (WHERE days_past_due BETWEEN 1 AND 30), 0) AS days_1_30,
+            COALESCE(SUM(balance) FILTER (WHERE days_past_due BETWEEN 31 AND 60), 0) AS days_31_60,
+            COALESCE(SUM(balance) FILTER (WHERE days_past_due BETWEEN 61 AND 90), 0) AS days_61_90,
+            COALESCE(SUM(balance) FILTER (WHERE days_past_due > 90), 0) AS days_over_90,
+            SUM(balance) AS total
+        FROM open_ar
+        WHERE balance > 0
+        GROUP BY customer_code
+    """
+    return sql, params
+
+def _aging_row_to_dict(row):
+    item = row_to_dict(row, _AGING_COLUMNS)
+    for key in _AGING_COLUMNS[2:]:
+        item[key] = float(item[key]) if item[key] else 0.0
+    return item
+
+@router.get("/receivables/aging")
+def get_receivables_aging(
+    as_of: Optional[date] = Query(None, description="基準日 (YYYY-MM-DD)，預設今天"),
+    customer_code: Optional[str] = Query(None, description="客戶代碼（部分比對）"),
+    type: Optional[str] = Query(None, description="類型（租賃/買斷）"),
+    snapshot_date: Optional[date] = Query(None, description="讀取指定日期的帳齡快照 (YYYY-MM-DD)"),
+    stream: bool = Query(False, description=STREAM_DESCRIPTION)
+):
+    """取得應收帳款帳齡分析（依客戶彙總：未逾期/1-30/31-60/61-90/90 天以上）"""
+    if snapshot_date:
+        where_parts = ["snapshot_date = %s"]
+        params = [snapshot_date]
         if customer_code:
             where_parts.append("customer_code ILIKE %s")
             params.append(f"%{customer_code}%")
-        
-        if customer_name:
-            where_parts.append("customer_name ILIKE %s")
-            params.append(f"%{customer_name}%")
-        
-        if from_date:
-            where_parts.append("service_date >= %s")
-            params.append(from_date)
-        
-        if to_date:
-            where_parts.append("service_date <= %s")
-            params.append(to_date)
-        
-        if payment_status:
-            where_parts.append("payment_status = %s")
-            params.append(payment_status)
-        
-        if service_type:
-            where_parts.append("service_type ILIKE %s")
-            params.append(f"%{service_type}%")
-        
-        where_clause = " WHERE " + " AND ".join(where_parts) if where_parts else ""
-        
+        statements = [(f"""
+            SELECT customer_code, customer_name, current_amount, days_1_30,
+                   days_31_60, days_61_90, days_over_90, total
+            FROM ar_aging_snapshot
+            WHERE {' AND '.join(where_parts)}
+            ORDER BY customer_code
+        """, tuple(params))]
+        if stream:
+            return stream_json_array(statements, _aging_row_to_dict)
+        return _fetch_all(statements, _aging_row_to_dict)
+
+    as_of = as_of or date.today()
+    if stream:
+        return stream_json_array(_aging_statements(as_of, customer_code, type), _aging_row_to_dict)
+    return _query_receivables_aging(as_of, customer_code, type)
+
+def _aging_statements(as_of: date, customer_code: Optional[str], type: Optional[str]):
+    sql, params = _build_aging_query(as_of, customer_code, type)
+    if not sql:
+        return []
+    return [(sql + " ORDER BY customer_code", tuple(params))]
+
+@coalesce
+def _query_receivables_aging(as_of: date, customer_code: Optional[str], type: Optional[str]):
+    """查詢帳齡分析（相同條件的同時請求共用結果）"""
+    return _fetch_all(_aging_statements(as_of, customer_code, type), _aging_row_to_dict)
+
+@router.post("/receivables/aging/snapshot")
+def create_receivables_aging_snapshot(
+    as_of: Optional[date] = Query(None, description="快照基準日 (YYYY-MM-DD)，預設今天")
+):
+    """建立（或重建）指定日期的帳齡快照，供歷史帳齡查詢使用"""
+    snapshot_date = as_of or date.today()
+    sql, params = _build_aging_query(snapshot_date, None, None)
+
+    with get_cursor() as cur:
+        cur.execute("DELETE FROM ar_aging_snapshot WHERE snapshot_date = %s", (snapshot_date,))
         cur.execute(f"""
-            SELECT 
-                id, contract_code, customer_code, customer_name,
-                service_date, confirm_date, service_type,
-                repair_company_code, total_amount, payment_status
-            FROM service_expense
-            {where_clause}
-            ORDER BY service_date DESC
-        """, tuple(params))
-        rows = cur.fetchall()
-    
-    # 轉換為字典
-    columns = ['id', 'contract_code', 'customer_code', 'customer_name', 
-               'service_date', 'confirm_date', 'service_type', 
-               'repair_company_code', 'total_amount', 'payment_status']
-    
-    result = []
-    for row in rows:
-        item = row_to_dict(row, columns)
-        # 轉換日期為字串格式
-        if item['service_date']:
-            item['service_date'] = item['service_date'].strftime('%Y-%m-%d') if hasattr(item['service_date'], 'strftime') else str(item['service_date'])
-        if item['confirm_date']:
-            item['confirm_date'] = item['confirm_date'].strftime('%Y-%m-%d') if hasattr(item['confirm_date'], 'strftime') else str(item['confirm_date'])
-        # 確保數值為 float
-        item['total_amount'] = float(item['total_amount']) if item['total_amount'] else 0.0
-        result.append(item)
-    
-    return result
+            INSERT INTO ar_aging_snapshot
+            (snapshot_date, customer_code, customer_name, current_amount, days_1_30,
+             days_31_60, days_61_90, days_over_90, total)
+            SELECT %s::date, aging.*
+            FROM ({sql}) AS aging
+        """, (snapshot_date, *params))
+        count = cur.rowcount
+
+    return {"snapshot_date": snapshot_date.isoformat(), "customers": count}
+
+@router.post("/receivables/payments", response_model=PaymentBatchResult)
+def post_receivable_payments(batch: PaymentBatch):
+    """批次登錄收款：每筆收款依到期日先後沖銷該合約（或該客戶）最舊的未結清期別"""
+    if not batch.receipts:
+        raise HTTPException(status_code=400, detail="收款資料不得為空")
+    for i, receipt in enumerate(batch.receipts):
+        if not receipt.contract_code and not receipt.customer_code:
+            raise HTTPException(status_code=400, detail=f"第 {i + 1} 筆收款需指定合約編號或客戶代碼")
+        if receipt.amount <= 0:
+            raise HTTPException(status_code=400, detail=f"第 {i + 1} 筆收款金額必須大於 0")
+
+    with get_cursor() as cur:
+        result = apply_payments(cur, batch.receipts)
+
+    return PaymentBatchResult(**result)
+
+@router.post("/invoices/run", status_code=202)
+def run_invoices(month: str = Query(..., description="開立月份 (YYYY-MM)")):
+    """排入每月發票作業（背景工作 invoice_run），以 GET /api/jobs/{id} 查詢結果；同一個月份可重複執行，不會重複開立"""
+    try:
+        invoice_month = month_start(month)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="月份格式應為 YYYY-MM")
+
+    with get_cursor() as cur:
+        return enqueue_job(cur, "invoice_run", {"month": invoice_month.strftime("%Y-%m")})
+
+@router.get("/invoices")
+def get_invoices(month: str = Query(..., description="開立月份 (YYYY-MM)")):
+    """查詢指定月份已開立的發票"""
+    try:
+        invoice_month = month_start(month)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="月份格式應為 YYYY-MM")
+
+    with get_read_cursor() as cur:
+        invoices = load_invoices(cur, invoice_month)
+    for invoice in invoices:
+        for key in ('invoice_month', 'period_start', 'period_end'):
+            invoice[key] = format_date(invoice[key])
+        for key in ('net_amount', 'tax_amount', 'total_amount'):
+            invoice[key] = float(invoice[key])
+    return invoices
@@ -1,10 +1,106 @@
-"""銀行帳本 API - 暫時最小實作，讓後端能啟動"""
-from fastapi import APIRouter
+"""銀行帳本 API"""
+from fastapi import APIRouter, File, HTTPException, Query, UploadFile
+from typing import Optional
+from app.database import get_cursor, get_read_cursor
+from app.models.bank_ledger import ReconcileConfirm
+from app.services.bank_import import BankImportError, import_statement
+from app.services.reconciliation import (
+    confirm_matches, load_open_receivables, load_unreconciled_entries, match_entries
+)
 
 router = APIRouter()
 
+AR_TYPE_LABELS = {'leasing': '租賃', 'buyout': '買斷'}
+
 @router.get("")
-def get_bank_ledger():
-    """取得銀行帳本 - 待實作"""
-    return []
+def get_bank_ledger(
+    from_date: Optional[str] = Query(None, description="起始日期 (YYYY-MM-DD)"),
+    to_date: Optional[str] = Query(None, description="結束日期 (YYYY-MM-DD)"),
+    search: Optional[str] = Query(None, description="搜尋匯款人或備註")
+):
+    """取得銀行帳本"""
+    where_parts = []
+    params = []
+
+    if from_date:
+        where_parts.append("txn_date >= %s")
+        params.append(from_date)
+    if to_date:
+        where_parts.append("txn_date <= %s")
+        params.append(to_date)
+    if search:
+        where_parts.append("(payer ILIKE %s OR note ILIKE %s)")
+        params.extend([f"%{search}%"] * 2)
+
+    where_clause = " WHERE " + " AND ".join(where_parts) if where_parts else ""
+
+    with get_read_cursor() as cur:
+        cur.execute(f"""
+            SELECT id, txn_date, payer, expense, income, note, is_reconciled,
+                   reconciled_ar_id, reconciled_ar_type
+            FROM bank_ledger
+            {where_clause}
+            ORDER BY txn_date DESC, id DESC
+        """, tuple(params))
+        rows = cur.fetchall()
+
+    return [
+        {
+            'id': r[0],
+            'txn_date': r[1].strftime('%Y-%m-%d') if r[1] else None,
+            'payer': r[2],
+            'expense': float(r[3]) if r[3] else 0.0,
+            'income': float(r[4]) if r[4] else 0.0,
+            'note': r[5],
+            'is_reconciled': bool(r[6]),
+            'reconciled_ar_id': r[7],
+            'reconciled_ar_type': AR_TYPE_LABELS.get(r[8], r[8]),
+        }
+        for r in rows
+    ]
+
+@router.post("/import")
+def import_bank_statement(
+    file: UploadFile = File(..., description="銀行對帳單 CSV"),
+    encoding: str = Query("utf-8-sig", description="檔案編碼（例如 big5）")
+):
+    """匯入銀行對帳單 CSV（逐行解析，已匯入過的交易會略過）"""
+    try:
+        with get_cursor() as cur:
+            return import_statement(cur, file.file, encoding)
+    except BankImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (UnicodeDecodeError, LookupError):
+        raise HTTPException(status_code=400, detail="檔案編碼錯誤，請確認 encoding 參數")
+
+@router.get("/reconciliation")
+def get_reconciliation_proposals(
+    from_date: Optional[str] = Query(None, description="入帳起始日期 (YYYY-MM-DD)"),
+    to_date: Optional[str] = Query(None, description="入帳結束日期 (YYYY-MM-DD)"),
+    window_days: int = Query(10, ge=0, le=120, description="到期日前後容許天數"),
+    amount_tolerance: int = Query(0, ge=0, le=100, description="容許入帳少於應收的金額（匯費）"),
+    limit: int = Query(3, ge=1, le=10, description="每筆入帳最多候選數")
+):
+    """為尚未對帳的銀行入帳提出候選應收帳款（依金額、日期與摘要中的客戶名稱計分）"""
+    with get_read_cursor() as cur:
+        entries = load_unreconciled_entries(cur, from_date, to_date)
+        receivables = load_open_receivables(cur) if entries else []
+
+    proposals = match_entries(receivables, entries, window_days, amount_tolerance, limit)
+
+    for item in proposals:
+        item['txn_date'] = item['txn_date'].strftime('%Y-%m-%d')
+        for candidate in item['candidates']:
+            candidate['due_date'] = candidate['due_date'].strftime('%Y-%m-%d')
+    return proposals
+
+@router.post("/reconciliation/confirm")
+def confirm_reconciliation(payload: ReconcileConfirm):
+    """確認對帳：標記入帳已對帳並記入應收帳款的已收金額"""
+    if not payload.matches:
+        raise HTTPException(status_code=400, detail="對帳資料不得為空")
+    if len({m.bank_entry_id for m in payload.matches}) != len(payload.matches):
+        raise HTTPException(status_code=400, detail="同一筆入帳只能對應一筆應收帳款")
 
+    with get_cursor() as cur:
+        return confirm_matches(cur, payload.matches)
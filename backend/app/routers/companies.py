@@ -1,18 +1,25 @@
 """公司資料 API"""
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from typing import List, Optional
-from app.database import get_cursor
+from app.database import get_cursor, get_read_cursor
+from app.services.http_cache import check_not_modified
 from app.models.company import Company, CompanyCreate, CompanyUpdate
 
 router = APIRouter()
 
 @router.get("", response_model=List[Company])
 def get_companies(
+    request: Request,
+    response: Response,
     type: Optional[str] = Query(None, description="篩選類型: sales 或 service"),
     search: Optional[str] = Query(None, description="搜尋關鍵字")
 ):
     """取得公司列表"""
-    with get_cursor() as cur:
+    not_modified = check_not_modified(request, response, "companies")
+    if not_modified:
+        return not_modified
+
+    with get_read_cursor() as cur:
         query = """
             SELECT id, company_code, name, contact_name, mobile, phone,
                    address, email, tax_id, sales_rep, is_sales, is_service,
@@ -45,10 +52,85 @@ def get_companies(
         ) for r in rows
     ]
 
+# 應付給合作公司的款項來源：(付款對象, 合約類型, 資料表, 公司欄位, 金額欄位, 狀態欄位, 日期欄位)
+_PAYABLE_SOURCES = [
+    ('業務', '租賃', 'contracts_leasing', 'sales_company_code', 'sales_amount', 'sales_payment_status', 'start_date'),
+    ('維護', '租賃', 'contracts_leasing', 'service_company_code', 'service_amount', 'service_payment_status', 'start_date'),
+    ('業務', '買斷', 'contracts_buyout', 'sales_company_code', 'sales_amount', 'sales_payment_status', 'deal_date'),
+    ('維護', '買斷', 'contracts_buyout', 'service_company_code', 'service_amount', 'service_payment_status', 'deal_date'),
+    ('維修', None, 'service_expense', 'repair_company_code', 'total_amount', 'payment_status', 'service_date'),
+]
+
+def _payable_lines(company_code: Optional[str], from_date: Optional[str], to_date: Optional[str]):
+    """組出應付款項明細的 UNION ALL 子查詢；指定公司時各段都以公司欄位走索引（sql/012_company_payables.sql）"""
+    parts = []
+    params = []
+    for payable_type, contract_type, table, company_column, amount_column, status_column, date_column in _PAYABLE_SOURCES:
+        where_parts = [f"{amount_column} > 0", f"{company_column} IS NOT NULL"]
+        if company_code:
+            where_parts.append(f"{company_column} = %s")
+            params.append(company_code)
+        if from_date:
+            where_parts.append(f"{date_column} >= %s")
+            params.append(from_date)
+        if to_date:
+            where_parts.append(f"{date_column} <= %s")
+            params.append(to_date)
+        contract_type_sql = f"'{contract_type}'" if contract_type else "NULL"
+        parts.append(f"""
+            SELECT {company_column} AS company_code, '{payable_type}' AS payable_type,
+                   {contract_type_sql} AS contract_type, contract_code, customer_name,
+                   {date_column} AS date, {amount_column} AS amount,
+                   COALESCE({status_column} = '已付款', FALSE) AS paid, {status_column} AS payment_status
+            FROM {table}
+            WHERE {' AND '.join(where_parts)}
+        """)
+    return " UNION ALL ".join(parts), params
+
+@router.get("/payables-summary")
+def get_payables_summary(
+    request: Request,
+    response: Response,
+    from_date: Optional[str] = Query(None, description="起始日期 (YYYY-MM-DD)"),
+    to_date: Optional[str] = Query(None, description="結束日期 (YYYY-MM-DD)")
+):
+    """所有合作公司的應付款項彙總（業務、維護、維修；已付／未付）"""
+    not_modified = check_not_modified(request, response, "companies", "contracts_leasing", "contracts_buyout", "service_expense")
+    if not_modified:
+        return not_modified
+
+    lines_sql, params = _payable_lines(None, from_date, to_date)
+    with get_read_cursor() as cur:
+        cur.execute(f"""
+            SELECT p.company_code, c.name, c.is_sales, c.is_service,
+                   COALESCE(SUM(p.amount) FILTER (WHERE p.payable_type = '業務' AND NOT p.paid), 0),
+                   COALESCE(SUM(p.amount) FILTER (WHERE p.payable_type = '維護' AND NOT p.paid), 0),
+                   COALESCE(SUM(p.amount) FILTER (WHERE p.payable_type = '維修' AND NOT p.paid), 0),
+                   COALESCE(SUM(p.amount) FILTER (WHERE NOT p.paid), 0),
+                   COALESCE(SUM(p.amount) FILTER (WHERE p.paid), 0),
+                   COUNT(*) FILTER (WHERE NOT p.paid),
+                   MIN(p.date) FILTER (WHERE NOT p.paid)
+            FROM ({lines_sql}) p
+            LEFT JOIN companies c ON c.company_code = p.company_code
+            GROUP BY p.company_code, c.name, c.is_sales, c.is_service
+            ORDER BY 8 DESC, p.company_code
+        """, tuple(params))
+        rows = cur.fetchall()
+
+    return [
+        {
+            'company_code': r[0], 'name': r[1], 'is_sales': bool(r[2]), 'is_service': bool(r[3]),
+            'sales_unpaid': float(r[4]), 'service_unpaid': float(r[5]), 'repair_unpaid': float(r[6]),
+            'unpaid_total': float(r[7]), 'paid_total': float(r[8]),
+            'unpaid_count': r[9], 'oldest_unpaid_date': r[10].strftime('%Y-%m-%d') if r[10] else None
+        }
+        for r in rows
+    ]
+
 @router.get("/{company_code}", response_model=Company)
 def get_company(company_code: str):
     """取得單一公司"""
-    with get_cursor() as cur:
+    with get_read_cursor() as cur:
         cur.execute("""
             SELECT id, company_code, name, contact_name, mobile, phone,
                    address, email, tax_id, sales_rep, is_sales, is_service,
@@ -68,6 +150,71 @@ def get_company(company_code: str):
         created_at=row[12], updated_at=row[13]
     )
 
+@router.get("/{company_code}/statement")
+def get_company_statement(
+    company_code: str,
+    request: Request,
+    response: Response,
+    from_date: Optional[str] = Query(None, description="起始日期 (YYYY-MM-DD)"),
+    to_date: Optional[str] = Query(None, description="結束日期 (YYYY-MM-DD)")
+):
+    """合作公司對帳單：依月份、付款對象與付款狀況彙總的應付金額，以及未付款明細"""
+    not_modified = check_not_modified(request, response, "companies", "contracts_leasing", "contracts_buyout", "service_expense")
+    if not_modified:
+        return not_modified
+
+    lines_sql, params = _payable_lines(company_code, from_date, to_date)
+    with get_read_cursor() as cur:
+        cur.execute("""
+            SELECT company_code, name, tax_id, is_sales, is_service
+            FROM companies
+            WHERE company_code = %s
+        """, (company_code,))
+        company = cur.fetchone()
+        if not company:
+            raise HTTPException(status_code=404, detail="公司不存在")
+
+        cur.execute(f"""
+            SELECT to_char(date_trunc('month', date), 'YYYY-MM') AS month, payable_type,
+                   COALESCE(payment_status, '未付款'), COUNT(*), SUM(amount)
+            FROM ({lines_sql}) p
+            GROUP BY 1, 2, 3
+            ORDER BY 1, 2, 3
+        """, tuple(params))
+        months = cur.fetchall()
+
+        cur.execute(f"""
+            SELECT payable_type, contract_type, contract_code, customer_name, date, amount, payment_status
+            FROM ({lines_sql}) p
+            WHERE NOT paid
+            ORDER BY date, contract_code
+        """, tuple(params))
+        unpaid = cur.fetchall()
+
+    paid_total = sum(float(r[4]) for r in months if r[2] == '已付款')
+    unpaid_total = sum(float(r[4]) for r in months if r[2] != '已付款')
+    return {
+        'company': {
+            'company_code': company[0], 'name': company[1], 'tax_id': company[2],
+            'is_sales': bool(company[3]), 'is_service': bool(company[4])
+        },
+        'from_date': from_date,
+        'to_date': to_date,
+        'paid_total': paid_total,
+        'unpaid_total': unpaid_total,
+        'by_month': [
+            {'month': r[0], 'payable_type': r[1], 'payment_status': r[2], 'count': r[3], 'amount': float(r[4])}
+            for r in months
+        ],
+        'unpaid_items': [
+            {
+                'payable_type': r[0], 'contract_type': r[1], 'contract_code': r[2], 'customer_name': r[3],
+                'date': r[4].strftime('%Y-%m-%d') if r[4] else None, 'amount': float(r[5]), 'payment_status': r[6]
+            }
+            for r in unpaid
+        ],
+    }
+
 @router.post("", response_model=Company, status_code=201)
 def create_company(company: CompanyCreate):
     """新增公司"""
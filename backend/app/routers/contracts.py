@@ -1,38 +1,54 @@
 """合約管理 API - 統一處理租賃/買斷，消除特殊情況"""
 from datetime import date
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from typing import List, Optional
-from app.database import get_connection, get_cursor
+from psycopg import errors
+from app.database import get_connection, get_read_cursor, release_connection
 from app.models.contract import (
     ContractLeasing, ContractBuyout,
     ContractLeasingCreate, ContractBuyoutCreate,
-    ContractResume
+    ContractResume, ContractBulkAction
 )
-from app.services.contract_service import generate_leasing_ar, generate_buyout_ar
+from app.services.contract_service import (
+    insert_leasing_ar, insert_buyout_ar,
+    generate_leasing_ar_batch, generate_buyout_ar_batch
+)
+from app.services.http_cache import check_not_modified, parse_if_match, set_version_etag
 
 router = APIRouter()
 
-_LEASING_SELECT = """
-    SELECT id, contract_code, customer_code, customer_name, start_date,
-           model, quantity, monthly_rent, payment_cycle_months, overprint,
-           contract_months, sales_company_code, sales_amount,
-           service_company_code, service_amount,
-           sales_payment_status, service_payment_status, status, needs_invoice,
-           created_at, updated_at
+_LEASING_COLUMNS = """
+    id, contract_code, customer_code, customer_name, start_date,
+    model, quantity, monthly_rent, payment_cycle_months, overprint,
+    contract_months, sales_company_code, sales_amount,
+    service_company_code, service_amount,
+    sales_payment_status, service_payment_status, status, needs_invoice,
+    created_at, updated_at, version
+"""
+
+_BUYOUT_COLUMNS = """
+    id, contract_code, customer_code, customer_name, deal_date,
+    deal_amount, sales_company_code, sales_amount,
+    service_company_code, service_amount,
+    sales_payment_status, service_payment_status, status, needs_invoice,
+    created_at, updated_at, version
+"""
+
+_LEASING_SELECT = f"""
+    SELECT {_LEASING_COLUMNS}
     FROM contracts_leasing
     WHERE contract_code = %s
 """
 
-_BUYOUT_SELECT = """
-    SELECT id, contract_code, customer_code, customer_name, deal_date,
-           deal_amount, sales_company_code, sales_amount,
-           service_company_code, service_amount,
-           sales_payment_status, service_payment_status, status, needs_invoice,
-           created_at, updated_at
+_BUYOUT_SELECT = f"""
+    SELECT {_BUYOUT_COLUMNS}
     FROM contracts_buyout
     WHERE contract_code = %s
 """
 
+# 寫入時直接以子查詢帶入客戶名稱（客戶不存在時為空字串），省去一次查詢往返
+_CUSTOMER_NAME = "COALESCE((SELECT name FROM customers WHERE customer_code = %s), '')"
+
 def _leasing_row_to_contract(row) -> ContractLeasing:
     return ContractLeasing(
         id=row[0], contract_code=row[1], customer_code=row[2], customer_name=row[3],
@@ -42,7 +58,8 @@ def _leasing_row_to_contract(row) -> ContractLeasing:
         sales_company_code=row[11], sales_amount=float(row[12]) if row[12] else None,
         service_company_code=row[13], service_amount=float(row[14]) if row[14] else None,
         sales_payment_status=row[15], service_payment_status=row[16],
-        status=row[17], needs_invoice=bool(row[18]), created_at=row[19], updated_at=row[20]
+        status=row[17], needs_invoice=bool(row[18]), created_at=row[19], updated_at=row[20],
+        version=row[21]
     )
 
 
@@ -59,7 +76,8 @@ def _buyout_row_to_contract(row) -> ContractBuyout:
         sales_company_code=row[6], sales_amount=float(row[7]) if row[7] else None,
         service_company_code=row[8], service_amount=float(row[9]) if row[9] else None,
         sales_payment_status=row[10], service_payment_status=row[11],
-        status=row[12], needs_invoice=bool(row[13]), created_at=row[14], updated_at=row[15]
+        status=row[12], needs_invoice=bool(row[13]), created_at=row[14], updated_at=row[15],
+        version=row[16]
     )
 
 
@@ -69,17 +87,23 @@ def _fetch_buyout(cur, contract_code: str, for_update: bool = False):
     return cur.fetchone()
 
 
-def get_customer_name(customer_code: str, conn) -> str:
-    """取得客戶名稱"""
-    with conn.cursor() as cur:
-        cur.execute("SELECT name FROM customers WHERE customer_code = %s", (customer_code,))
-        row = cur.fetchone()
-        return row[0] if row else ""
+_CONFLICT_DETAIL = "合約已被其他人修改，請重新整理後再試"
+
+def _raise_write_conflict(row):
+    """條件式 UPDATE 沒有更新到資料列：合約不存在回 404，否則為版本不符回 412"""
+    if not row:
+        raise HTTPException(status_code=404, detail="合約不存在")
+    raise HTTPException(status_code=412, detail=_CONFLICT_DETAIL)
+
 
 @router.get("/leasing", response_model=List[ContractLeasing])
-def get_leasing_contracts(search: Optional[str] = Query(None)):
+def get_leasing_contracts(request: Request, response: Response, search: Optional[str] = Query(None)):
     """取得租賃合約列表"""
-    with get_cursor() as cur:
+    not_modified = check_not_modified(request, response, "contracts_leasing")
+    if not_modified:
+        return not_modified
+
+    with get_read_cursor() as cur:
         if search:
             cur.execute("""
                 SELECT id, contract_code, customer_code, customer_name, start_date,
@@ -87,7 +111,7 @@ def get_leasing_contracts(search: Optional[str] = Query(None)):
                        contract_months, sales_company_code, sales_amount,
                        service_company_code, service_amount,
                        sales_payment_status, service_payment_status, status, needs_invoice,
-                       created_at, updated_at
+                       created_at, updated_at, version
                 FROM contracts_leasing
                 WHERE contract_code ILIKE %s OR customer_name ILIKE %s
                 ORDER BY contract_code
@@ -99,7 +123,7 @@ def get_leasing_contracts(search: Optional[str] = Query(None)):
                        contract_months, sales_company_code, sales_amount,
                        service_company_code, service_amount,
                        sales_payment_status, service_payment_status, status, needs_invoice,
-                       created_at, updated_at
+                       created_at, updated_at, version
                 FROM contracts_leasing
                 ORDER BY contract_code
             """)
@@ -108,16 +132,20 @@ def get_leasing_contracts(search: Optional[str] = Query(None)):
     return [_leasing_row_to_contract(r) for r in rows]
 
 @router.get("/buyout", response_model=List[ContractBuyout])
-def get_buyout_contracts(search: Optional[str] = Query(None)):
+def get_buyout_contracts(request: Request, response: Response, search: Optional[str] = Query(None)):
     """取得買斷合約列表"""
-    with get_cursor() as cur:
+    not_modified = check_not_modified(request, response, "contracts_buyout")
+    if not_modified:
+        return not_modified
+
+    with get_read_cursor() as cur:
         if search:
             cur.execute("""
                 SELECT id, contract_code, customer_code, customer_name, deal_date,
                        deal_amount, sales_company_code, sales_amount,
                        service_company_code, service_amount,
                        sales_payment_status, service_payment_status, status, needs_invoice,
-                       created_at, updated_at
+                       created_at, updated_at, version
                 FROM contracts_buyout
                 WHERE contract_code ILIKE %s OR customer_name ILIKE %s
                 ORDER BY contract_code
@@ -128,7 +156,7 @@ def get_buyout_contracts(search: Optional[str] = Query(None)):
                        deal_amount, sales_company_code, sales_amount,
                        service_company_code, service_amount,
                        sales_payment_status, service_payment_status, status, needs_invoice,
-                       created_at, updated_at
+                       created_at, updated_at, version
                 FROM contracts_buyout
                 ORDER BY contract_code
             """)
@@ -137,44 +165,47 @@ def get_buyout_contracts(search: Optional[str] = Query(None)):
     return [_buyout_row_to_contract(r) for r in rows]
 
 @router.post("/leasing", response_model=ContractLeasing, status_code=201)
-def create_leasing_contract(contract: ContractLeasingCreate):
-    """新增租賃合約（自動生成應收帳款）"""
+def create_leasing_contract(contract: ContractLeasingCreate, response: Response):
+    """新增租賃合約（自動生成應收帳款）
+
+    合約 INSERT ... RETURNING、帳款寫入與 COMMIT 以 pipeline 一次送出（一次往返）
+    """
+    monthly_rent = contract.monthly_rent
+    if contract.needs_invoice and monthly_rent:
+        monthly_rent = monthly_rent * 1.05
+
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            customer_name = get_customer_name(contract.customer_code, conn)
-            
-            monthly_rent = contract.monthly_rent
-            if contract.needs_invoice and monthly_rent:
-                monthly_rent = monthly_rent * 1.05
-            
-            cur.execute("""
-                INSERT INTO contracts_leasing
-                (contract_code, customer_code, customer_name, start_date, model,
-                 quantity, monthly_rent, payment_cycle_months, overprint, contract_months,
-                 sales_company_code, sales_amount, service_company_code, service_amount, needs_invoice)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                contract.contract_code, contract.customer_code, customer_name,
-                contract.start_date, contract.model, contract.quantity,
-                monthly_rent, contract.payment_cycle_months,
-                contract.overprint, contract.contract_months,
-                contract.sales_company_code, contract.sales_amount,
-                contract.service_company_code, contract.service_amount,
-                contract.needs_invoice
-            ))
-            
-            if monthly_rent and contract.contract_months:
-                generate_leasing_ar(
-                    contract.contract_code, contract.customer_code, customer_name,
-                    contract.start_date, monthly_rent,
-                    contract.payment_cycle_months, contract.contract_months, conn
-                )
-            
-            conn.commit()
-            row = _fetch_leasing(cur, contract.contract_code)
-            if not row:
-                raise HTTPException(status_code=500, detail="合約讀取失敗")
+            with conn.pipeline():
+                inserted = conn.execute(f"""
+                    INSERT INTO contracts_leasing
+                    (contract_code, customer_code, customer_name, start_date, model,
+                     quantity, monthly_rent, payment_cycle_months, overprint, contract_months,
+                     sales_company_code, sales_amount, service_company_code, service_amount, needs_invoice)
+                    VALUES (%s, %s, {_CUSTOMER_NAME}, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING {_LEASING_COLUMNS}
+                """, (
+                    contract.contract_code, contract.customer_code, contract.customer_code,
+                    contract.start_date, contract.model, contract.quantity,
+                    monthly_rent, contract.payment_cycle_months,
+                    contract.overprint, contract.contract_months,
+                    contract.sales_company_code, contract.sales_amount,
+                    contract.service_company_code, contract.service_amount,
+                    contract.needs_invoice
+                ))
+
+                if monthly_rent and contract.contract_months:
+                    cur.execute("DELETE FROM ar_leasing WHERE contract_code = %s", (contract.contract_code,))
+                    insert_leasing_ar(
+                        cur, contract.contract_code, contract.start_date, monthly_rent,
+                        contract.payment_cycle_months, contract.contract_months
+                    )
+
+                conn.commit()
+
+            row = inserted.fetchone()
+            set_version_etag(response, row[21])
             return _leasing_row_to_contract(row)
     except Exception as e:
         conn.rollback()
@@ -182,43 +213,44 @@ def create_leasing_contract(contract: ContractLeasingCreate):
             raise HTTPException(status_code=400, detail="合約編號已存在")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        conn.close()
+        release_connection(conn)
 
 @router.post("/buyout", response_model=ContractBuyout, status_code=201)
-def create_buyout_contract(contract: ContractBuyoutCreate):
-    """新增買斷合約（自動生成應收帳款）"""
+def create_buyout_contract(contract: ContractBuyoutCreate, response: Response):
+    """新增買斷合約（自動生成應收帳款）
+
+    合約 INSERT ... RETURNING、帳款寫入與 COMMIT 以 pipeline 一次送出（一次往返）
+    """
+    deal_amount = contract.deal_amount
+    if contract.needs_invoice and deal_amount:
+        deal_amount = deal_amount * 1.05
+
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            customer_name = get_customer_name(contract.customer_code, conn)
-            
-            deal_amount = contract.deal_amount
-            if contract.needs_invoice and deal_amount:
-                deal_amount = deal_amount * 1.05
-            
-            cur.execute("""
-                INSERT INTO contracts_buyout
-                (contract_code, customer_code, customer_name, deal_date, deal_amount,
-                 sales_company_code, sales_amount, service_company_code, service_amount, needs_invoice)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                contract.contract_code, contract.customer_code, customer_name,
-                contract.deal_date, deal_amount,
-                contract.sales_company_code, contract.sales_amount,
-                contract.service_company_code, contract.service_amount,
-                contract.needs_invoice
-            ))
-            
-            if deal_amount:
-                generate_buyout_ar(
-                    contract.contract_code, contract.customer_code, customer_name,
-                    contract.deal_date, deal_amount, conn
-                )
-            
-            conn.commit()
-            row = _fetch_buyout(cur, contract.contract_code)
-            if not row:
-                raise HTTPException(status_code=500, detail="合約讀取失敗")
+            with conn.pipeline():
+                inserted = conn.execute(f"""
+                    INSERT INTO contracts_buyout
+                    (contract_code, customer_code, customer_name, deal_date, deal_amount,
+                     sales_company_code, sales_amount, service_company_code, service_amount, needs_invoice)
+                    VALUES (%s, %s, {_CUSTOMER_NAME}, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING {_BUYOUT_COLUMNS}
+                """, (
+                    contract.contract_code, contract.customer_code, contract.customer_code,
+                    contract.deal_date, deal_amount,
+                    contract.sales_company_code, contract.sales_amount,
+                    contract.service_company_code, contract.service_amount,
+                    contract.needs_invoice
+                ))
+
+                if deal_amount:
+                    cur.execute("DELETE FROM ar_buyout WHERE contract_code = %s", (contract.contract_code,))
+                    insert_buyout_ar(cur, contract.contract_code, contract.deal_date, deal_amount)
+
+                conn.commit()
+
+            row = inserted.fetchone()
+            set_version_etag(response, row[16])
             return _buyout_row_to_contract(row)
     except Exception as e:
         conn.rollback()
@@ -226,319 +258,468 @@ def create_buyout_contract(contract: ContractBuyoutCreate):
             raise HTTPException(status_code=400, detail="合約編號已存在")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        conn.close()
+        release_connection(conn)
 
 @router.put("/leasing/{contract_code}", response_model=ContractLeasing)
-def update_leasing_contract(contract_code: str, contract: ContractLeasingCreate):
-    """更新租賃合約（重新生成應收帳款）"""
+def update_leasing_contract(contract_code: str, contract: ContractLeasingCreate, request: Request, response: Response):
+    """更新租賃合約（重新生成應收帳款；帶 If-Match 時僅在版本相符時更新，否則回 412）
+
+    合約 UPDATE ... RETURNING 與帳款重建以 pipeline 送出，確認有更新到合約後再 COMMIT（兩次往返）
+    """
+    expected_version = parse_if_match(request)
+    new_contract_code = contract.contract_code
+    code_changed = new_contract_code != contract_code
+
+    monthly_rent = contract.monthly_rent
+    if contract.needs_invoice and monthly_rent:
+        monthly_rent = monthly_rent * 1.05
+
+    should_generate = bool(monthly_rent and contract.contract_months)
+
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            customer_name = get_customer_name(contract.customer_code, conn)
-            new_contract_code = contract.contract_code
-            code_changed = new_contract_code != contract_code
-
-            if code_changed:
-                cur.execute(
-                    "SELECT 1 FROM contracts_leasing WHERE contract_code = %s",
-                    (new_contract_code,)
-                )
-                if cur.fetchone():
-                    raise HTTPException(status_code=400, detail="合約編號已存在")
-            
-            monthly_rent = contract.monthly_rent
-            if contract.needs_invoice and monthly_rent:
-                monthly_rent = monthly_rent * 1.05
-            
-            should_generate = bool(monthly_rent and contract.contract_months)
-
-            cur.execute("""
-                UPDATE contracts_leasing
-                SET contract_code = %s,
-                    customer_code = %s, customer_name = %s, start_date = %s,
-                    model = %s, quantity = %s, monthly_rent = %s,
-                    payment_cycle_months = %s, overprint = %s, contract_months = %s,
-                    sales_company_code = %s, sales_amount = %s,
-                    service_company_code = %s, service_amount = %s,
-                    needs_invoice = %s,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE contract_code = %s
-                RETURNING id, contract_code, sales_payment_status, service_payment_status,
-                         status, created_at, updated_at
-            """, (
-                new_contract_code,
-                contract.customer_code, customer_name, contract.start_date,
-                contract.model, contract.quantity, monthly_rent,
-                contract.payment_cycle_months, contract.overprint, contract.contract_months,
-                contract.sales_company_code, contract.sales_amount,
-                contract.service_company_code, contract.service_amount,
-                contract.needs_invoice,
-                contract_code
-            ))
-            row = cur.fetchone()
-
+            with conn.pipeline():
+                # 版本不符或新合約編號已被使用時不更新任何資料列，後續帳款異動不會提交
+                updated = conn.execute(f"""
+                    UPDATE contracts_leasing
+                    SET contract_code = %s,
+                        customer_code = %s, customer_name = {_CUSTOMER_NAME}, start_date = %s,
+                        model = %s, quantity = %s, monthly_rent = %s,
+                        payment_cycle_months = %s, overprint = %s, contract_months = %s,
+                        sales_company_code = %s, sales_amount = %s,
+                        service_company_code = %s, service_amount = %s,
+                        needs_invoice = %s,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE contract_code = %s AND (%s::int IS NULL OR version = %s)
+                      AND (%s = %s OR NOT EXISTS (
+                          SELECT 1 FROM contracts_leasing WHERE contract_code = %s
+                      ))
+                    RETURNING {_LEASING_COLUMNS}
+                """, (
+                    new_contract_code,
+                    contract.customer_code, contract.customer_code, contract.start_date,
+                    contract.model, contract.quantity, monthly_rent,
+                    contract.payment_cycle_months, contract.overprint, contract.contract_months,
+                    contract.sales_company_code, contract.sales_amount,
+                    contract.service_company_code, contract.service_amount,
+                    contract.needs_invoice,
+                    contract_code, expected_version, expected_version,
+                    new_contract_code, contract_code, new_contract_code
+                ))
+
+                if should_generate:
+                    cur.execute("DELETE FROM ar_leasing WHERE contract_code IN (%s, %s)", (contract_code, new_contract_code))
+                    insert_leasing_ar(
+                        cur, new_contract_code, contract.start_date, monthly_rent,
+                        contract.payment_cycle_months, contract.contract_months
+                    )
+                elif code_changed:
+                    cur.execute(
+                        "UPDATE ar_leasing SET contract_code = %s WHERE contract_code = %s",
+                        (new_contract_code, contract_code)
+                    )
+
+            row = updated.fetchone()
             if not row:
-                raise HTTPException(status_code=404, detail="合約不存在")
+                if code_changed and _fetch_leasing(cur, new_contract_code):
+                    raise HTTPException(status_code=400, detail="合約編號已存在")
+                _raise_write_conflict(_fetch_leasing(cur, contract_code))
 
-            if should_generate:
-                cur.execute("DELETE FROM ar_leasing WHERE contract_code IN (%s, %s)", (contract_code, new_contract_code))
-                generate_leasing_ar(
-                    new_contract_code, contract.customer_code, customer_name,
-                    contract.start_date, monthly_rent,
-                    contract.payment_cycle_months, contract.contract_months, conn
-                )
-            elif code_changed:
-                cur.execute(
-                    "UPDATE ar_leasing SET contract_code = %s WHERE contract_code = %s",
-                    (new_contract_code, contract_code)
-                )
-            
             conn.commit()
-            refreshed = _fetch_leasing(cur, new_contract_code)
-            if not refreshed:
-                raise HTTPException(status_code=500, detail="合約讀取失敗")
-            return _leasing_row_to_contract(refreshed)
+            set_version_etag(response, row[21])
+            return _leasing_row_to_contract(row)
     except HTTPException:
         raise
+    except errors.UniqueViolation:
+        conn.rollback()
+        raise HTTPException(status_code=400, detail="合約編號已存在")
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        conn.close()
+        release_connection(conn)
 
 @router.put("/buyout/{contract_code}", response_model=ContractBuyout)
-def update_buyout_contract(contract_code: str, contract: ContractBuyoutCreate):
-    """更新買斷合約（重新生成應收帳款）"""
+def update_buyout_contract(contract_code: str, contract: ContractBuyoutCreate, request: Request, response: Response):
+    """更新買斷合約（重新生成應收帳款；帶 If-Match 時僅在版本相符時更新，否則回 412）
+
+    合約 UPDATE ... RETURNING 與帳款重建以 pipeline 送出，確認有更新到合約後再 COMMIT（兩次往返）
+    """
+    expected_version = parse_if_match(request)
+    new_contract_code = contract.contract_code
+    code_changed = new_contract_code != contract_code
+
+    deal_amount = contract.deal_amount
+    if contract.needs_invoice and deal_amount:
+        deal_amount = deal_amount * 1.05
+
+    should_generate = bool(deal_amount)
+
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            customer_name = get_customer_name(contract.customer_code, conn)
-            new_contract_code = contract.contract_code
-            code_changed = new_contract_code != contract_code
-
-            if code_changed:
-                cur.execute(
-                    "SELECT 1 FROM contracts_buyout WHERE contract_code = %s",
-                    (new_contract_code,)
-                )
-                if cur.fetchone():
-                    raise HTTPException(status_code=400, detail="合約編號已存在")
-            
-            deal_amount = contract.deal_amount
-            if contract.needs_invoice and deal_amount:
-                deal_amount = deal_amount * 1.05
-            
-            should_generate = bool(deal_amount)
-
-            cur.execute("""
-                UPDATE contracts_buyout
-                SET contract_code = %s,
-                    customer_code = %s, customer_name = %s, deal_date = %s,
-                    deal_amount = %s, sales_company_code = %s, sales_amount = %s,
-                    service_company_code = %s, service_amount = %s,
-                    needs_invoice = %s,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE contract_code = %s
-                RETURNING id, contract_code, sales_payment_status, service_payment_status,
-                         status, created_at, updated_at
-            """, (
-                new_contract_code,
-                contract.customer_code, customer_name, contract.deal_date,
-                deal_amount, contract.sales_company_code, contract.sales_amount,
-                contract.service_company_code, contract.service_amount,
-                contract.needs_invoice,
-                contract_code
-            ))
-            row = cur.fetchone()
-
+            with conn.pipeline():
+                updated = conn.execute(f"""
+                    UPDATE contracts_buyout
+                    SET contract_code = %s,
+                        customer_code = %s, customer_name = {_CUSTOMER_NAME}, deal_date = %s,
+                        deal_amount = %s, sales_company_code = %s, sales_amount = %s,
+                        service_company_code = %s, service_amount = %s,
+                        needs_invoice = %s,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE contract_code = %s AND (%s::int IS NULL OR version = %s)
+                      AND (%s = %s OR NOT EXISTS (
+                          SELECT 1 FROM contracts_buyout WHERE contract_code = %s
+                      ))
+                    RETURNING {_BUYOUT_COLUMNS}
+                """, (
+                    new_contract_code,
+                    contract.customer_code, contract.customer_code, contract.deal_date,
+                    deal_amount, contract.sales_company_code, contract.sales_amount,
+                    contract.service_company_code, contract.service_amount,
+                    contract.needs_invoice,
+                    contract_code, expected_version, expected_version,
+                    new_contract_code, contract_code, new_contract_code
+                ))
+
+                if should_generate:
+                    cur.execute("DELETE FROM ar_buyout WHERE contract_code IN (%s, %s)", (contract_code, new_contract_code))
+                    insert_buyout_ar(cur, new_contract_code, contract.deal_date, deal_amount)
+                elif code_changed:
+                    cur.execute(
+                        "UPDATE ar_buyout SET contract_code = %s WHERE contract_code = %s",
+                        (new_contract_code, contract_code)
+                    )
+
+            row = updated.fetchone()
             if not row:
-                raise HTTPException(status_code=404, detail="合約不存在")
+                if code_changed and _fetch_buyout(cur, new_contract_code):
+                    raise HTTPException(status_code=400, detail="合約編號已存在")
+                _raise_write_conflict(_fetch_buyout(cur, contract_code))
 
-            if should_generate:
-                cur.execute("DELETE FROM ar_buyout WHERE contract_code IN (%s, %s)", (contract_code, new_contract_code))
-                generate_buyout_ar(
-                    new_contract_code, contract.customer_code, customer_name,
-                    contract.deal_date, deal_amount, conn
-                )
-            elif code_changed:
-                cur.execute(
-                    "UPDATE ar_buyout SET contract_code = %s WHERE contract_code = %s",
-                    (new_contract_code, contract_code)
-                )
-            
             conn.commit()
-            refreshed = _fetch_buyout(cur, new_contract_code)
-            if not refreshed:
-                raise HTTPException(status_code=500, detail="合約讀取失敗")
-            return _buyout_row_to_contract(refreshed)
+            set_version_etag(response, row[16])
+            return _buyout_row_to_contract(row)
     except HTTPException:
         raise
+    except errors.UniqueViolation:
+        conn.rollback()
+        raise HTTPException(status_code=400, detail="合約編號已存在")
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        conn.close()
+        release_connection(conn)
 
 
 @router.post("/leasing/{contract_code}/pause", response_model=ContractLeasing)
-def pause_leasing_contract(contract_code: str):
-    """將租賃合約標記為暫停並刪除既有應收帳款"""
+def pause_leasing_contract(contract_code: str, request: Request, response: Response):
+    """將租賃合約標記為暫停並刪除既有應收帳款（帶 If-Match 時檢查版本）"""
+    expected_version = parse_if_match(request)
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            row = _fetch_leasing(cur, contract_code, for_update=True)
+            # 條件式 UPDATE 取代先 SELECT ... FOR UPDATE：狀態與版本檢查和寫入在同一個語句完成
+            with conn.pipeline():
+                updated = conn.execute(f"""
+                    UPDATE contracts_leasing
+                    SET status = 'paused', updated_at = CURRENT_TIMESTAMP
+                    WHERE contract_code = %s AND status IS DISTINCT FROM 'paused'
+                      AND (%s::int IS NULL OR version = %s)
+                    RETURNING {_LEASING_COLUMNS}
+                """, (contract_code, expected_version, expected_version))
+                cur.execute("DELETE FROM ar_leasing WHERE contract_code = %s", (contract_code,))
+
+            row = updated.fetchone()
             if not row:
-                raise HTTPException(status_code=404, detail="合約不存在")
-            if row[17] == "paused":
-                raise HTTPException(status_code=400, detail="合約已為暫停狀態")
-
-            cur.execute("""
-                UPDATE contracts_leasing
-                SET status = 'paused', updated_at = CURRENT_TIMESTAMP
-                WHERE contract_code = %s
-            """, (contract_code,))
-            cur.execute("DELETE FROM ar_leasing WHERE contract_code = %s", (contract_code,))
+                current = _fetch_leasing(cur, contract_code)
+                if current and current[17] == "paused":
+                    raise HTTPException(status_code=400, detail="合約已為暫停狀態")
+                _raise_write_conflict(current)
 
             conn.commit()
-            refreshed = _fetch_leasing(cur, contract_code)
-            if not refreshed:
-                raise HTTPException(status_code=500, detail="合約讀取失敗")
-            return _leasing_row_to_contract(refreshed)
+            set_version_etag(response, row[21])
+            return _leasing_row_to_contract(row)
     except HTTPException:
         raise
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        conn.close()
+        release_connection(conn)
 
 
 @router.post("/leasing/{contract_code}/resume", response_model=ContractLeasing)
-def resume_leasing_contract(contract_code: str, payload: ContractResume):
-    """恢復租賃合約並重新產生應收帳款"""
+def resume_leasing_contract(contract_code: str, payload: ContractResume, request: Request, response: Response):
+    """恢復租賃合約並重新產生應收帳款（帶 If-Match 時檢查版本）"""
     resume_date = payload.resume_date or date.today()
+    expected_version = parse_if_match(request)
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            row = _fetch_leasing(cur, contract_code, for_update=True)
-            if not row:
+            # 不鎖定讀取合約，再以讀到的版本號做條件式 UPDATE；期間若被修改則回 412
+            current = _fetch_leasing(cur, contract_code)
+            if not current:
                 raise HTTPException(status_code=404, detail="合約不存在")
-            if row[17] != "paused":
+            if current[17] != "paused":
                 raise HTTPException(status_code=400, detail="合約目前不是暫停狀態")
-
-            monthly_rent = float(row[7]) if row[7] else None
-            contract_months = row[10]
-
-            cur.execute("""
-                UPDATE contracts_leasing
-                SET status = 'active', updated_at = CURRENT_TIMESTAMP
-                WHERE contract_code = %s
-            """, (contract_code,))
-            cur.execute("DELETE FROM ar_leasing WHERE contract_code = %s", (contract_code,))
-
-            if monthly_rent and contract_months:
-                generate_leasing_ar(
-                    contract_code,
-                    row[2],
-                    row[3],
-                    resume_date,
-                    monthly_rent,
-                    row[8],
-                    contract_months,
-                    conn
-                )
+            if expected_version is not None and current[21] != expected_version:
+                raise HTTPException(status_code=412, detail=_CONFLICT_DETAIL)
+
+            monthly_rent = float(current[7]) if current[7] else None
+            contract_months = current[10]
+
+            with conn.pipeline():
+                updated = conn.execute(f"""
+                    UPDATE contracts_leasing
+                    SET status = 'active', updated_at = CURRENT_TIMESTAMP
+                    WHERE contract_code = %s AND version = %s
+                    RETURNING {_LEASING_COLUMNS}
+                """, (contract_code, current[21]))
+                cur.execute("DELETE FROM ar_leasing WHERE contract_code = %s", (contract_code,))
+                if monthly_rent and contract_months:
+                    insert_leasing_ar(cur, contract_code, resume_date, monthly_rent, current[8], contract_months)
+
+            row = updated.fetchone()
+            if not row:
+                raise HTTPException(status_code=412, detail=_CONFLICT_DETAIL)
 
             conn.commit()
-            refreshed = _fetch_leasing(cur, contract_code)
-            if not refreshed:
-                raise HTTPException(status_code=500, detail="合約讀取失敗")
-            return _leasing_row_to_contract(refreshed)
+            set_version_etag(response, row[21])
+            return _leasing_row_to_contract(row)
     except HTTPException:
         raise
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        conn.close()
+        release_connection(conn)
 
 
 @router.post("/buyout/{contract_code}/pause", response_model=ContractBuyout)
-def pause_buyout_contract(contract_code: str):
-    """將買斷合約標記為暫停並刪除既有應收帳款"""
+def pause_buyout_contract(contract_code: str, request: Request, response: Response):
+    """將買斷合約標記為暫停並刪除既有應收帳款（帶 If-Match 時檢查版本）"""
+    expected_version = parse_if_match(request)
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            row = _fetch_buyout(cur, contract_code, for_update=True)
+            with conn.pipeline():
+                updated = conn.execute(f"""
+                    UPDATE contracts_buyout
+                    SET status = 'paused', updated_at = CURRENT_TIMESTAMP
+                    WHERE contract_code = %s AND status IS DISTINCT FROM 'paused'
+                      AND (%s::int IS NULL OR version = %s)
+                    RETURNING {_BUYOUT_COLUMNS}
+                """, (contract_code, expected_version, expected_version))
+                cur.execute("DELETE FROM ar_buyout WHERE contract_code = %s", (contract_code,))
+
+            row = updated.fetchone()
             if not row:
-                raise HTTPException(status_code=404, detail="合約不存在")
-            if row[12] == "paused":
-                raise HTTPException(status_code=400, detail="合約已為暫停狀態")
-
-            cur.execute("""
-                UPDATE contracts_buyout
-                SET status = 'paused', updated_at = CURRENT_TIMESTAMP
-                WHERE contract_code = %s
-            """, (contract_code,))
-            cur.execute("DELETE FROM ar_buyout WHERE contract_code = %s", (contract_code,))
+                current = _fetch_buyout(cur, contract_code)
+                if current and current[12] == "paused":
+                    raise HTTPException(status_code=400, detail="合約已為暫停狀態")
+                _raise_write_conflict(current)
 
             conn.commit()
-            refreshed = _fetch_buyout(cur, contract_code)
-            if not refreshed:
-                raise HTTPException(status_code=500, detail="合約讀取失敗")
-            return _buyout_row_to_contract(refreshed)
+            set_version_etag(response, row[16])
+            return _buyout_row_to_contract(row)
     except HTTPException:
         raise
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        conn.close()
+        release_connection(conn)
 
 
 @router.post("/buyout/{contract_code}/resume", response_model=ContractBuyout)
-def resume_buyout_contract(contract_code: str, payload: ContractResume):
-    """恢復買斷合約並重新產生應收帳款"""
+def resume_buyout_contract(contract_code: str, payload: ContractResume, request: Request, response: Response):
+    """恢復買斷合約並重新產生應收帳款（帶 If-Match 時檢查版本）"""
     resume_date = payload.resume_date or date.today()
+    expected_version = parse_if_match(request)
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            row = _fetch_buyout(cur, contract_code, for_update=True)
-            if not row:
+            current = _fetch_buyout(cur, contract_code)
+            if not current:
                 raise HTTPException(status_code=404, detail="合約不存在")
-            if row[12] != "paused":
+            if current[12] != "paused":
                 raise HTTPException(status_code=400, detail="合約目前不是暫停狀態")
+            if expected_version is not None and current[16] != expected_version:
+                raise HTTPException(status_code=412, detail=_CONFLICT_DETAIL)
+
+            deal_amount = float(current[5]) if current[5] else None
+
+            with conn.pipeline():
+                updated = conn.execute(f"""
+                    UPDATE contracts_buyout
+                    SET status = 'active', updated_at = CURRENT_TIMESTAMP
+                    WHERE contract_code = %s AND version = %s
+                    RETURNING {_BUYOUT_COLUMNS}
+                """, (contract_code, current[16]))
+                cur.execute("DELETE FROM ar_buyout WHERE contract_code = %s", (contract_code,))
+                if deal_amount:
+                    insert_buyout_ar(cur, contract_code, resume_date, deal_amount)
+
+            row = updated.fetchone()
+            if not row:
+                raise HTTPException(status_code=412, detail=_CONFLICT_DETAIL)
 
-            deal_amount = float(row[5]) if row[5] else None
+            conn.commit()
+            set_version_etag(response, row[16])
+            return _buyout_row_to_contract(row)
+    except HTTPException:
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        release_connection(conn)
+
+def _bulk_filter(payload: ContractBulkAction):
+    """組出批次操作的篩選條件（至少需指定客戶代碼或合約編號）"""
+    where_parts = []
+    params = []
+    if payload.customer_code:
+        where_parts.append("customer_code = %s")
+        params.append(payload.customer_code)
+    if payload.contract_codes:
+        where_parts.append("contract_code = ANY(%s)")
+        params.append(payload.contract_codes)
+    if not where_parts:
+        raise HTTPException(status_code=400, detail="請指定客戶代碼或合約編號")
+    return " AND ".join(where_parts), params
+
+
+def _bulk_pause(table: str, ar_table: str, payload: ContractBulkAction):
+    """批次暫停：依合約編號順序鎖定，避免與其他批次操作互相死結"""
+    where_clause, params = _bulk_filter(payload)
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT contract_code FROM {table}
+                WHERE {where_clause} AND status IS DISTINCT FROM 'paused'
+                ORDER BY contract_code
+                FOR UPDATE
+            """, tuple(params))
+            codes = [r[0] for r in cur.fetchall()]
+
+            if codes:
+                cur.execute(f"""
+                    UPDATE {table}
+                    SET status = 'paused', updated_at = CURRENT_TIMESTAMP
+                    WHERE contract_code = ANY(%s)
+                """, (codes,))
+                cur.execute(f"DELETE FROM {ar_table} WHERE contract_code = ANY(%s)", (codes,))
 
-            cur.execute("""
-                UPDATE contracts_buyout
-                SET status = 'active', updated_at = CURRENT_TIMESTAMP
-                WHERE contract_code = %s
-            """, (contract_code,))
-            cur.execute("DELETE FROM ar_buyout WHERE contract_code = %s", (contract_code,))
+            conn.commit()
+            return {"contract_codes": codes, "count": len(codes)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        release_connection(conn)
+
+
+@router.post("/leasing/bulk-pause")
+def bulk_pause_leasing_contracts(payload: ContractBulkAction):
+    """批次暫停租賃合約（依客戶代碼或合約編號）並刪除其應收帳款"""
+    return _bulk_pause("contracts_leasing", "ar_leasing", payload)
+
+
+@router.post("/buyout/bulk-pause")
+def bulk_pause_buyout_contracts(payload: ContractBulkAction):
+    """批次暫停買斷合約（依客戶代碼或合約編號）並刪除其應收帳款"""
+    return _bulk_pause("contracts_buyout", "ar_buyout", payload)
+
+
+@router.post("/leasing/bulk-resume")
+def bulk_resume_leasing_contracts(payload: ContractBulkAction):
+    """批次恢復租賃合約並以 COPY 重新產生應收帳款"""
+    where_clause, params = _bulk_filter(payload)
+    resume_date = payload.resume_date or date.today()
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT contract_code, customer_code, customer_name, monthly_rent,
+                       payment_cycle_months, contract_months
+                FROM contracts_leasing
+                WHERE {where_clause} AND status = 'paused'
+                ORDER BY contract_code
+                FOR UPDATE
+            """, tuple(params))
+            rows = cur.fetchall()
+            codes = [r[0] for r in rows]
+            periods = 0
+
+            if codes:
+                cur.execute("""
+                    UPDATE contracts_leasing
+                    SET status = 'active', updated_at = CURRENT_TIMESTAMP
+                    WHERE contract_code = ANY(%s)
+                """, (codes,))
+                cur.execute("DELETE FROM ar_leasing WHERE contract_code = ANY(%s)", (codes,))
+                periods = generate_leasing_ar_batch(
+                    [(r[0], r[1], r[2], float(r[3]) if r[3] else None, r[4], r[5]) for r in rows],
+                    resume_date, conn
+                )
 
-            if deal_amount:
-                generate_buyout_ar(
-                    contract_code,
-                    row[2],
-                    row[3],
-                    resume_date,
-                    deal_amount,
-                    conn
+            conn.commit()
+            return {"contract_codes": codes, "count": len(codes), "ar_periods": periods}
+    except HTTPException:
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        release_connection(conn)
+
+
+@router.post("/buyout/bulk-resume")
+def bulk_resume_buyout_contracts(payload: ContractBulkAction):
+    """批次恢復買斷合約並以 COPY 重新產生應收帳款"""
+    where_clause, params = _bulk_filter(payload)
+    resume_date = payload.resume_date or date.today()
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT contract_code, customer_code, customer_name, deal_amount
+                FROM contracts_buyout
+                WHERE {where_clause} AND status = 'paused'
+                ORDER BY contract_code
+                FOR UPDATE
+            """, tuple(params))
+            rows = cur.fetchall()
+            codes = [r[0] for r in rows]
+            periods = 0
+
+            if codes:
+                cur.execute("""
+                    UPDATE contracts_buyout
+                    SET status = 'active', updated_at = CURRENT_TIMESTAMP
+                    WHERE contract_code = ANY(%s)
+                """, (codes,))
+                cur.execute("DELETE FROM ar_buyout WHERE contract_code = ANY(%s)", (codes,))
+                periods = generate_buyout_ar_batch(
+                    [(r[0], r[1], r[2], float(r[3]) if r[3] else None) for r in rows],
+                    resume_date, conn
                 )
 
             conn.commit()
-            refreshed = _fetch_buyout(cur, contract_code)
-            if not refreshed:
-                raise HTTPException(status_code=500, detail="合約讀取失敗")
-            return _buyout_row_to_contract(refreshed)
+            return {"contract_codes": codes, "count": len(codes), "ar_periods": periods}
     except HTTPException:
         raise
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        conn.close()
+        release_connection(conn)
 
 @router.delete("/leasing/{contract_code}", status_code=204)
 def delete_leasing_contract(contract_code: str):
@@ -552,7 +733,7 @@ def delete_leasing_contract(contract_code: str):
                 raise HTTPException(status_code=404, detail="合約不存在")
             conn.commit()
     finally:
-        conn.close()
+        release_connection(conn)
 
 @router.delete("/buyout/{contract_code}", status_code=204)
 def delete_buyout_contract(contract_code: str):
@@ -566,5 +747,5 @@ def delete_buyout_contract(contract_code: str):
                 raise HTTPException(status_code=404, detail="合約不存在")
             conn.commit()
     finally:
-        conn.close()
+        release_connection(conn)
 
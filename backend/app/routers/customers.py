@@ -1,7 +1,9 @@
 """客戶資料 API - 簡潔直接，不要廢話"""
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from typing import List, Optional
-from app.database import get_cursor, get_connection
+from app.database import get_cursor, get_read_cursor, get_connection, release_connection
+from app.services.http_cache import check_not_modified, parse_if_match, set_version_etag
+from app.services.payment_service import OPEN_AR_STATUSES
 from app.models.customer import Customer, CustomerCreate, CustomerUpdate, CustomerCodeChange
 
 router = APIRouter()
@@ -11,14 +13,14 @@ def _row_to_customer(row) -> Customer:
         id=row[0], customer_code=row[1], name=row[2], contact_name=row[3],
         mobile=row[4], phone=row[5], address=row[6], email=row[7],
         tax_id=row[8], sales_rep_name=row[9], remark=row[10],
-        created_at=row[11], updated_at=row[12]
+        created_at=row[11], updated_at=row[12], version=row[13]
     )
 
 def _fetch_customer(cur, customer_code: str, for_update: bool = False):
     sql = """
         SELECT id, customer_code, name, contact_name, mobile, phone,
                address, email, tax_id, sales_rep_name, remark,
-               created_at, updated_at
+               created_at, updated_at, version
         FROM customers
         WHERE customer_code = %s
     """
@@ -28,14 +30,22 @@ def _fetch_customer(cur, customer_code: str, for_update: bool = False):
     return cur.fetchone()
 
 @router.get("", response_model=List[Customer])
-def get_customers(search: Optional[str] = Query(None, description="搜尋關鍵字")):
+def get_customers(
+    request: Request,
+    response: Response,
+    search: Optional[str] = Query(None, description="搜尋關鍵字")
+):
     """取得客戶列表（支援搜尋）"""
-    with get_cursor() as cur:
+    not_modified = check_not_modified(request, response, "customers")
+    if not_modified:
+        return not_modified
+
+    with get_read_cursor() as cur:
         if search:
             cur.execute("""
                 SELECT id, customer_code, name, contact_name, mobile, phone,
                        address, email, tax_id, sales_rep_name, remark,
-                       created_at, updated_at
+                       created_at, updated_at, version
                 FROM customers
                 WHERE customer_code ILIKE %s OR name ILIKE %s 
                    OR contact_name ILIKE %s OR mobile ILIKE %s
@@ -46,7 +56,7 @@ def get_customers(search: Optional[str] = Query(None, description="搜尋關鍵
             cur.execute("""
                 SELECT id, customer_code, name, contact_name, mobile, phone,
                        address, email, tax_id, sales_rep_name, remark,
-                       created_at, updated_at
+                       created_at, updated_at, version
                 FROM customers
                 ORDER BY customer_code
             """)
@@ -55,16 +65,112 @@ def get_customers(search: Optional[str] = Query(None, description="搜尋關鍵
     return [_row_to_customer(r) for r in rows]
 
 @router.get("/{customer_code}", response_model=Customer)
-def get_customer(customer_code: str):
-    """取得單一客戶"""
-    with get_cursor() as cur:
+def get_customer(customer_code: str, response: Response):
+    """取得單一客戶（ETag 為資料版本號）"""
+    with get_read_cursor() as cur:
         row = _fetch_customer(cur, customer_code)
     
     if not row:
         raise HTTPException(status_code=404, detail="客戶不存在")
     
+    set_version_etag(response, row[13])
     return _row_to_customer(row)
 
+# 客戶總覽：一個語句以 JSON 彙總組出客戶、所有合約、未結清帳款（含合計）與最近的服務費用，
+# 各子查詢都以 customer_code 走索引（sql/011_customer_overview.sql）
+_OVERVIEW_SQL = """
+    WITH open_ar AS (
+        SELECT 'leasing' AS source, id, contract_code, start_date AS period_start, end_date AS due_date,
+               COALESCE(total_rent, 0) AS amount, COALESCE(received_amount, 0) AS received_amount,
+               COALESCE(fee, 0) AS fee,
+               COALESCE(total_rent, 0) + COALESCE(fee, 0) - COALESCE(received_amount, 0) AS balance,
+               payment_status
+        FROM ar_leasing
+        WHERE customer_code = %(customer_code)s AND payment_status = ANY(%(statuses)s)
+        UNION ALL
+        SELECT 'buyout', id, contract_code, deal_date, deal_date,
+               COALESCE(total_amount, 0), COALESCE(received_amount, 0), COALESCE(fee, 0),
+               COALESCE(total_amount, 0) + COALESCE(fee, 0) - COALESCE(received_amount, 0),
+               payment_status
+        FROM ar_buyout
+        WHERE customer_code = %(customer_code)s AND payment_status = ANY(%(statuses)s)
+    )
+    SELECT json_build_object(
+        'customer', row_to_json(cust),
+        'leasing_contracts', COALESCE((
+            SELECT json_agg(l ORDER BY l.start_date DESC, l.contract_code)
+            FROM (
+                SELECT id, contract_code, start_date, model, quantity, monthly_rent,
+                       payment_cycle_months, overprint, contract_months,
+                       sales_company_code, sales_amount, service_company_code, service_amount,
+                       sales_payment_status, service_payment_status, status, needs_invoice, version
+                FROM contracts_leasing
+                WHERE customer_code = c.customer_code
+            ) l
+        ), '[]'),
+        'buyout_contracts', COALESCE((
+            SELECT json_agg(b ORDER BY b.deal_date DESC, b.contract_code)
+            FROM (
+                SELECT id, contract_code, deal_date, deal_amount,
+                       sales_company_code, sales_amount, service_company_code, service_amount,
+                       sales_payment_status, service_payment_status, status, needs_invoice, version
+                FROM contracts_buyout
+                WHERE customer_code = c.customer_code
+            ) b
+        ), '[]'),
+        'open_receivables', COALESCE((
+            SELECT json_agg(a ORDER BY a.due_date, a.source, a.id) FROM open_ar a
+        ), '[]'),
+        'receivable_totals', (
+            SELECT json_build_object(
+                'count', COUNT(*),
+                'amount', COALESCE(SUM(amount), 0),
+                'received_amount', COALESCE(SUM(received_amount), 0),
+                'balance', COALESCE(SUM(balance), 0),
+                'overdue_balance', COALESCE(SUM(balance) FILTER (WHERE due_date < CURRENT_DATE), 0)
+            )
+            FROM open_ar
+        ),
+        'recent_service_expenses', COALESCE((
+            SELECT json_agg(s ORDER BY s.service_date DESC NULLS LAST, s.id DESC)
+            FROM (
+                SELECT id, contract_code, service_date, confirm_date, service_type,
+                       repair_company_code, total_amount, payment_status
+                FROM service_expense
+                WHERE customer_code = c.customer_code
+                ORDER BY service_date DESC NULLS LAST, id DESC
+                LIMIT %(service_limit)s
+            ) s
+        ), '[]')
+    )::text
+    FROM customers c
+    CROSS JOIN LATERAL (
+        SELECT c.id, c.customer_code, c.name, c.contact_name, c.mobile, c.phone,
+               c.address, c.email, c.tax_id, c.sales_rep_name, c.remark,
+               c.created_at, c.updated_at, c.version
+    ) cust
+    WHERE c.customer_code = %(customer_code)s
+"""
+
+@router.get("/{customer_code}/overview")
+def get_customer_overview(
+    customer_code: str,
+    service_limit: int = Query(20, ge=1, le=200, description="最近服務費用筆數")
+):
+    """客戶總覽：客戶資料、所有租賃／買斷合約、未結清應收帳款與合計、最近的服務費用（一次查詢）"""
+    with get_read_cursor() as cur:
+        cur.execute(_OVERVIEW_SQL, {
+            "customer_code": customer_code,
+            "statuses": OPEN_AR_STATUSES,
+            "service_limit": service_limit,
+        })
+        row = cur.fetchone()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="客戶不存在")
+    # JSON 已在資料庫組好，直接輸出不再經過 Python 物件轉換
+    return Response(content=row[0], media_type="application/json")
+
 @router.post("", response_model=Customer, status_code=201)
 def create_customer(customer: CustomerCreate):
     """新增客戶"""
@@ -91,8 +197,9 @@ def create_customer(customer: CustomerCreate):
             raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/{customer_code}", response_model=Customer)
-def update_customer(customer_code: str, customer: CustomerUpdate):
-    """更新客戶"""
+def update_customer(customer_code: str, customer: CustomerUpdate, request: Request, response: Response):
+    """更新客戶（帶 If-Match 時僅在版本相符時更新，否則回 412）"""
+    expected_version = parse_if_match(request)
     with get_cursor() as cur:
         cur.execute("""
             UPDATE customers
@@ -100,36 +207,35 @@ def update_customer(customer_code: str, customer: CustomerUpdate):
                 address = %s, email = %s, tax_id = %s,
                 sales_rep_name = %s, remark = %s,
                 updated_at = CURRENT_TIMESTAMP
-            WHERE customer_code = %s
+            WHERE customer_code = %s AND (%s::int IS NULL OR version = %s)
             RETURNING id
         """, (
             customer.name, customer.contact_name, customer.mobile,
             customer.phone, customer.address, customer.email,
             customer.tax_id, customer.sales_rep_name, customer.remark,
-            customer_code
+            customer_code, expected_version, expected_version
         ))
         row = cur.fetchone()
-    
-    if not row:
-        raise HTTPException(status_code=404, detail="客戶不存在")
-    
-    with get_cursor() as cur:
         refreshed = _fetch_customer(cur, customer_code)
     
     if not refreshed:
-        raise HTTPException(status_code=500, detail="客戶讀取失敗")
+        raise HTTPException(status_code=404, detail="客戶不存在")
+    if not row:
+        raise HTTPException(status_code=412, detail="客戶資料已被其他人修改，請重新整理後再試")
     
+    set_version_etag(response, refreshed[13])
     return _row_to_customer(refreshed)
 
 
 @router.post("/{customer_code}/change-code", response_model=Customer)
-def change_customer_code(customer_code: str, payload: CustomerCodeChange):
+def change_customer_code(customer_code: str, payload: CustomerCodeChange, request: Request, response: Response):
     """更換客戶代碼並同步所有關聯資料"""
+    expected_version = parse_if_match(request)
     new_code = payload.new_customer_code.strip()
     if not new_code:
         raise HTTPException(status_code=400, detail="新客戶代碼不得為空")
     if new_code == customer_code:
-        return get_customer(customer_code)
+        return get_customer(customer_code, response)
 
     conn = get_connection()
     try:
@@ -137,6 +243,8 @@ def change_customer_code(customer_code: str, payload: CustomerCodeChange):
             current = _fetch_customer(cur, customer_code, for_update=True)
             if not current:
                 raise HTTPException(status_code=404, detail="客戶不存在")
+            if expected_version is not None and current[13] != expected_version:
+                raise HTTPException(status_code=412, detail="客戶資料已被其他人修改，請重新整理後再試")
 
             cur.execute(
                 "SELECT 1 FROM customers WHERE customer_code = %s",
@@ -165,6 +273,7 @@ def change_customer_code(customer_code: str, payload: CustomerCodeChange):
             refreshed = _fetch_customer(cur, new_code)
             if not refreshed:
                 raise HTTPException(status_code=500, detail="客戶讀取失敗")
+            set_version_etag(response, refreshed[13])
             return _row_to_customer(refreshed)
     except HTTPException:
         conn.rollback()
@@ -173,7 +282,7 @@ def change_customer_code(customer_code: str, payload: CustomerCodeChange):
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        conn.close()
+        release_connection(conn)
 
 @router.delete("/{customer_code}", status_code=204)
 def delete_customer(customer_code: str):
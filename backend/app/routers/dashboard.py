@@ -0,0 +1,85 @@
+"""首頁儀表板 API - 只讀取彙總表，不掃描合約與應收帳款"""
+from datetime import date, datetime
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from app.database import get_cursor, get_read_cursor
+from app.utils.date_utils import add_months
+
+router = APIRouter()
+
+def _parse_month(value: str, name: str) -> date:
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} 格式錯誤，應為 YYYY-MM")
+
+@router.get("")
+def get_dashboard(
+    from_month: Optional[str] = Query(None, description="起始月份 (YYYY-MM)，預設 11 個月前"),
+    to_month: Optional[str] = Query(None, description="結束月份 (YYYY-MM)，預設本月")
+):
+    """取得儀表板指標：合約數、每月應收/已收/未收、應付未付金額"""
+    this_month = date.today().replace(day=1)
+    start = _parse_month(from_month, "from_month") if from_month else add_months(this_month, -11)
+    end = _parse_month(to_month, "to_month") if to_month else this_month
+
+    with get_read_cursor() as cur:
+        cur.execute("""
+            SELECT contract_type, status, SUM(contracts), SUM(payables_due)
+            FROM dashboard_contracts
+            GROUP BY contract_type, status
+            ORDER BY contract_type, status
+        """)
+        contract_rows = cur.fetchall()
+
+        cur.execute("""
+            SELECT month, contract_type, SUM(periods), SUM(billed), SUM(collected), SUM(outstanding)
+            FROM dashboard_ar_monthly
+            WHERE month BETWEEN %s AND %s
+            GROUP BY month, contract_type
+            ORDER BY month, contract_type
+        """, (start, end))
+        monthly_rows = cur.fetchall()
+
+        cur.execute("""
+            SELECT COALESCE(SUM(outstanding), 0)
+            FROM dashboard_ar_monthly
+            WHERE month <= %s
+        """, (end,))
+        outstanding_total = cur.fetchone()[0]
+
+    contracts = [
+        {
+            'contract_type': r[0],
+            'status': r[1],
+            'contracts': r[2],
+            'payables_due': float(r[3]) if r[3] else 0.0,
+        }
+        for r in contract_rows if r[2]
+    ]
+    monthly = [
+        {
+            'month': r[0].strftime('%Y-%m'),
+            'contract_type': r[1],
+            'periods': r[2],
+            'billed': float(r[3]) if r[3] else 0.0,
+            'collected': float(r[4]) if r[4] else 0.0,
+            'outstanding': float(r[5]) if r[5] else 0.0,
+        }
+        for r in monthly_rows if r[2]
+    ]
+
+    return {
+        'active_contracts': sum(c['contracts'] for c in contracts if c['status'] == 'active'),
+        'payables_due': sum(c['payables_due'] for c in contracts),
+        'outstanding': float(outstanding_total),
+        'contracts': contracts,
+        'monthly': monthly,
+    }
+
+@router.post("/rebuild")
+def rebuild_dashboard():
+    """全部重算儀表板彙總表（修復用）"""
+    with get_cursor() as cur:
+        cur.execute("SELECT rebuild_dashboard_rollups()")
+    return {"status": "ok"}
@@ -0,0 +1,59 @@
+"""背景工作 API - 排入耗時作業並查詢狀態、進度與結果"""
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Optional
+from app.database import get_cursor
+from app.models.job import Job, JobCreate
+from app.services.job_handlers import JOB_TYPES
+from app.services.jobs import JOB_STATUSES, cancel_job, enqueue_job, get_job, list_jobs
+
+router = APIRouter()
+
+@router.get("/types")
+def get_job_types():
+    """可排入的工作類型與併發上限"""
+    return [
+        {"job_type": name, "concurrency": spec.concurrency, "max_attempts": spec.max_attempts,
+         "description": (spec.handler.__doc__ or "").strip()}
+        for name, spec in JOB_TYPES.items()
+    ]
+
+@router.post("", response_model=Job, status_code=202)
+def create_job(job: JobCreate):
+    """排入背景工作，立即回傳工作編號（以 GET /api/jobs/{id} 查詢進度與結果）"""
+    if job.job_type not in JOB_TYPES:
+        raise HTTPException(status_code=400, detail=f"未知的工作類型：{job.job_type}")
+    with get_cursor() as cur:
+        return enqueue_job(cur, job.job_type, job.payload)
+
+# 工作狀態變化很快，查詢一律走主庫，不讀副本
+@router.get("", response_model=List[Job])
+def get_jobs(
+    status: Optional[str] = Query(None, description="queued / running / succeeded / failed / cancelled"),
+    job_type: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """最近的背景工作"""
+    if status and status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"未知的狀態：{status}")
+    with get_cursor() as cur:
+        return list_jobs(cur, status, job_type, limit)
+
+@router.get("/{job_id}", response_model=Job)
+def get_job_detail(job_id: int):
+    """工作狀態、進度與結果"""
+    with get_cursor() as cur:
+        job = get_job(cur, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="工作不存在")
+    return job
+
+@router.post("/{job_id}/cancel", response_model=Job)
+def cancel_queued_job(job_id: int):
+    """取消尚未開始的工作"""
+    with get_cursor() as cur:
+        job = cancel_job(cur, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="工作不存在")
+    if job['status'] != 'cancelled':
+        raise HTTPException(status_code=400, detail="只能取消排隊中的工作")
+    return job
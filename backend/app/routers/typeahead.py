@@ -0,0 +1,75 @@
+"""代碼自動完成 API - 依前綴取前 N 筆代碼／名稱，走 sql/014_typeahead.sql 的前綴索引"""
+from fastapi import APIRouter, Query, Request, Response
+from typing import Literal, Optional
+from app.database import get_read_cursor
+from app.services.http_cache import check_not_modified
+
+router = APIRouter()
+
+# 各類型的查詢來源：(資料表, 代碼欄位, 名稱欄位, 額外欄位)；合約同時查租賃與買斷
+_SOURCES = {
+    'customer': [("customers", "customer_code", "name", "NULL")],
+    'company': [("companies", "company_code", "name", "NULL")],
+    'contract': [
+        ("contracts_leasing", "contract_code", "customer_name", "'leasing'"),
+        ("contracts_buyout", "contract_code", "customer_name", "'buyout'"),
+    ],
+}
+
+_TABLES = {kind: [s[0] for s in sources] for kind, sources in _SOURCES.items()}
+
+def _like_prefix(prefix: str) -> str:
+    """轉成 LIKE 前綴樣式（跳脫 % _ \\）"""
+    escaped = prefix.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+@router.get("")
+def typeahead(
+    request: Request,
+    response: Response,
+    kind: Literal['customer', 'company', 'contract'] = Query(..., description="customer / company / contract"),
+    q: str = Query(..., min_length=1, max_length=50, description="代碼或名稱的開頭（不分大小寫）"),
+    limit: int = Query(10, ge=1, le=50),
+    company_type: Optional[Literal['sales', 'service']] = Query(None, description="公司類型（kind=company 時）")
+):
+    """依前綴回傳前 limit 筆 {code, name}（合約另含 type），代碼相符的排在名稱相符之前"""
+    not_modified = check_not_modified(request, response, *_TABLES[kind])
+    if not_modified:
+        return not_modified
+
+    pattern = _like_prefix(q)
+    extra = ""
+    if kind == 'company' and company_type:
+        extra = " AND is_sales" if company_type == 'sales' else " AND is_service"
+
+    # 每個來源的代碼、名稱各取前 limit 筆（索引依序掃描即可停止），再合併排序
+    parts = []
+    params = []
+    for table, code_column, name_column, type_sql in _SOURCES[kind]:
+        for rank, column in ((0, code_column), (1, name_column)):
+            parts.append(f"""
+                (SELECT {code_column} AS code, {name_column} AS name, {type_sql} AS type,
+                        {rank} AS rank, lower({column}) COLLATE "C" AS sort_key
+                 FROM {table}
+                 WHERE lower({column}) COLLATE "C" LIKE %s{extra}
+                 ORDER BY lower({column}) COLLATE "C"
+                 LIMIT %s)
+            """)
+            params.extend([pattern, limit])
+
+    params.append(limit)
+    with get_read_cursor() as cur:
+        cur.execute(f"""
+            SELECT code, name, type FROM (
+                SELECT DISTINCT ON (code, type) code, name, type, rank, sort_key
+                FROM ({" UNION ALL ".join(parts)}) AS matches
+                ORDER BY code, type, rank
+            ) AS deduped
+            ORDER BY rank, sort_key, code
+            LIMIT %s
+        """, tuple(params))
+        rows = cur.fetchall()
+
+    if kind == 'contract':
+        return [{'code': r[0], 'name': r[1], 'type': r[2]} for r in rows]
+    return [{'code': r[0], 'name': r[1]} for r in rows]
@@ -0,0 +1,86 @@
+"""正式環境啟動入口 - 多個 uvicorn worker（uvloop + httptools），依資料庫連線上限分配每個 worker 的連線池
+
+用法（於 backend 目錄執行）：
+    python -m app.server
+
+設定全部來自 app.config.Settings（DB_WEB_WORKERS、DB_MAX_CONNECTIONS、PORT 等）。
+背景工作 worker 由這個主行程啟動一次，web worker 不再各自啟動。
+"""
+import logging
+import os
+import uvicorn
+from app.config import get_settings, reload_settings
+from app.services.jobs import job_workers
+
+logger = logging.getLogger("app.server")
+
+# 每個背景工作 worker 使用的連線數（控制連線 + 工作連線）
+JOB_WORKER_CONNECTIONS = 2
+# 每個 web worker 除連線池外另開的連線（變更通知的 LISTEN）
+WORKER_EXTRA_CONNECTIONS = 1
+
+def plan_workers(settings):
+    """計算 web worker 數與每個 worker 的連線池大小，回傳 (workers, pool_min_size, pool_max_size)"""
+    budget = settings.max_connections - settings.connection_reserve - settings.job_workers * JOB_WORKER_CONNECTIONS
+    per_worker_min = WORKER_EXTRA_CONNECTIONS + 1
+    if budget < per_worker_min:
+        raise SystemExit(
+            f"資料庫連線數不足：DB_MAX_CONNECTIONS={settings.max_connections} 扣除保留與背景工作後只剩 {budget} 條"
+        )
+
+    workers = settings.web_workers or os.cpu_count() or 1
+    # 連線不夠每個 worker 至少一條時減少 worker 數，而不是讓連線總數超過上限
+    workers = min(workers, budget // per_worker_min)
+    pool_max_size = min(settings.pool_max_size, budget // workers - WORKER_EXTRA_CONNECTIONS)
+    pool_min_size = min(settings.pool_min_size, pool_max_size)
+    return workers, pool_min_size, pool_max_size
+
+def _event_loop() -> str:
+    try:
+        import uvloop  # noqa: F401
+        return "uvloop"
+    except ImportError:  # Windows 沒有 uvloop
+        return "asyncio"
+
+def _http_protocol() -> str:
+    try:
+        import httptools  # noqa: F401
+        return "httptools"
+    except ImportError:
+        return "h11"
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    settings = get_settings()
+    workers, pool_min_size, pool_max_size = plan_workers(settings)
+    logger.info(
+        "啟動 %d 個 web worker，每個連線池 %d~%d 條，背景工作 worker %d 個（連線上限 %d）",
+        workers, pool_min_size, pool_max_size, settings.job_workers, settings.max_connections
+    )
+
+    job_workers.start(settings.job_workers)
+
+    # web worker 由環境變數讀取設定：改寫連線池大小，且不再各自啟動背景工作 worker
+    os.environ["DB_POOL_MIN_SIZE"] = str(pool_min_size)
+    os.environ["DB_POOL_MAX_SIZE"] = str(pool_max_size)
+    os.environ["DB_JOB_WORKERS"] = "0"
+    reload_settings()
+
+    try:
+        # 關閉時停止接受新連線，進行中的請求最多等 graceful_timeout 秒，之後各 worker 關閉連線池
+        uvicorn.run(
+            "app.main:app",
+            host=settings.bind_host,
+            port=settings.bind_port,
+            workers=workers,
+            loop=_event_loop(),
+            http=_http_protocol(),
+            timeout_graceful_shutdown=settings.graceful_timeout,
+            proxy_headers=True,
+            forwarded_allow_ips="*",
+        )
+    finally:
+        job_workers.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""帳款列表查詢 - 組出應收帳款、應付帳款與服務費用的查詢及資料列轉換
+
+/api/accounts 的列表 API（一般、串流與結果合併）與背景工作的帳款匯出共用。
+查詢以 [(sql, params), ...] 表示，依序執行後以對應的 *_row_to_dict 轉換每一列。
+"""
+
+def row_to_dict(row, columns):
+    """將資料庫查詢結果轉換為字典"""
+    return dict(zip(columns, row))
+
+def format_date(value):
+    if not value:
+        return value
+    return value.strftime('%Y-%m-%d') if hasattr(value, 'strftime') else str(value)
+
+def _union_sources(select_sql, table, where_clause, params, include_archived):
+    """include_archived 時以 UNION ALL 併入對應封存表展開後的期別（<表>_archive_rows，條件相同）"""
+    tables = [table, f"{table}_archive_rows"] if include_archived else [table]
+    query = " UNION ALL ".join(f"{select_sql} FROM {t}{where_clause}" for t in tables)
+    return f"{query} ORDER BY contract_code", tuple(params) * len(tables)
+
+def receivables_statements(contract_code, customer_code, customer_name, from_date, to_date, payment_status, type, include_archived=False):
+    """組出應收帳款查詢（租賃、買斷各一段）"""
+    statements = []
+
+    # 查詢租賃應收帳款
+    if not type or type == '租賃':
+        where_parts = []
+        params = []
+
+        if contract_code:
+            where_parts.append("contract_code ILIKE %s")
+            params.append(f"%{contract_code}%")
+
+        if customer_code:
+            where_parts.append("customer_code ILIKE %s")
+            params.append(f"%{customer_code}%")
+
+        if customer_name:
+            where_parts.append("customer_name ILIKE %s")
+            params.append(f"%{customer_name}%")
+
+        # 日期條件明確轉型為 date，分割表才能排除範圍外的年度分割區
+        if from_date:
+            where_parts.append("start_date >= %s::date")
+            params.append(from_date)
+
+        if to_date:
+            where_parts.append("start_date <= %s::date")
+            params.append(to_date)
+
+        if payment_status:
+            where_parts.append("payment_status = %s")
+            params.append(payment_status)
+
+        where_clause = " WHERE " + " AND ".join(where_parts) if where_parts else ""
+
+        statements.append(_union_sources("""
+            SELECT
+                id,
+                '租賃' as type,
+                contract_code,
+                customer_code,
+                customer_name,
+                start_date as date,
+                end_date,
+                total_rent as amount,
+                fee,
+                received_amount,
+                payment_status
+        """, "ar_leasing", where_clause, params, include_archived))
+
+    # 查詢買斷應收帳款
+    if not type or type == '買斷':
+        where_parts = []
+        params = []
+
+        if contract_code:
+            where_parts.append("contract_code ILIKE %s")
+            params.append(f"%{contract_code}%")
+
+        if customer_code:
+            where_parts.append("customer_code ILIKE %s")
+            params.append(f"%{customer_code}%")
+
+        if customer_name:
+            where_parts.append("customer_name ILIKE %s")
+            params.append(f"%{customer_name}%")
+
+        if from_date:
+            where_parts.append("deal_date >= %s::date")
+            params.append(from_date)
+
+        if to_date:
+            where_parts.append("deal_date <= %s::date")
+            params.append(to_date)
+
+        if payment_status:
+            where_parts.append("payment_status = %s")
+            params.append(payment_status)
+
+        where_clause = " WHERE " + " AND ".join(where_parts) if where_parts else ""
+
+        statements.append(_union_sources("""
+            SELECT
+                id,
+                '買斷' as type,
+                contract_code,
+                customer_code,
+                customer_name,
+                deal_date as date,
+                NULL as end_date,
+                total_amount as amount,
+                fee,
+                received_amount,
+                payment_status
+        """, "ar_buyout", where_clause, params, include_archived))
+
+    return statements
+
+_RECEIVABLE_COLUMNS = ['id', 'type', 'contract_code', 'customer_code', 'customer_name',
+                       'date', 'end_date', 'amount', 'fee', 'received_amount', 'payment_status']
+
+def receivable_row_to_dict(row):
+    item = row_to_dict(row, _RECEIVABLE_COLUMNS)
+    # 轉換日期為字串格式
+    item['date'] = format_date(item['date'])
+    item['end_date'] = format_date(item['end_date'])
+    # 確保數值為 float
+    item['amount'] = float(item['amount']) if item['amount'] else 0.0
+    item['fee'] = float(item['fee']) if item['fee'] else 0.0
+    item['received_amount'] = float(item['received_amount']) if item['received_amount'] else 0.0
+    return item
+
+# 應付帳款來源：(合約類型, 資料表, 日期欄位) x (付款對象, 欄位前綴)，依此順序輸出
+_PAYABLE_CONTRACTS = [('租賃', 'contracts_leasing', 'start_date'), ('買斷', 'contracts_buyout', 'deal_date')]
+_PAYABLE_TARGETS = [('業務', 'sales'), ('維護', 'service')]
+
+def payables_statements(paid, contract_code, customer_code, customer_name, from_date, to_date, payment_status, payable_type, contract_type):
+    """組出已出（paid=True）或未出帳款查詢，每種合約類型與付款對象各一段"""
+    statements = []
+    for type_name, table, date_column in _PAYABLE_CONTRACTS:
+        if contract_type and contract_type != type_name:
+            continue
+        for target_name, prefix in _PAYABLE_TARGETS:
+            if payable_type and payable_type != target_name:
+                continue
+
+            operator = "=" if paid else "!="
+            where_parts = [f"{prefix}_payment_status {operator} '已付款'", f"{prefix}_amount > 0"]
+            params = []
+
+            if contract_code:
+                where_parts.append("contract_code ILIKE %s")
+                params.append(f"%{contract_code}%")
+            if customer_code:
+                where_parts.append("customer_code ILIKE %s")
+                params.append(f"%{customer_code}%")
+            if customer_name:
+                where_parts.append("customer_name ILIKE %s")
+                params.append(f"%{customer_name}%")
+            if from_date:
+                where_parts.append(f"{date_column} >= %s")
+                params.append(from_date)
+            if to_date:
+                where_parts.append(f"{date_column} <= %s")
+                params.append(to_date)
+            if payment_status:
+                where_parts.append(f"{prefix}_payment_status = %s")
+                params.append(payment_status)
+
+            statements.append((f"""
+                SELECT
+                    contract_code, '{type_name}' as contract_type,
+                    customer_code, customer_name, {date_column} as date,
+                    '{target_name}' as payable_type, {prefix}_company_code as company_code,
+                    {prefix}_amount as amount, {prefix}_payment_status as payment_status
+                FROM {table}
+                WHERE {' AND '.join(where_parts)}
+            """, tuple(params)))
+    return statements
+
+_PAYABLE_COLUMNS = ['contract_code', 'contract_type', 'customer_code', 'customer_name',
+                    'date', 'payable_type', 'company_code', 'amount', 'payment_status']
+
+def payable_row_to_dict(row):
+    item = row_to_dict(row, _PAYABLE_COLUMNS)
+    # 轉換日期為字串格式
+    item['date'] = format_date(item['date'])
+    # 確保數值為 float
+    item['amount'] = float(item['amount']) if item['amount'] else 0.0
+    return item
+
+def service_statements(contract_code, customer_code, customer_name, from_date, to_date, payment_status, service_type):
+    """組出服務費用查詢"""
+    where_parts = []
+    params = []
+
+    if contract_code:
+        where_parts.append("contract_code ILIKE %s")
+        params.append(f"%{contract_code}%")
+
+    if customer_code:
+        where_parts.append("customer_code ILIKE %s")
+        params.append(f"%{customer_code}%")
+
+    if customer_name:
+        where_parts.append("customer_name ILIKE %s")
+        params.append(f"%{customer_name}%")
+
+    if from_date:
+        where_parts.append("service_date >= %s")
+        params.append(from_date)
+
+    if to_date:
+        where_parts.append("service_date <= %s")
+        params.append(to_date)
+
+    if payment_status:
+        where_parts.append("payment_status = %s")
+        params.append(payment_status)
+
+    if service_type:
+        where_parts.append("service_type ILIKE %s")
+        params.append(f"%{service_type}%")
+
+    where_clause = " WHERE " + " AND ".join(where_parts) if where_parts else ""
+
+    return [(f"""
+        SELECT
+            id, contract_code, customer_code, customer_name,
+            service_date, confirm_date, service_type,
+            repair_company_code, total_amount, payment_status
+        FROM service_expense
+        {where_clause}
+        ORDER BY service_date DESC
+    """, tuple(params))]
+
+_SERVICE_COLUMNS = ['id', 'contract_code', 'customer_code', 'customer_name',
+                    'service_date', 'confirm_date', 'service_type',
+                    'repair_company_code', 'total_amount', 'payment_status']
+
+def service_row_to_dict(row):
+    item = row_to_dict(row, _SERVICE_COLUMNS)
+    # 轉換日期為字串格式
+    item['service_date'] = format_date(item['service_date'])
+    item['confirm_date'] = format_date(item['confirm_date'])
+    # 確保數值為 float
+    item['total_amount'] = float(item['total_amount']) if item['total_amount'] else 0.0
+    return item
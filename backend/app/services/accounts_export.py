@@ -0,0 +1,121 @@
+"""帳款匯出 - 與帳款頁面「匯出 Excel」相同的工作表，以 CSV 寫入匯出目錄（背景工作 accounts_export 使用）
+
+查詢條件與 /api/accounts 的各列表 API 相同（見 account_queries）；所有工作表在同一個快照內讀取，
+以伺服器端游標分批寫出，資料量大時記憶體用量固定。CSV 以 UTF-8 BOM 編碼，Excel 可直接開啟。
+"""
+import csv
+import os
+from app.services.account_queries import (
+    payable_row_to_dict, payables_statements, receivable_row_to_dict, receivables_statements,
+    service_row_to_dict, service_statements
+)
+
+FETCH_SIZE = 2000
+
+EXPORT_FILES = ['receivables.csv', 'unpaid_receivables.csv', 'unpaid_payables.csv',
+                'paid_payables.csv', 'service_expenses.csv']
+
+RECEIVABLE_FILTERS = ['contract_code', 'customer_code', 'customer_name', 'from_date', 'to_date',
+                      'payment_status', 'type', 'include_archived']
+PAYABLE_FILTERS = ['contract_code', 'customer_code', 'customer_name', 'from_date', 'to_date',
+                   'payment_status', 'payable_type', 'contract_type']
+SERVICE_FILTERS = ['contract_code', 'customer_code', 'customer_name', 'from_date', 'to_date',
+                   'payment_status', 'service_type']
+
+# 欄位標題與帳款頁面匯出的工作表相同
+RECEIVABLE_HEADERS = ['類型', '合約編號', '客戶代碼', '客戶名稱', '日期', '結束日期',
+                      '金額', '手續費', '已收金額', '應收總額', '未收金額', '繳費狀況']
+PAYABLE_HEADERS = ['合約編號', '類型', '客戶代碼', '客戶名稱', '日期', '付款對象', '公司代碼', '金額', '付款狀況']
+SERVICE_HEADERS = ['合約編號', '客戶代碼', '客戶名稱', '服務日期', '確認日期', '服務類型',
+                   '維修公司代碼', '總金額', '繳費狀況']
+
+def _filter_args(filters, names):
+    if filters is None:
+        filters = {}
+    if not isinstance(filters, dict):
+        raise ValueError("查詢條件應為物件")
+    unknown = set(filters) - set(names)
+    if unknown:
+        raise ValueError(f"不支援的查詢條件：{', '.join(sorted(unknown))}")
+    return tuple(filters.get(name) for name in names)
+
+def _receivable_row(item):
+    total = item['amount'] + item['fee']
+    return [item['type'] or '', item['contract_code'] or '', item['customer_code'] or '',
+            item['customer_name'] or '', item['date'] or '', item['end_date'] or '',
+            item['amount'], item['fee'], item['received_amount'], total,
+            total - item['received_amount'], item['payment_status'] or '']
+
+def _payable_row(item):
+    return [item['contract_code'] or '', item['contract_type'] or '', item['customer_code'] or '',
+            item['customer_name'] or '', item['date'] or '', item['payable_type'] or '',
+            item['company_code'] or '', item['amount'], item['payment_status'] or '']
+
+def _service_row(item):
+    return [item['contract_code'] or '', item['customer_code'] or '', item['customer_name'] or '',
+            item['service_date'] or '', item['confirm_date'] or '', item['service_type'] or '',
+            item['repair_company_code'] or '', item['total_amount'], item['payment_status'] or '']
+
+def _iter_items(conn, statements, convert):
+    for index, (sql, params) in enumerate(statements):
+        with conn.cursor(name=f"accounts_export_{index}") as stream:
+            stream.execute(sql, params)
+            while True:
+                rows = stream.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield convert(row)
+
+def _open_csv(directory, name, headers):
+    f = open(os.path.join(directory, name), 'w', newline='', encoding='utf-8-sig')
+    writer = csv.writer(f)
+    writer.writerow(headers)
+    return f, writer
+
+def export_accounts(conn, directory: str, receivables=None, payables=None, service=None, on_file=None) -> dict:
+    """匯出應收、未收、未出、已出帳款與服務費用，回傳各檔案的筆數（寫完檔案後以已完成的檔案數呼叫 on_file）"""
+    receivable_args = _filter_args(receivables, RECEIVABLE_FILTERS)
+    payable_args = _filter_args(payables, PAYABLE_FILTERS)
+    service_args = _filter_args(service, SERVICE_FILTERS)
+    os.makedirs(directory, exist_ok=True)
+
+    counts = {}
+    with conn.cursor() as cur:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+    try:
+        # 總未收帳款與總應收帳款同一次讀取，篩選未收款的期別
+        all_file, all_writer = _open_csv(directory, 'receivables.csv', RECEIVABLE_HEADERS)
+        unpaid_file, unpaid_writer = _open_csv(directory, 'unpaid_receivables.csv', RECEIVABLE_HEADERS)
+        with all_file, unpaid_file:
+            counts['receivables.csv'] = counts['unpaid_receivables.csv'] = 0
+            for item in _iter_items(conn, receivables_statements(*receivable_args), receivable_row_to_dict):
+                row = _receivable_row(item)
+                all_writer.writerow(row)
+                counts['receivables.csv'] += 1
+                if item['payment_status'] != '已收款':
+                    unpaid_writer.writerow(row)
+                    counts['unpaid_receivables.csv'] += 1
+        if on_file:
+            on_file(len(counts))
+
+        sheets = [
+            ('unpaid_payables.csv', PAYABLE_HEADERS, payables_statements(False, *payable_args),
+             payable_row_to_dict, _payable_row),
+            ('paid_payables.csv', PAYABLE_HEADERS, payables_statements(True, *payable_args),
+             payable_row_to_dict, _payable_row),
+            ('service_expenses.csv', SERVICE_HEADERS, service_statements(*service_args),
+             service_row_to_dict, _service_row),
+        ]
+        for name, headers, statements, convert, to_row in sheets:
+            f, writer = _open_csv(directory, name, headers)
+            with f:
+                counts[name] = 0
+                for item in _iter_items(conn, statements, convert):
+                    writer.writerow(to_row(item))
+                    counts[name] += 1
+            if on_file:
+                on_file(len(counts))
+    finally:
+        conn.rollback()
+    return counts
@@ -0,0 +1,71 @@
+"""應收帳款封存 - 將已收款且超過保存年限的帳款分批打包移入壓縮的封存表（需先執行 sql/007_ar_archive.sql）"""
+from datetime import date
+from psycopg import sql
+
+# 判斷是否超過保存年限的日期欄位：租賃以期別結束日、買斷以成交日
+ARCHIVE_KEYS = {
+    'ar_leasing': 'end_date',
+    'ar_buyout': 'deal_date',
+}
+
+BATCH_SIZE = 2000
+
+def archive_table(conn, table: str, cutoff: date, dry_run: bool = False, on_batch=None) -> int:
+    """分批搬移 table 中已收款且早於 cutoff 的帳款，回傳搬移筆數（每批提交後以累計筆數呼叫 on_batch）
+
+    搬出的期別依合約與年度打包成 JSONB 陣列，併入封存表中同一合約年度的打包列（見 sql/007_ar_archive.sql）
+    """
+    key = ARCHIVE_KEYS[table]
+    condition = sql.SQL("payment_status = '已收款' AND contract_code IS NOT NULL AND {key} < %s").format(
+        key=sql.Identifier(key))
+
+    if dry_run:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("SELECT COUNT(*) FROM {table} WHERE {condition}").format(
+                table=sql.Identifier(table), condition=condition), (cutoff,))
+            return cur.fetchone()[0]
+
+    query = sql.SQL("""
+        WITH moved AS (
+            DELETE FROM {table}
+            WHERE id IN (
+                SELECT id FROM {table}
+                WHERE {condition}
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+        ),
+        packed AS (
+            INSERT INTO {archive} AS a (contract_code, period_year, customer_code, periods)
+            SELECT contract_code, EXTRACT(YEAR FROM {key})::INT, MAX(customer_code),
+                   jsonb_agg(to_jsonb(moved) ORDER BY id)
+            FROM moved
+            GROUP BY contract_code, EXTRACT(YEAR FROM {key})
+            ON CONFLICT (contract_code, period_year) DO UPDATE
+                SET periods = a.periods || EXCLUDED.periods,
+                    archived_at = CURRENT_TIMESTAMP
+        )
+        SELECT COUNT(*) FROM moved
+    """).format(
+        table=sql.Identifier(table),
+        archive=sql.Identifier(f"{table}_archive"),
+        condition=condition,
+        key=sql.Identifier(key)
+    )
+
+    moved = 0
+    while True:
+        with conn.cursor() as cur:
+            # 搬移不是新增或刪除帳款，儀表板彙總維持不變
+            cur.execute("SET LOCAL app.archiving = 'on'")
+            cur.execute(query, (cutoff, BATCH_SIZE))
+            count = cur.fetchone()[0]
+        conn.commit()
+        if count <= 0:
+            break
+        moved += count
+        if on_batch:
+            on_batch(moved)
+    return moved
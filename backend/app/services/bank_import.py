@@ -0,0 +1,110 @@
+"""銀行對帳單匯入 - 逐行解析 CSV，以 COPY 寫入暫存表後去重合併"""
+import csv
+import hashlib
+import io
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+# CSV 標題對應到 bank_ledger 欄位（支援常見的中英文標題）
+HEADER_ALIASES = {
+    'txn_date': ('txn_date', 'date', '日期', '交易日期', '帳務日期'),
+    'payer': ('payer', 'description', '匯款人', '摘要', '交易說明'),
+    'expense': ('expense', 'withdrawal', 'debit', '支出', '提款', '支出金額'),
+    'income': ('income', 'deposit', 'credit', '收入', '存款', '存入金額'),
+    'note': ('note', 'memo', '備註', '附言'),
+}
+
+class BankImportError(ValueError):
+    """對帳單格式錯誤（line_no 為 CSV 行號）"""
+
+    def __init__(self, line_no: int, message: str):
+        super().__init__(f"第 {line_no} 行：{message}")
+        self.line_no = line_no
+
+def _map_header(header):
+    """回傳 {欄位: CSV 欄位索引}，找不到必要欄位時拋出 BankImportError"""
+    normalized = [h.strip().lower() for h in header]
+    mapping = {}
+    for field, aliases in HEADER_ALIASES.items():
+        for i, name in enumerate(normalized):
+            if name in aliases:
+                mapping[field] = i
+                break
+    if 'txn_date' not in mapping:
+        raise BankImportError(1, "找不到日期欄位")
+    if 'expense' not in mapping and 'income' not in mapping:
+        raise BankImportError(1, "找不到支出或收入欄位")
+    return mapping
+
+def _parse_date(value: str) -> date:
+    """解析 YYYY-MM-DD / YYYY/MM/DD，年份小於 1911 視為民國年"""
+    parts = value.strip().replace('/', '-').replace('.', '-').split('-')
+    if len(parts) != 3:
+        raise ValueError(value)
+    year, month, day = (int(p) for p in parts)
+    if year < 1911:
+        year += 1911
+    return date(year, month, day)
+
+def _parse_amount(value: str) -> Decimal:
+    value = value.strip().replace(',', '')
+    return Decimal(value) if value else Decimal(0)
+
+def parse_statement(binary_file, encoding: str = 'utf-8-sig'):
+    """逐行產生 (行號, txn_date, payer, expense, income, note, 內容雜湊)，不一次讀入整份檔案"""
+    reader = csv.reader(io.TextIOWrapper(binary_file, encoding=encoding, newline=''))
+    try:
+        header = next(reader)
+    except StopIteration:
+        return
+    mapping = _map_header(header)
+
+    def cell(row, field):
+        i = mapping.get(field)
+        return row[i].strip() if i is not None and i < len(row) else ''
+
+    for line_no, row in enumerate(reader, start=2):
+        if not any(c.strip() for c in row):
+            continue
+        try:
+            txn_date = _parse_date(cell(row, 'txn_date'))
+            expense = _parse_amount(cell(row, 'expense'))
+            income = _parse_amount(cell(row, 'income'))
+        except (ValueError, InvalidOperation):
+            raise BankImportError(line_no, "日期或金額格式錯誤")
+        payer = cell(row, 'payer') or None
+        note = cell(row, 'note') or None
+        content = f"{txn_date.isoformat()}|{payer or ''}|{expense:.2f}|{income:.2f}|{note or ''}"
+        yield (line_no, txn_date, payer, expense, income, note,
+               hashlib.sha256(content.encode('utf-8')).hexdigest())
+
+def import_statement(cur, binary_file, encoding: str = 'utf-8-sig') -> dict:
+    """匯入對帳單：COPY 至暫存表，排除已存在的交易後合併進 bank_ledger"""
+    cur.execute("""
+        CREATE TEMP TABLE bank_ledger_staging (
+            line_no INT, txn_date DATE, payer TEXT,
+            expense NUMERIC(14, 2), income NUMERIC(14, 2), note TEXT,
+            content_hash CHAR(64)
+        ) ON COMMIT DROP
+    """)
+    with cur.copy("""
+        COPY bank_ledger_staging (line_no, txn_date, payer, expense, income, note, content_hash)
+        FROM STDIN
+    """) as copy:
+        for row in parse_statement(binary_file, encoding):
+            copy.write_row(row)
+
+    cur.execute("SELECT COUNT(*) FROM bank_ledger_staging")
+    total = cur.fetchone()[0]
+
+    # 同一份對帳單中內容相同的交易依行號編序，重複匯入同一份檔案會得到相同的 dedup_key
+    cur.execute("""
+        INSERT INTO bank_ledger (txn_date, payer, expense, income, note, dedup_key)
+        SELECT txn_date, payer, expense, income, note,
+               content_hash || '#' || ROW_NUMBER() OVER (PARTITION BY content_hash ORDER BY line_no)
+        FROM bank_ledger_staging
+        ON CONFLICT (dedup_key) DO NOTHING
+    """)
+    inserted = cur.rowcount
+
+    return {"total": total, "inserted": inserted, "skipped": total - inserted}
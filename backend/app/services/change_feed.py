@@ -0,0 +1,76 @@
+"""即時變更通知 - 一條 LISTEN 連線轉送給所有 SSE 訂閱者"""
+import asyncio
+import logging
+import threading
+import psycopg
+from app.config import get_db_config
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "miracle_changes"
+
+# 每個訂閱者最多暫存的事件數；跟不上時清空並改送 resync，請前端重新載入
+SUBSCRIBER_QUEUE_SIZE = 100
+RESYNC_EVENT = '{"op": "resync"}'
+
+class ChangeFeed:
+    """背景執行緒 LISTEN 資料庫通知，再分送到各訂閱者的 asyncio.Queue"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._loop = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """啟動背景 LISTEN 執行緒（事件會回到 loop 上分送）"""
+        if self._thread is not None:
+            return
+        self._loop = loop
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name="change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止背景執行緒"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _publish(self, payload: str):
+        """在 event loop 上執行：分送事件，慢速訂閱者改送 resync"""
+        for queue in self._subscribers:
+            if queue.full():
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC_EVENT)
+            else:
+                queue.put_nowait(payload)
+
+    def _listen(self):
+        """LISTEN 迴圈：斷線時重連，重連後通知訂閱者 resync（期間可能漏掉事件）"""
+        retry_delay = 1
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(**get_db_config(), autocommit=True) as conn:
+                    conn.execute(f"LISTEN {CHANNEL}")
+                    retry_delay = 1
+                    self._loop.call_soon_threadsafe(self._publish, RESYNC_EVENT)
+                    while not self._stop.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            self._loop.call_soon_threadsafe(self._publish, notify.payload)
+            except Exception as e:
+                logger.warning("變更通知連線中斷：%s，%d 秒後重試", e, retry_delay)
+                self._stop.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, 30)
+
+change_feed = ChangeFeed()
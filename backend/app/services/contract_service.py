@@ -3,6 +3,22 @@ from datetime import date
 from app.database import get_connection
 from app.utils.date_utils import add_months, subtract_days
 
+def leasing_periods(start_date: date, monthly_rent: float,
+                    payment_cycle_months: int, contract_months: int):
+    """依繳費週期切出租賃期別，產生 (start_date, end_date, period_rent)"""
+    total_periods = contract_months // payment_cycle_months
+    remaining_months = contract_months % payment_cycle_months
+    current_start = start_date
+    
+    for _ in range(total_periods):
+        current_end = subtract_days(add_months(current_start, payment_cycle_months), 1)
+        yield current_start, current_end, monthly_rent * payment_cycle_months
+        current_start = add_months(current_end, 1)
+    
+    if remaining_months > 0:
+        current_end = subtract_days(add_months(current_start, remaining_months), 1)
+        yield current_start, current_end, monthly_rent * remaining_months
+
 def generate_leasing_ar(contract_code: str, customer_code: str, customer_name: str,
                         start_date: date, monthly_rent: float,
                         payment_cycle_months: int, contract_months: int, conn):
@@ -10,28 +26,9 @@ def generate_leasing_ar(contract_code: str, customer_code: str, customer_name: s
     with conn.cursor() as cur:
         cur.execute("DELETE FROM ar_leasing WHERE contract_code = %s", (contract_code,))
         
-        total_periods = contract_months // payment_cycle_months
-        remaining_months = contract_months % payment_cycle_months
-        current_start = start_date
-        
-        for _ in range(total_periods):
-            current_end = subtract_days(add_months(current_start, payment_cycle_months), 1)
-            period_rent = monthly_rent * payment_cycle_months
-            
-            cur.execute("""
-                INSERT INTO ar_leasing 
-                (contract_code, customer_code, customer_name, start_date, end_date,
-                 total_rent, fee, received_amount, payment_status)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (contract_code, customer_code, customer_name, current_start, current_end,
-                  period_rent, 0, 0, '未收'))
-            
-            current_start = add_months(current_end, 1)
-        
-        if remaining_months > 0:
-            current_end = subtract_days(add_months(current_start, remaining_months), 1)
-            period_rent = monthly_rent * remaining_months
-            
+        for current_start, current_end, period_rent in leasing_periods(
+            start_date, monthly_rent, payment_cycle_months, contract_months
+        ):
             cur.execute("""
                 INSERT INTO ar_leasing 
                 (contract_code, customer_code, customer_name, start_date, end_date,
@@ -40,6 +37,31 @@ def generate_leasing_ar(contract_code: str, customer_code: str, customer_name: s
             """, (contract_code, customer_code, customer_name, current_start, current_end,
                   period_rent, 0, 0, '未收'))
 
+def generate_leasing_ar_batch(contracts, start_date: date, conn) -> int:
+    """批次生成多份租賃合約的應收帳款（以 COPY 一次寫入，呼叫前須先刪除舊帳款）
+
+    contracts 為 (contract_code, customer_code, customer_name, monthly_rent,
+    payment_cycle_months, contract_months) 的序列，回傳寫入的期數
+    """
+    count = 0
+    with conn.cursor() as cur:
+        with cur.copy("""
+            COPY ar_leasing
+            (contract_code, customer_code, customer_name, start_date, end_date,
+             total_rent, fee, received_amount, payment_status)
+            FROM STDIN
+        """) as copy:
+            for contract_code, customer_code, customer_name, monthly_rent, cycle, months in contracts:
+                if not (monthly_rent and months):
+                    continue
+                for current_start, current_end, period_rent in leasing_periods(
+                    start_date, monthly_rent, cycle, months
+                ):
+                    copy.write_row((contract_code, customer_code, customer_name,
+                                    current_start, current_end, period_rent, 0, 0, '未收'))
+                    count += 1
+    return count
+
 def generate_buyout_ar(contract_code: str, customer_code: str, customer_name: str,
                        deal_date: date, deal_amount: float, conn):
     """生成買斷應收帳款 - 重用現有邏輯"""
@@ -55,3 +77,50 @@ def generate_buyout_ar(contract_code: str, customer_code: str, customer_name: st
               deal_amount, 0, 0, '未收'))
 
 
+
+def generate_buyout_ar_batch(contracts, deal_date: date, conn) -> int:
+    """批次生成多份買斷合約的應收帳款（呼叫前須先刪除舊帳款）
+
+    contracts 為 (contract_code, customer_code, customer_name, deal_amount) 的序列，回傳寫入筆數
+    """
+    count = 0
+    with conn.cursor() as cur:
+        with cur.copy("""
+            COPY ar_buyout
+            (contract_code, customer_code, customer_name, deal_date,
+             total_amount, fee, received_amount, payment_status)
+            FROM STDIN
+        """) as copy:
+            for contract_code, customer_code, customer_name, deal_amount in contracts:
+                if not deal_amount:
+                    continue
+                copy.write_row((contract_code, customer_code, customer_name, deal_date,
+                                deal_amount, 0, 0, '未收'))
+                count += 1
+    return count
+
+def insert_leasing_ar(cur, contract_code: str, start_date: date, monthly_rent: float,
+                      payment_cycle_months: int, contract_months: int):
+    """以單一 INSERT ... SELECT 寫入租賃帳款（客戶欄位取自合約本身），可在 pipeline 中與合約寫入一起送出"""
+    periods = list(leasing_periods(start_date, monthly_rent, payment_cycle_months, contract_months))
+    cur.execute("""
+        INSERT INTO ar_leasing
+        (contract_code, customer_code, customer_name, start_date, end_date,
+         total_rent, fee, received_amount, payment_status)
+        SELECT c.contract_code, c.customer_code, c.customer_name,
+               p.start_date, p.end_date, p.total_rent, 0, 0, '未收'
+        FROM contracts_leasing c
+        CROSS JOIN unnest(%s::date[], %s::date[], %s::numeric[]) AS p(start_date, end_date, total_rent)
+        WHERE c.contract_code = %s
+    """, ([p[0] for p in periods], [p[1] for p in periods], [p[2] for p in periods], contract_code))
+
+def insert_buyout_ar(cur, contract_code: str, deal_date: date, deal_amount: float):
+    """寫入買斷帳款（客戶欄位取自合約本身），可在 pipeline 中與合約寫入一起送出"""
+    cur.execute("""
+        INSERT INTO ar_buyout
+        (contract_code, customer_code, customer_name, deal_date,
+         total_amount, fee, received_amount, payment_status)
+        SELECT contract_code, customer_code, customer_name, %s, %s, 0, 0, '未收'
+        FROM contracts_buyout
+        WHERE contract_code = %s
+    """, (deal_date, deal_amount, contract_code))
@@ -0,0 +1,104 @@
+"""就緒檢查 - 資料庫往返延遲、連線池使用量與近期錯誤率（/health/ready 使用）"""
+import time
+from collections import deque
+from psycopg_pool import PoolTimeout
+from app.config import get_settings
+from app.database import get_pool, get_replica_pools
+
+class RequestStats:
+    """以每秒一格統計近期請求數與 5xx 數（只在事件迴圈上呼叫，不需加鎖）"""
+
+    def __init__(self):
+        self._buckets = deque()  # [秒, 請求數, 錯誤數]
+
+    def record(self, status_code: int):
+        now = int(time.monotonic())
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0])
+            self._trim(now)
+        bucket = self._buckets[-1]
+        bucket[1] += 1
+        if status_code >= 500:
+            bucket[2] += 1
+
+    def _trim(self, now: int):
+        window = get_settings().ready_window_seconds
+        while self._buckets and self._buckets[0][0] <= now - window:
+            self._buckets.popleft()
+
+    def snapshot(self) -> dict:
+        self._trim(int(time.monotonic()))
+        requests = sum(b[1] for b in self._buckets)
+        errors = sum(b[2] for b in self._buckets)
+        return {
+            "window_seconds": get_settings().ready_window_seconds,
+            "requests": requests,
+            "errors": errors,
+            "error_rate": round(errors / requests, 4) if requests else 0.0,
+        }
+
+request_stats = RequestStats()
+
+def pool_stats(pool) -> dict:
+    stats = pool.get_stats()
+    size = stats.get("pool_size", 0)
+    available = stats.get("pool_available", 0)
+    return {
+        "size": size,
+        "max_size": stats.get("pool_max", pool.max_size),
+        "in_use": size - available,
+        "available": available,
+        # 逾時的等待者要等到有連線歸還才會移出佇列，連線池完全卡住時此數字只增不減
+        "waiting": stats.get("requests_waiting", 0),
+        # 以下為啟動後累計
+        "requests": stats.get("requests_num", 0),
+        "timeouts": stats.get("requests_errors", 0),
+        "connections_lost": stats.get("connections_lost", 0),
+    }
+
+def probe_database() -> dict:
+    """從主庫連線池取連線執行 SELECT 1，分別記錄等待連線與查詢往返的毫秒數"""
+    started = time.perf_counter()
+    try:
+        with get_pool().connection(timeout=get_settings().ready_probe_timeout) as conn:
+            acquired = time.perf_counter()
+            conn.execute("SELECT 1")
+            finished = time.perf_counter()
+    except PoolTimeout:
+        return {"ok": False, "error": "等待連線逾時（連線池已滿或資料庫無法連線）"}
+    except Exception as e:
+        return {"ok": False, "error": f"資料庫連線失敗：{e}"}
+    return {
+        "ok": True,
+        "acquire_ms": round((acquired - started) * 1000, 1),
+        "latency_ms": round((finished - acquired) * 1000, 1),
+    }
+
+def readiness(database: dict) -> dict:
+    """依探測結果、連線池與錯誤率判斷是否就緒；failures 列出超過的門檻"""
+    settings = get_settings()
+    primary = pool_stats(get_pool())
+    requests = request_stats.snapshot()
+
+    failures = []
+    if not database["ok"]:
+        failures.append(database["error"])
+    elif database["latency_ms"] > settings.ready_max_latency_ms:
+        failures.append(f"資料庫往返 {database['latency_ms']} ms，超過 {settings.ready_max_latency_ms} ms")
+    if primary["waiting"] > settings.ready_max_waiting:
+        failures.append(f"{primary['waiting']} 個請求等待連線，超過 {settings.ready_max_waiting}")
+    if requests["requests"] >= settings.ready_min_requests and requests["error_rate"] > settings.ready_max_error_rate:
+        failures.append(f"近 {requests['window_seconds']} 秒錯誤率 {requests['error_rate']:.0%}，超過 {settings.ready_max_error_rate:.0%}")
+
+    # 副本忙碌或離線時讀取會退回主庫，只列出狀態不影響就緒判斷
+    pools = {"primary": primary}
+    for pool in get_replica_pools():
+        pools[pool.name] = pool_stats(pool)
+
+    return {
+        "status": "not_ready" if failures else "ready",
+        "failures": failures,
+        "database": database,
+        "pools": pools,
+        "requests": requests,
+    }
@@ -0,0 +1,77 @@
+"""HTTP 快取 - 以資料表版本產生 ETag，資料未變動時回 304"""
+import hashlib
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import HTTPException, Request, Response
+from psycopg import errors
+from app.database import get_read_cursor
+
+# 本次請求計算 ETag 時讀到的資料表版本，報表查詢合併時作為 key 的一部分（見 single_flight.coalesce）
+_table_versions: ContextVar[Optional[tuple]] = ContextVar("table_versions", default=None)
+
+def current_table_versions() -> Optional[tuple]:
+    """本次請求 ETag 使用的資料表版本；尚未計算 ETag 時回傳 None"""
+    return _table_versions.get()
+
+def table_etag(request: Request, *tables: str) -> Optional[str]:
+    """依請求路徑、查詢參數與資料表版本產生 ETag（尚未建立 table_changes 時回傳 None）
+
+    GET 請求的讀取固定在同一條連線與快照（見 database.pinned_reads），版本與之後查詢的資料一致。
+    """
+    try:
+        with get_read_cursor() as cur:
+            cur.execute("""
+                SELECT table_name, string_agg(id::text, ',' ORDER BY id)
+                FROM table_changes
+                WHERE table_name = ANY(%s)
+                GROUP BY table_name
+            """, (list(tables),))
+            versions = dict(cur.fetchall())
+    except errors.UndefinedTable:
+        return None
+
+    table_versions = tuple((t, versions.get(t, '')) for t in tables)
+    _table_versions.set(table_versions)
+    key = "|".join([
+        request.url.path,
+        request.url.query,
+        *(f"{t}:{v}" for t, v in table_versions)
+    ])
+    # 回應可能再經過壓縮，使用弱 ETag
+    return f'W/"{hashlib.md5(key.encode()).hexdigest()}"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in candidates:
+        return True
+    return etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in candidates]
+
+def check_not_modified(request: Request, response: Response, *tables: str) -> Optional[Response]:
+    """若用戶端快取仍有效則回傳 304 回應；否則在 response 設定 ETag 並回傳 None"""
+    etag = table_etag(request, *tables)
+    if etag is None:
+        return None
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
+
+def parse_if_match(request: Request) -> Optional[int]:
+    """讀取 If-Match 的資料版本號（"3"、W/"3" 或 3）；未帶或為 * 時回傳 None（不檢查版本）"""
+    value = request.headers.get("if-match")
+    if not value or value.strip() == "*":
+        return None
+    tag = value.split(",")[0].strip().removeprefix("W/").strip('"')
+    try:
+        return int(tag)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match 應為資料的 version")
+
+def set_version_etag(response: Response, version: int):
+    """單筆資料回應以 version 作為 ETag，供之後修改時帶入 If-Match"""
+    response.headers["ETag"] = f'"{version}"'
@@ -0,0 +1,202 @@
+"""每月發票作業 - 一次查詢挑出當月應開立的帳款期別，批次建立發票並以多行程輸出發票文件"""
+import csv
+import html
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from app.utils.date_utils import add_months
+
+# 帳款金額已含 5% 營業稅（needs_invoice 合約建立時已加成）
+TAX_RATE = 0.05
+
+# 發票數量超過此數量才分散到多個行程輸出，少量資料直接在本行程處理較快
+PARALLEL_THRESHOLD = 200
+CHUNK_SIZE = 100
+
+# 同一時間只允許一個發票作業，發票號碼才能依月份連續編號
+_INVOICE_LOCK_KEY = "invoice_run"
+
+INVOICE_COLUMNS = [
+    'id', 'invoice_no', 'invoice_month', 'source', 'ar_id', 'contract_code',
+    'customer_code', 'customer_name', 'period_start', 'period_end',
+    'net_amount', 'tax_amount', 'total_amount', 'document_path', 'rendered_at'
+]
+
+# 租賃以期別起日、買斷以成交日歸入開立月份（兩者也是分割表的分割鍵）；
+# 已開立過的期別（同合約、同期別起日）不再開立，重跑同一個月份不會重複
+_CREATE_SQL = """
+    WITH billable AS (
+        SELECT 'leasing' AS source, a.id AS ar_id, a.contract_code, a.customer_code, a.customer_name,
+               a.start_date AS period_start, a.end_date AS period_end, a.total_rent AS total_amount
+        FROM ar_leasing a
+        JOIN contracts_leasing c ON c.contract_code = a.contract_code
+        WHERE c.needs_invoice AND c.status IS DISTINCT FROM 'paused'
+          AND a.start_date >= %(month)s AND a.start_date < %(next_month)s
+          AND COALESCE(a.total_rent, 0) > 0
+        UNION ALL
+        SELECT 'buyout', a.id, a.contract_code, a.customer_code, a.customer_name,
+               a.deal_date, a.deal_date, a.total_amount
+        FROM ar_buyout a
+        JOIN contracts_buyout c ON c.contract_code = a.contract_code
+        WHERE c.needs_invoice AND c.status IS DISTINCT FROM 'paused'
+          AND a.deal_date >= %(month)s AND a.deal_date < %(next_month)s
+          AND COALESCE(a.total_amount, 0) > 0
+    ),
+    pending AS (
+        SELECT b.*,
+               ROW_NUMBER() OVER (ORDER BY b.customer_code, b.contract_code, b.period_start, b.source) AS seq
+        FROM billable b
+        WHERE NOT EXISTS (
+            SELECT 1 FROM invoices i
+            WHERE i.source = b.source AND i.contract_code = b.contract_code
+              AND i.period_start = b.period_start
+        )
+    ),
+    issued AS (
+        SELECT COUNT(*) AS n FROM invoices WHERE invoice_month = %(month)s
+    )
+    INSERT INTO invoices
+    (invoice_no, invoice_month, source, ar_id, contract_code, customer_code, customer_name,
+     period_start, period_end, net_amount, tax_amount, total_amount)
+    SELECT to_char(%(month)s::date, 'YYYYMM') || '-' || lpad((issued.n + p.seq)::text, 5, '0'),
+           %(month)s, p.source, p.ar_id, p.contract_code, p.customer_code, p.customer_name,
+           p.period_start, p.period_end,
+           ROUND(p.total_amount / %(tax_factor)s),
+           p.total_amount - ROUND(p.total_amount / %(tax_factor)s),
+           p.total_amount
+    FROM pending p CROSS JOIN issued
+    ON CONFLICT (source, contract_code, period_start) DO NOTHING
+"""
+
+def month_start(value: str) -> date:
+    """解析 YYYY-MM（或 YYYY-MM-DD）為該月 1 日"""
+    parts = value.split("-")
+    if len(parts) < 2:
+        raise ValueError("月份格式應為 YYYY-MM")
+    return date(int(parts[0]), int(parts[1]), 1)
+
+def create_invoices(cur, month: date) -> int:
+    """建立 month 當月尚未開立的發票，回傳新增張數"""
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (_INVOICE_LOCK_KEY,))
+    cur.execute(_CREATE_SQL, {
+        "month": month,
+        "next_month": add_months(month, 1),
+        "tax_factor": 1 + TAX_RATE,
+    })
+    return cur.rowcount
+
+def load_invoices(cur, month: date, unrendered_only: bool = False):
+    """讀取 month 當月的發票"""
+    where_parts = ["invoice_month = %s"]
+    if unrendered_only:
+        where_parts.append("rendered_at IS NULL")
+    cur.execute(f"""
+        SELECT {', '.join(INVOICE_COLUMNS)}
+        FROM invoices
+        WHERE {' AND '.join(where_parts)}
+        ORDER BY id
+    """, (month,))
+    return [dict(zip(INVOICE_COLUMNS, row)) for row in cur.fetchall()]
+
+_SOURCE_LABELS = {'leasing': '租賃', 'buyout': '買斷'}
+
+def render_invoice_html(invoice) -> str:
+    period = str(invoice['period_start'])
+    if invoice['period_end'] and invoice['period_end'] != invoice['period_start']:
+        period += f" ~ {invoice['period_end']}"
+    rows = [
+        ("發票號碼", invoice['invoice_no']),
+        ("客戶", f"{invoice['customer_name'] or ''}（{invoice['customer_code'] or ''}）"),
+        ("合約", f"{invoice['contract_code']}（{_SOURCE_LABELS.get(invoice['source'], invoice['source'])}）"),
+        ("期間", period),
+        ("銷售額", f"{invoice['net_amount']:,.0f}"),
+        ("營業稅", f"{invoice['tax_amount']:,.0f}"),
+        ("總計", f"{invoice['total_amount']:,.0f}"),
+    ]
+    body = "\n".join(
+        f"<tr><th>{html.escape(label)}</th><td>{html.escape(str(value))}</td></tr>"
+        for label, value in rows
+    )
+    return (
+        '<!DOCTYPE html>\n<html lang="zh-Hant"><head><meta charset="utf-8">'
+        f"<title>發票 {html.escape(invoice['invoice_no'])}</title></head>\n"
+        f"<body><h1>發票</h1>\n<table>\n{body}\n</table></body></html>\n"
+    )
+
+def _render_chunk(invoices, output_dir: str):
+    """輸出一批發票的 HTML 文件，回傳 [(發票 id, 檔案路徑), ...]"""
+    results = []
+    for invoice in invoices:
+        path = os.path.join(output_dir, f"{invoice['invoice_no']}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(render_invoice_html(invoice))
+        results.append((invoice['id'], path))
+    return results
+
+def render_invoices(invoices, output_dir: str):
+    """輸出發票文件，大量發票時以多行程平行輸出"""
+    os.makedirs(output_dir, exist_ok=True)
+    if len(invoices) < PARALLEL_THRESHOLD:
+        return _render_chunk(invoices, output_dir)
+
+    chunks = [invoices[i:i + CHUNK_SIZE] for i in range(0, len(invoices), CHUNK_SIZE)]
+    # 使用 spawn：web 行程內有連線池執行緒，fork 不安全
+    with ProcessPoolExecutor(
+        max_workers=min(os.cpu_count() or 1, len(chunks)),
+        mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = [executor.submit(_render_chunk, chunk, output_dir) for chunk in chunks]
+        return [item for future in futures for item in future.result()]
+
+def mark_rendered(cur, rendered) -> int:
+    """記錄發票文件路徑與輸出時間"""
+    if not rendered:
+        return 0
+    cur.execute("""
+        UPDATE invoices i
+        SET document_path = r.path, rendered_at = CURRENT_TIMESTAMP
+        FROM unnest(%s::int[], %s::text[]) AS r(id, path)
+        WHERE i.id = r.id
+    """, ([r[0] for r in rendered], [r[1] for r in rendered]))
+    return cur.rowcount
+
+def write_summary_csv(invoices, path: str):
+    """輸出當月發票清單（每次重寫整個月份）"""
+    columns = [c for c in INVOICE_COLUMNS if c not in ('id', 'ar_id', 'rendered_at')]
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for invoice in invoices:
+            writer.writerow([invoice[c] for c in columns])
+
+def run_monthly_invoices(conn, month: date, output_dir: str, rerender: bool = False) -> dict:
+    """執行每月發票作業：建立發票 → 輸出尚未輸出（或 rerender 時全部）的文件 → 輸出當月清單
+
+    可重複執行：已開立的期別不會重複建立，已輸出的文件不會重新輸出
+    """
+    with conn.cursor() as cur:
+        created = create_invoices(cur, month)
+    conn.commit()
+
+    month_dir = os.path.join(output_dir, month.strftime("%Y-%m"))
+    with conn.cursor() as cur:
+        pending = load_invoices(cur, month, unrendered_only=not rerender)
+    rendered = render_invoices(pending, month_dir) if pending else []
+    with conn.cursor() as cur:
+        mark_rendered(cur, rendered)
+        invoices = load_invoices(cur, month)
+    conn.commit()
+
+    summary_path = os.path.join(month_dir, f"invoices-{month.strftime('%Y-%m')}.csv")
+    os.makedirs(month_dir, exist_ok=True)
+    write_summary_csv(invoices, summary_path)
+
+    return {
+        "month": month.strftime("%Y-%m"),
+        "created": created,
+        "rendered": len(rendered),
+        "total": len(invoices),
+        "total_amount": float(sum(i['total_amount'] for i in invoices)),
+        "summary_path": summary_path,
+    }
@@ -0,0 +1,148 @@
+"""背景工作類型 - 每個類型的處理函式、併發上限、重試次數與退避秒數
+
+處理函式簽名為 handler(conn, payload, ctx) -> dict：
+conn 為 worker 專用連線（由處理函式自行 commit），ctx.progress(done, total, message) 回報進度，
+回傳值會以 JSON 存入 jobs.result。payload 格式錯誤請拋出 ValueError（不會重試）。
+"""
+import os
+from datetime import date
+from app.config import get_settings
+from app.services.accounts_export import EXPORT_FILES, export_accounts
+from app.services.ar_archive import ARCHIVE_KEYS, archive_table
+from app.services.contract_service import generate_buyout_ar_batch, generate_leasing_ar_batch
+from app.services.invoice_run import month_start, run_monthly_invoices
+from app.services.reconciliation import load_open_receivables, load_unreconciled_entries, match_entries
+from app.utils.date_utils import add_months
+
+class JobType:
+    def __init__(self, handler, concurrency: int = 1, max_attempts: int = 3, backoff_seconds: int = 30):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+
+def run_invoices(conn, payload, ctx):
+    """每月發票：{"month": "YYYY-MM", "rerender": false}"""
+    month = month_start(str(payload["month"]))
+    ctx.progress(message=f"開立 {month:%Y-%m} 發票")
+    return run_monthly_invoices(conn, month, get_settings().invoice_dir, bool(payload.get("rerender")))
+
+def archive_receivables(conn, payload, ctx):
+    """封存已收款的歷史帳款：{"years": 3, "table": "ar_leasing"（選用）}"""
+    years = int(payload.get("years", 3))
+    table = payload.get("table")
+    if table is not None and table not in ARCHIVE_KEYS:
+        raise ValueError(f"不支援的資料表：{table}")
+    cutoff = add_months(date.today(), -12 * years)
+    result = {"cutoff": cutoff.isoformat()}
+    for name in [table] if table else list(ARCHIVE_KEYS):
+        result[name] = archive_table(
+            conn, name, cutoff,
+            on_batch=lambda moved, name=name: ctx.progress(moved, message=f"{name}: 已封存 {moved} 筆")
+        )
+    return result
+
+def export_accounts_csv(conn, payload, ctx):
+    """帳款匯出（同帳款頁面的匯出 Excel）：
+    {"receivables": {...}, "payables": {...}, "service": {...}}，各為對應列表 API 的查詢參數（皆可省略）
+    """
+    directory = os.path.join(get_settings().export_dir, f"accounts_{ctx.job_id}")
+    files = export_accounts(
+        conn, directory, payload.get("receivables"), payload.get("payables"), payload.get("service"),
+        on_file=lambda done: ctx.progress(done, len(EXPORT_FILES))
+    )
+    return {"directory": directory, "files": files}
+
+def rebuild_dashboard(conn, payload, ctx):
+    """全部重算儀表板彙總表：{}"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT rebuild_dashboard_rollups()")
+    conn.commit()
+    return {"status": "ok"}
+
+def propose_reconciliation(conn, payload, ctx):
+    """銀行對帳比對（同 GET /api/bank-ledger/reconciliation 的參數），結果為候選清單"""
+    with conn.cursor() as cur:
+        entries = load_unreconciled_entries(cur, payload.get("from_date"), payload.get("to_date"))
+        receivables = load_open_receivables(cur) if entries else []
+    conn.commit()
+    ctx.progress(0, len(entries), f"比對 {len(entries)} 筆入帳")
+
+    proposals = match_entries(
+        receivables, entries,
+        int(payload.get("window_days", 10)), int(payload.get("amount_tolerance", 0)), int(payload.get("limit", 3))
+    )
+    for item in proposals:
+        item['txn_date'] = item['txn_date'].strftime('%Y-%m-%d')
+        for candidate in item['candidates']:
+            candidate['due_date'] = candidate['due_date'].strftime('%Y-%m-%d')
+    return {"proposals": proposals}
+
+# 重建帳款每批處理的合約數（每批一個交易）
+REGENERATE_BATCH_SIZE = 200
+
+def regenerate_receivables(conn, payload, ctx):
+    """依合約重新產生應收帳款（已收金額會一併清除，與修改合約相同）：
+    {"contract_type": "leasing" | "buyout", "customer_code": "...", "contract_codes": [...]}
+    """
+    contract_type = payload.get("contract_type")
+    if contract_type not in ("leasing", "buyout"):
+        raise ValueError("contract_type 應為 leasing 或 buyout")
+    where_parts = ["status IS DISTINCT FROM 'paused'"]
+    params = []
+    if payload.get("customer_code"):
+        where_parts.append("customer_code = %s")
+        params.append(payload["customer_code"])
+    if payload.get("contract_codes"):
+        where_parts.append("contract_code = ANY(%s)")
+        params.append(list(payload["contract_codes"]))
+    if len(where_parts) == 1:
+        raise ValueError("請指定 customer_code 或 contract_codes")
+
+    if contract_type == "leasing":
+        columns = "contract_code, customer_code, customer_name, monthly_rent, payment_cycle_months, contract_months, start_date"
+    else:
+        columns = "contract_code, customer_code, customer_name, deal_amount, deal_date"
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT contract_code FROM contracts_{contract_type}
+            WHERE {' AND '.join(where_parts)}
+            ORDER BY contract_code
+        """, tuple(params))
+        codes = [row[0] for row in cur.fetchall()]
+    conn.commit()
+
+    periods = 0
+    for i in range(0, len(codes), REGENERATE_BATCH_SIZE):
+        batch = codes[i:i + REGENERATE_BATCH_SIZE]
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT {columns} FROM contracts_{contract_type}
+                WHERE contract_code = ANY(%s) AND status IS DISTINCT FROM 'paused'
+                ORDER BY contract_code
+                FOR UPDATE
+            """, (batch,))
+            rows = cur.fetchall()
+            cur.execute(f"DELETE FROM ar_{contract_type} WHERE contract_code = ANY(%s)", ([r[0] for r in rows],))
+        # 批次 COPY 以同一個起始日產生帳款，依各合約的起租日／成交日分組
+        by_date = {}
+        for row in rows:
+            amount = float(row[3]) if row[3] else None
+            by_date.setdefault(row[-1], []).append((*row[:3], amount, *row[4:-1]))
+        generate = generate_leasing_ar_batch if contract_type == "leasing" else generate_buyout_ar_batch
+        for start, contracts in by_date.items():
+            if start is not None:
+                periods += generate(contracts, start, conn)
+        conn.commit()
+        ctx.progress(min(i + REGENERATE_BATCH_SIZE, len(codes)), len(codes))
+
+    return {"contracts": len(codes), "ar_periods": periods}
+
+JOB_TYPES = {
+    "invoice_run": JobType(run_invoices, concurrency=1),
+    "archive_ar": JobType(archive_receivables, concurrency=1),
+    "dashboard_rebuild": JobType(rebuild_dashboard, concurrency=1),
+    "accounts_export": JobType(export_accounts_csv, concurrency=2),
+    "reconciliation": JobType(propose_reconciliation, concurrency=2, max_attempts=1),
+    "ar_regenerate": JobType(regenerate_receivables, concurrency=2),
+}
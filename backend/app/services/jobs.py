@@ -0,0 +1,268 @@
+"""背景工作 - 以 Postgres 的 jobs 資料表排程，worker 行程取出執行（需先執行 sql/010_jobs.sql）
+
+排入工作時 NOTIFY，閒置的 worker 立即取出；取工作時依類型限制同時執行的數量。
+失敗時依退避秒數（每次加倍）重新排入，超過重試次數即標記失敗；
+worker 停止回應（心跳逾時）的工作會由其他 worker 重新排入。
+"""
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Optional
+import psycopg
+from app.config import get_db_config, get_settings
+from app.services.job_handlers import JOB_TYPES
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "miracle_jobs"
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+
+# 執行中的工作每隔幾秒更新心跳；超過 STALE_SECONDS 沒有心跳視為 worker 已停止
+HEARTBEAT_SECONDS = 15
+STALE_SECONDS = 120
+# 退避上限（秒）
+MAX_BACKOFF_SECONDS = 3600
+# 關閉時等待 worker 完成目前工作的秒數，逾時直接終止（工作會在心跳逾時後重新排入）
+SHUTDOWN_TIMEOUT = 10
+
+# 同一時間只有一個 worker 在取工作，依類型計算的併發上限才不會被同時超過
+_CLAIM_LOCK_KEY = "jobs_claim"
+
+JOB_COLUMNS = [
+    'id', 'job_type', 'payload', 'status', 'attempts', 'max_attempts', 'run_after',
+    'progress_done', 'progress_total', 'progress_message', 'result', 'error', 'worker',
+    'created_at', 'started_at', 'heartbeat_at', 'finished_at'
+]
+
+def enqueue_job(cur, job_type: str, payload=None, run_after=None) -> dict:
+    """排入工作並通知 worker（交易提交後才會被取出），回傳工作資料"""
+    spec = JOB_TYPES[job_type]
+    cur.execute(f"""
+        INSERT INTO jobs (job_type, payload, max_attempts, run_after)
+        VALUES (%s, %s::jsonb, %s, COALESCE(%s, CURRENT_TIMESTAMP))
+        RETURNING {', '.join(JOB_COLUMNS)}
+    """, (job_type, json.dumps(payload or {}), spec.max_attempts, run_after))
+    job = dict(zip(JOB_COLUMNS, cur.fetchone()))
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, job_type))
+    return job
+
+def get_job(cur, job_id: int):
+    cur.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = %s", (job_id,))
+    row = cur.fetchone()
+    return dict(zip(JOB_COLUMNS, row)) if row else None
+
+def list_jobs(cur, status=None, job_type=None, limit: int = 50):
+    where_parts = []
+    params = []
+    if status:
+        where_parts.append("status = %s")
+        params.append(status)
+    if job_type:
+        where_parts.append("job_type = %s")
+        params.append(job_type)
+    where_clause = "WHERE " + " AND ".join(where_parts) if where_parts else ""
+    params.append(limit)
+    cur.execute(f"""
+        SELECT {', '.join(JOB_COLUMNS)} FROM jobs
+        {where_clause}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """, tuple(params))
+    return [dict(zip(JOB_COLUMNS, row)) for row in cur.fetchall()]
+
+def cancel_job(cur, job_id: int):
+    """取消排隊中的工作，回傳更新後的工作（已開始或已結束的工作不變）"""
+    cur.execute("""
+        UPDATE jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+        WHERE id = %s AND status = 'queued'
+    """, (job_id,))
+    return get_job(cur, job_id)
+
+def claim_job(conn, worker: str):
+    """取出下一個可執行的工作（conn 為 autocommit 連線），沒有時回傳 None"""
+    types = list(JOB_TYPES)
+    with conn.transaction():
+        conn.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (_CLAIM_LOCK_KEY,))
+        row = conn.execute("""
+            WITH limits AS (
+                SELECT * FROM unnest(%s::text[], %s::int[]) AS l(job_type, concurrency)
+            ),
+            running AS (
+                SELECT job_type, COUNT(*) AS n FROM jobs
+                WHERE status = 'running' AND job_type = ANY(%s)
+                GROUP BY job_type
+            )
+            UPDATE jobs
+            SET status = 'running', attempts = attempts + 1, worker = %s, error = NULL,
+                started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP,
+                progress_done = NULL, progress_total = NULL, progress_message = NULL
+            WHERE id = (
+                SELECT j.id FROM jobs j
+                JOIN limits l ON l.job_type = j.job_type
+                LEFT JOIN running r ON r.job_type = j.job_type
+                WHERE j.status = 'queued' AND j.run_after <= CURRENT_TIMESTAMP
+                  AND COALESCE(r.n, 0) < l.concurrency
+                ORDER BY j.run_after, j.id
+                LIMIT 1
+                FOR UPDATE OF j SKIP LOCKED
+            )
+            RETURNING id, job_type, payload, attempts, max_attempts
+        """, (types, [JOB_TYPES[t].concurrency for t in types], types, worker)).fetchone()
+    if not row:
+        return None
+    return dict(zip(['id', 'job_type', 'payload', 'attempts', 'max_attempts'], row))
+
+def requeue_stale_jobs(conn) -> int:
+    """心跳逾時的工作：還有重試次數就重新排入，否則標記失敗"""
+    cur = conn.execute("""
+        UPDATE jobs
+        SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+            finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE CURRENT_TIMESTAMP END,
+            run_after = CURRENT_TIMESTAMP,
+            error = 'worker 停止回應，工作中斷'
+        WHERE status = 'running'
+          AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+    """, (STALE_SECONDS,))
+    return cur.rowcount
+
+class JobContext:
+    """傳給處理函式，回報進度（同時更新心跳）"""
+
+    def __init__(self, conn, job_id: int):
+        self._conn = conn
+        self.job_id = job_id
+
+    def progress(self, done=None, total=None, message=None):
+        self._conn.execute("""
+            UPDATE jobs
+            SET progress_done = COALESCE(%s, progress_done),
+                progress_total = COALESCE(%s, progress_total),
+                progress_message = COALESCE(%s, progress_message),
+                heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """, (done, total, message, self.job_id))
+
+    def heartbeat(self):
+        self._conn.execute("UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE id = %s", (self.job_id,))
+
+def _heartbeat_loop(ctx: JobContext, done: threading.Event):
+    while not done.wait(HEARTBEAT_SECONDS):
+        try:
+            ctx.heartbeat()
+        except Exception as e:
+            logger.warning("工作 %s 心跳更新失敗：%s", ctx.job_id, e)
+
+def execute_job(control, work, job):
+    """執行一個已取出的工作並記錄結果；control 為 autocommit 連線，work 交給處理函式使用"""
+    spec = JOB_TYPES[job['job_type']]
+    ctx = JobContext(control, job['id'])
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat_loop, args=(ctx, done), daemon=True)
+    heartbeat.start()
+    try:
+        result = spec.handler(work, job['payload'] or {}, ctx)
+        work.commit()
+    except Exception as e:
+        work.rollback()
+        # payload 錯誤重試也不會成功，直接標記失敗
+        retry = job['attempts'] < job['max_attempts'] and not isinstance(e, (ValueError, KeyError, TypeError))
+        backoff = min(spec.backoff_seconds * 2 ** (job['attempts'] - 1), MAX_BACKOFF_SECONDS)
+        logger.warning("工作 %s（%s）第 %d 次執行失敗：%s", job['id'], job['job_type'], job['attempts'], e)
+        control.execute("""
+            UPDATE jobs
+            SET status = %s, error = %s,
+                run_after = CURRENT_TIMESTAMP + make_interval(secs => %s),
+                finished_at = CASE WHEN %s THEN NULL ELSE CURRENT_TIMESTAMP END
+            WHERE id = %s
+        """, ('queued' if retry else 'failed', f"{type(e).__name__}: {e}", backoff, retry, job['id']))
+    else:
+        control.execute("""
+            UPDATE jobs
+            SET status = 'succeeded', result = %s::jsonb, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """, (json.dumps(result, default=str), job['id']))
+    finally:
+        done.set()
+        heartbeat.join()
+
+def _wait(stop_flag, seconds: float):
+    """等待 seconds 秒，期間收到停止通知即返回"""
+    deadline = time.monotonic() + seconds
+    while not stop_flag.value and time.monotonic() < deadline:
+        time.sleep(min(0.5, max(0.0, deadline - time.monotonic())))
+
+def run_worker(worker: str, stop_flag, parent_pid=None):
+    """worker 主迴圈：取工作執行，沒有工作時等待 NOTIFY（最多 job_poll_seconds 秒）；斷線時重連"""
+    # Ctrl+C 與關機時的 SIGTERM 常送到整個行程群組；worker 收到後只設定停止旗標，做完目前工作再結束
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: setattr(stop_flag, "value", True))
+    poll_seconds = get_settings().job_poll_seconds
+    retry_delay = 1
+    while not stop_flag.value:
+        try:
+            with psycopg.connect(**get_db_config(), autocommit=True) as control, \
+                    psycopg.connect(**get_db_config()) as work:
+                control.execute(f"LISTEN {CHANNEL}")
+                retry_delay = 1
+                last_sweep = 0.0
+                while not stop_flag.value:
+                    # 父行程已結束（例如被強制終止）時一併結束
+                    if parent_pid and os.getppid() != parent_pid:
+                        return
+                    if time.monotonic() - last_sweep > HEARTBEAT_SECONDS:
+                        requeue_stale_jobs(control)
+                        last_sweep = time.monotonic()
+                    job = claim_job(control, worker)
+                    if job is None:
+                        for _ in control.notifies(timeout=poll_seconds, stop_after=1):
+                            pass
+                        continue
+                    execute_job(control, work, job)
+        except Exception as e:
+            logger.warning("背景工作 worker %s 連線中斷：%s，%d 秒後重試", worker, e, retry_delay)
+            _wait(stop_flag, retry_delay)
+            retry_delay = min(retry_delay * 2, 30)
+
+class JobWorkers:
+    """隨 API 啟動的 worker 行程（spawn，不共用 web 行程的連線池）"""
+
+    def __init__(self):
+        self._processes = []
+        self._stop = None
+
+    def start(self, count: int):
+        if self._processes or count <= 0:
+            return
+        mp = multiprocessing.get_context("spawn")
+        # 停止旗標不用 mp.Event：worker 在 Event.wait() 中被終止時，之後的 set() 會永遠等不到它
+        self._stop = mp.Value("b", False, lock=False)
+        for i in range(count):
+            name = f"{socket.gethostname()}:{os.getpid()}:{i}"
+            # 非 daemon：處理函式（對帳、發票）可能再開行程池
+            process = mp.Process(target=run_worker, args=(name, self._stop, os.getpid()),
+                                 name=f"job-worker-{i}", daemon=False)
+            process.start()
+            self._processes.append(process)
+
+    def stop(self, timeout: Optional[float] = SHUTDOWN_TIMEOUT):
+        """通知 worker 結束並等待 timeout 秒（None = 等到目前的工作完成），逾時直接終止"""
+        if not self._processes:
+            return
+        self._stop.value = True
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for process in self._processes:
+            process.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        for process in self._processes:
+            if process.is_alive():
+                # worker 收到 SIGTERM 只會設定停止旗標，逾時須以 SIGKILL 終止
+                process.kill()
+                process.join()
+        self._processes = []
+
+job_workers = JobWorkers()
@@ -0,0 +1,80 @@
+"""串流 JSON 回應 - 以伺服器端游標分批讀取並逐段輸出 JSON 陣列，記憶體用量不隨筆數增加
+
+錯誤處理：
+- 所有查詢在端點內先執行（DECLARE 伺服器端游標），語法、權限等錯誤仍回 500。
+- 輸出開始後（狀態碼 200 已送出）讀取失敗時，結尾改為輸出一行 {"error": ...} 且不補上 ]：
+  整份內容不是合法 JSON，用戶端解析失敗，不會把不完整的資料當成完整結果。
+- 讀取連線在串流結束、用戶端中途斷線或回應未開始輸出時都會歸還。
+"""
+import json
+import logging
+import anyio
+from fastapi.responses import StreamingResponse
+from app.database import return_read_connection, take_read_connection
+
+logger = logging.getLogger(__name__)
+
+# 每次向資料庫取回的筆數（也是每段輸出的筆數上限）
+FETCH_SIZE = 1000
+
+def _iter_json_array(streams, convert):
+    yield "["
+    first = True
+    try:
+        for stream in streams:
+            while True:
+                rows = stream.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                chunk = ",".join(json.dumps(convert(row), ensure_ascii=False) for row in rows)
+                yield chunk if first else "," + chunk
+                first = False
+    except Exception:
+        logger.exception("串流報表讀取失敗")
+        yield "\n" + json.dumps({"error": "讀取資料失敗，結果不完整"}, ensure_ascii=False)
+        return
+    yield "]"
+
+def _close(iterator, streams, pool, conn):
+    """結束串流並歸還連線"""
+    if iterator is not None:
+        iterator.close()
+    for stream in streams:
+        try:
+            stream.close()
+        except Exception:
+            pass  # 交易已中止時游標隨回滾一併釋放
+    return_read_connection(pool, conn)
+
+class _ReadStreamingResponse(StreamingResponse):
+    """回應結束後（包含用戶端斷線）歸還讀取連線"""
+
+    def __init__(self, iterator, release, **kwargs):
+        super().__init__(iterator, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # 斷線時所在的範圍可能已被取消，遮蔽取消以確保連線歸還
+            with anyio.CancelScope(shield=True):
+                await anyio.to_thread.run_sync(self._release)
+
+def stream_json_array(statements, convert) -> StreamingResponse:
+    """依序執行 statements（[(sql, params), ...]），每列經 convert 轉為 dict 後串流輸出為單一 JSON 陣列"""
+    # 在端點內接手讀取連線：與 ETag 使用同一個快照，且請求處理結束後仍可繼續讀取
+    pool, conn = take_read_connection()
+    streams = []
+    try:
+        for index, (sql, params) in enumerate(statements):
+            stream = conn.cursor(name=f"report_stream_{index}")
+            streams.append(stream)
+            stream.execute(sql, params)
+    except BaseException:
+        _close(None, streams, pool, conn)
+        raise
+
+    iterator = _iter_json_array(streams, convert)
+    return _ReadStreamingResponse(
+        iterator, lambda: _close(iterator, streams, pool, conn), media_type="application/json")
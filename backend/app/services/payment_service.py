@@ -0,0 +1,159 @@
+"""收款沖帳服務 - 以集合式 SQL 將收款依 FIFO 沖銷最舊的未結清期別"""
+from decimal import Decimal
+
+# 未結清的帳款狀態，與帳齡分析相同
+OPEN_AR_STATUSES = ['未收', '部分收款']
+
+# 同一時間只允許一批收款沖帳，避免兩批收款重複沖銷同一期
+_PAYMENT_LOCK_KEY = "ar_payments"
+
+# 先鎖定本批可能沖銷的未結清期別，分配與更新之間不會被對帳確認等其他寫入改動
+_LOCK_SQL = """
+    SELECT id FROM {table}
+    WHERE payment_status = ANY(%(statuses)s)
+      AND (contract_code IN (SELECT contract_code FROM payment_receipts WHERE contract_code IS NOT NULL)
+           OR customer_code IN (SELECT customer_code FROM payment_receipts
+                                WHERE contract_code IS NULL AND customer_code IS NOT NULL))
+    ORDER BY id
+    FOR UPDATE
+"""
+
+# 依 key（contract_code 或 customer_code）分組：
+# 期別依到期日排成連續區間 [p_start, p_start + balance)，收款依日期排成 [r_start, r_start + amount)，
+# 兩區間的重疊即為該筆收款沖到該期的金額。
+# 未收金額 = 應收 + 手續費 - 已收（同 open_balance），再扣除本批前一輪已沖的金額；
+# 沒有到期日的期別排最後（NULL 在遞增排序中排最後）
+_ALLOCATE_SQL = """
+    WITH targets AS (
+        SELECT DISTINCT {key} AS target FROM payment_receipts WHERE {receipt_filter}
+    ),
+    allocated AS (
+        SELECT source, ar_id, SUM(applied) AS applied
+        FROM payment_allocations
+        GROUP BY source, ar_id
+    ),
+    open_ar AS (
+        SELECT 'leasing' AS source, a.id, a.{key} AS target, a.end_date AS due_date,
+               COALESCE(a.total_rent, 0) + COALESCE(a.fee, 0) - COALESCE(a.received_amount, 0)
+               - COALESCE(t.applied, 0) AS balance
+        FROM ar_leasing a
+        LEFT JOIN allocated t ON t.source = 'leasing' AND t.ar_id = a.id
+        WHERE a.payment_status = ANY(%(statuses)s) AND a.{key} IN (SELECT target FROM targets)
+        UNION ALL
+        SELECT 'buyout' AS source, a.id, a.{key} AS target, a.deal_date AS due_date,
+               COALESCE(a.total_amount, 0) + COALESCE(a.fee, 0) - COALESCE(a.received_amount, 0)
+               - COALESCE(t.applied, 0) AS balance
+        FROM ar_buyout a
+        LEFT JOIN allocated t ON t.source = 'buyout' AND t.ar_id = a.id
+        WHERE a.payment_status = ANY(%(statuses)s) AND a.{key} IN (SELECT target FROM targets)
+    ),
+    periods AS (
+        SELECT source, id, target, balance,
+               SUM(balance) OVER (PARTITION BY target ORDER BY due_date, source, id) - balance AS p_start
+        FROM open_ar
+        WHERE balance > 0
+    ),
+    receipts AS (
+        SELECT seq, {key} AS target, amount,
+               SUM(amount) OVER (PARTITION BY {key} ORDER BY paid_date, seq) - amount AS r_start
+        FROM payment_receipts
+        WHERE {receipt_filter}
+    )
+    INSERT INTO payment_allocations (seq, source, ar_id, applied)
+    SELECT r.seq, p.source, p.id,
+           LEAST(r.r_start + r.amount, p.p_start + p.balance) - GREATEST(r.r_start, p.p_start)
+    FROM receipts r
+    JOIN periods p ON p.target = r.target
+     AND p.p_start < r.r_start + r.amount
+     AND r.r_start < p.p_start + p.balance
+"""
+
+# 兩輪分配完成後每個資料表只更新一次；繳費狀況同 period_status
+_UPDATE_SQL = """
+    UPDATE {table} a
+    SET received_amount = COALESCE(a.received_amount, 0) + t.applied,
+        payment_status = CASE
+            WHEN COALESCE(a.{amount_column}, 0) + COALESCE(a.fee, 0)
+                 - COALESCE(a.received_amount, 0) - t.applied <= 0 THEN '已收款'
+            ELSE '部分收款'
+        END
+    FROM (
+        SELECT ar_id, SUM(applied) AS applied
+        FROM payment_allocations
+        WHERE source = %s
+        GROUP BY ar_id
+    ) t
+    WHERE a.id = t.ar_id
+"""
+
+_AR_SOURCES = (
+    ("leasing", "ar_leasing", "total_rent"),
+    ("buyout", "ar_buyout", "total_amount"),
+)
+
+# 先沖指定合約的收款，再以指定客戶的收款沖銷剩餘的未收金額
+_PASSES = (
+    ("contract_code", "contract_code IS NOT NULL"),
+    ("customer_code", "contract_code IS NULL AND customer_code IS NOT NULL"),
+)
+
+def open_balance(amount, fee, received) -> Decimal:
+    """未收金額 = 應收 + 手續費 - 已收（與前端帳款頁的「未收金額」及 _ALLOCATE_SQL 的 balance 相同）"""
+    return Decimal(amount or 0) + Decimal(fee or 0) - Decimal(received or 0)
+
+def period_status(amount, fee, received) -> str:
+    """沖帳後的繳費狀況：未收金額歸零為已收款，否則為部分收款"""
+    return '已收款' if open_balance(amount, fee, received) <= 0 else '部分收款'
+
+def apply_payments(cur, receipts) -> dict:
+    """沖銷一批收款：先處理指定合約的收款，再以指定客戶的收款沖銷剩餘期別"""
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (_PAYMENT_LOCK_KEY,))
+    cur.execute("""
+        CREATE TEMP TABLE payment_receipts (
+            seq INT PRIMARY KEY, contract_code TEXT, customer_code TEXT,
+            amount NUMERIC(14, 2), paid_date DATE
+        ) ON COMMIT DROP
+    """)
+    cur.execute("""
+        CREATE TEMP TABLE payment_allocations (
+            seq INT, source TEXT, ar_id INT, applied NUMERIC(14, 2)
+        ) ON COMMIT DROP
+    """)
+    with cur.copy("COPY payment_receipts (seq, contract_code, customer_code, amount, paid_date) FROM STDIN") as copy:
+        for seq, receipt in enumerate(receipts):
+            copy.write_row((seq, receipt.contract_code, receipt.customer_code,
+                            receipt.amount, receipt.paid_date))
+
+    for _, table, _ in _AR_SOURCES:
+        cur.execute(_LOCK_SQL.format(table=table), {"statuses": OPEN_AR_STATUSES})
+    for key, receipt_filter in _PASSES:
+        cur.execute(_ALLOCATE_SQL.format(key=key, receipt_filter=receipt_filter), {"statuses": OPEN_AR_STATUSES})
+    for source, table, amount_column in _AR_SOURCES:
+        cur.execute(_UPDATE_SQL.format(table=table, amount_column=amount_column), (source,))
+
+    cur.execute("SELECT COUNT(DISTINCT (source, ar_id)) FROM payment_allocations")
+    updated_periods = cur.fetchone()[0]
+
+    cur.execute("""
+        SELECT r.seq, r.amount, COALESCE(SUM(a.applied), 0)
+        FROM payment_receipts r
+        LEFT JOIN payment_allocations a ON a.seq = r.seq
+        GROUP BY r.seq, r.amount
+        ORDER BY r.seq
+    """)
+    results = [
+        {
+            "index": seq,
+            "amount": float(amount),
+            "applied_amount": float(applied),
+            "unapplied_amount": float(amount - applied),
+        }
+        for seq, amount, applied in cur.fetchall()
+    ]
+
+    return {
+        "receipts": results,
+        "total_amount": sum(r["amount"] for r in results),
+        "applied_amount": sum(r["applied_amount"] for r in results),
+        "updated_periods": updated_periods,
+    }
@@ -0,0 +1,231 @@
+"""銀行對帳比對 - 以金額分桶、日期排序建立未結清應收帳款索引，為每筆入帳挑出候選帳款"""
+import bisect
+import heapq
+import multiprocessing
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from app.services.payment_service import OPEN_AR_STATUSES, open_balance, period_status
+
+# 入帳筆數超過此數量才分散到多個行程計分，少量資料直接在本行程處理較快
+PARALLEL_THRESHOLD = 2000
+
+# 計分權重：金額完全相符、日期越接近、摘要含客戶名稱或代碼，分數越高
+SCORE_EXACT_AMOUNT = 50
+SCORE_DATE = 30
+SCORE_CUSTOMER_HINT = 40
+
+class ReceivableIndex:
+    """未結清應收帳款索引：金額（元）分桶，桶內依到期日排序"""
+
+    def __init__(self, receivables):
+        self.receivables = receivables
+        buckets = defaultdict(list)
+        for i, ar in enumerate(receivables):
+            buckets[round(ar['balance'])].append((ar['due_date'].toordinal(), i))
+        self._buckets = {}
+        for amount, items in buckets.items():
+            items.sort()
+            self._buckets[amount] = ([d for d, _ in items], [i for _, i in items])
+
+    def candidates(self, amount: float, txn_ordinal: int, window_days: int, tolerance: int):
+        """回傳金額差在 tolerance 以內、到期日在 ±window_days 內的帳款索引"""
+        base = round(amount)
+        # 客戶常自行扣除匯費，入帳金額只會少於應收金額
+        for balance in range(base, base + tolerance + 1):
+            bucket = self._buckets.get(balance)
+            if not bucket:
+                continue
+            dates, indexes = bucket
+            lo = bisect.bisect_left(dates, txn_ordinal - window_days)
+            hi = bisect.bisect_right(dates, txn_ordinal + window_days)
+            yield from indexes[lo:hi]
+
+def _match_entries(index: ReceivableIndex, entries, window_days: int, tolerance: int, limit: int):
+    results = []
+    for entry in entries:
+        text = f"{entry['payer'] or ''} {entry['note'] or ''}"
+        txn_ordinal = entry['txn_date'].toordinal()
+        # 同一客戶的多筆候選只需判斷一次摘要是否提到該客戶
+        hints = {}
+        scored = []
+        for i in index.candidates(entry['income'], txn_ordinal, window_days, tolerance):
+            ar = index.receivables[i]
+            diff = ar['balance'] - entry['income']
+            score = SCORE_EXACT_AMOUNT if diff < 0.5 else SCORE_EXACT_AMOUNT * (1 - diff / (tolerance + 1))
+            days = abs(txn_ordinal - ar['due_date'].toordinal())
+            score += SCORE_DATE * (1 - days / (window_days + 1))
+            customer_code = ar['customer_code']
+            if customer_code not in hints:
+                hints[customer_code] = bool(
+                    (ar['customer_name'] and ar['customer_name'] in text) or
+                    (customer_code and customer_code in text)
+                )
+            if hints[customer_code]:
+                score += SCORE_CUSTOMER_HINT
+            scored.append((round(score, 1), i))
+        results.append({
+            **entry,
+            'candidates': [
+                {**index.receivables[i], 'score': s}
+                for s, i in heapq.nlargest(limit, scored)
+            ],
+        })
+    return results
+
+# 計分行程池：第一次需要時建立，之後的請求共用（spawn 啟動成本高，不隨每個請求重建）
+MATCH_WORKERS = min(os.cpu_count() or 1, 4)
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # 使用 spawn：web 行程內有連線池執行緒，fork 不安全
+            _executor = ProcessPoolExecutor(max_workers=MATCH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+def shutdown_executor():
+    """關閉計分行程池（應用程式結束時呼叫）"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+            _executor = None
+
+def _match_chunk(receivables, entries, window_days, tolerance, limit):
+    return _match_entries(ReceivableIndex(receivables), entries, window_days, tolerance, limit)
+
+def match_entries(receivables, entries, window_days: int = 10, tolerance: int = 0, limit: int = 3):
+    """為每筆入帳挑出最多 limit 筆候選應收帳款（依分數排序），大量入帳時以共用的行程池平行計分"""
+    if len(entries) < PARALLEL_THRESHOLD:
+        return _match_entries(ReceivableIndex(receivables), entries, window_days, tolerance, limit)
+
+    # 每個行程一批：帳款清單每批傳送一次，索引在各行程內建立一次
+    size = -(-len(entries) // MATCH_WORKERS)
+    chunks = [entries[i:i + size] for i in range(0, len(entries), size)]
+    executor = _get_executor()
+    futures = [executor.submit(_match_chunk, receivables, chunk, window_days, tolerance, limit) for chunk in chunks]
+    return [item for future in futures for item in future.result()]
+
+def load_open_receivables(cur):
+    """讀取所有未結清的應收帳款（租賃以 end_date、買斷以 deal_date 為到期日）"""
+    cur.execute("""
+        SELECT 'leasing', id, contract_code, customer_code, customer_name, end_date,
+               COALESCE(total_rent, 0) + COALESCE(fee, 0) - COALESCE(received_amount, 0)
+        FROM ar_leasing
+        WHERE payment_status = ANY(%(statuses)s)
+        UNION ALL
+        SELECT 'buyout', id, contract_code, customer_code, customer_name, deal_date,
+               COALESCE(total_amount, 0) + COALESCE(fee, 0) - COALESCE(received_amount, 0)
+        FROM ar_buyout
+        WHERE payment_status = ANY(%(statuses)s)
+    """, {"statuses": OPEN_AR_STATUSES})
+    columns = ['source', 'ar_id', 'contract_code', 'customer_code', 'customer_name', 'due_date', 'balance']
+    return [
+        {**dict(zip(columns, row)), 'balance': float(row[6])}
+        for row in cur.fetchall()
+        if row[5] is not None and row[6] > 0
+    ]
+
+def load_unreconciled_entries(cur, from_date=None, to_date=None):
+    """讀取尚未對帳的銀行入帳"""
+    where_parts = ["NOT is_reconciled", "income > 0"]
+    params = []
+    if from_date:
+        where_parts.append("txn_date >= %s")
+        params.append(from_date)
+    if to_date:
+        where_parts.append("txn_date <= %s")
+        params.append(to_date)
+    cur.execute(f"""
+        SELECT id, txn_date, payer, note, income
+        FROM bank_ledger
+        WHERE {' AND '.join(where_parts)}
+        ORDER BY txn_date, id
+    """, tuple(params))
+    return [
+        {'bank_entry_id': r[0], 'txn_date': r[1], 'payer': r[2], 'note': r[3], 'income': float(r[4])}
+        for r in cur.fetchall()
+    ]
+
+_AR_TABLES = (("leasing", "ar_leasing", "total_rent"), ("buyout", "ar_buyout", "total_amount"))
+
+def confirm_matches(cur, matches) -> dict:
+    """確認比對結果：標記銀行入帳已對帳，並將入帳金額記入對應的應收帳款
+
+    比對結果可能已過時：入帳已對帳、帳款已結清或沒有未收金額的項目略過（列於 skipped），
+    記入的金額以帳款的未收金額為上限，超出的部分列於 unapplied_amount。
+    """
+    cur.execute("""
+        SELECT id, income FROM bank_ledger
+        WHERE id = ANY(%s) AND NOT is_reconciled
+        ORDER BY id
+        FOR UPDATE
+    """, ([m.bank_entry_id for m in matches],))
+    incomes = dict(cur.fetchall())
+
+    periods = {}
+    for source, table, amount_column in _AR_TABLES:
+        ids = [m.ar_id for m in matches if m.source == source]
+        if not ids:
+            continue
+        cur.execute(f"""
+            SELECT id, COALESCE({amount_column}, 0), COALESCE(fee, 0), COALESCE(received_amount, 0)
+            FROM {table}
+            WHERE id = ANY(%s) AND payment_status = ANY(%s)
+            ORDER BY id
+            FOR UPDATE
+        """, (ids, OPEN_AR_STATUSES))
+        for ar_id, amount, fee, received in cur.fetchall():
+            periods[(source, ar_id)] = {'amount': amount, 'fee': fee, 'received': received, 'applied': 0}
+
+    accepted = []
+    skipped = []
+    unapplied = 0
+    for m in matches:
+        # 同一筆入帳只記入一次
+        income = incomes.pop(m.bank_entry_id, None)
+        period = periods.get((m.source, m.ar_id))
+        balance = open_balance(period['amount'], period['fee'], period['received']) if period else 0
+        if income is None or balance <= 0:
+            skipped.append(m.bank_entry_id)
+            continue
+        applied = min(income, balance)
+        period['received'] += applied
+        period['applied'] += applied
+        unapplied += income - applied
+        accepted.append(m)
+
+    if accepted:
+        cur.execute("""
+            UPDATE bank_ledger b
+            SET is_reconciled = TRUE, reconciled_ar_type = m.source, reconciled_ar_id = m.ar_id,
+                updated_at = CURRENT_TIMESTAMP
+            FROM unnest(%s::int[], %s::text[], %s::int[]) AS m(bank_entry_id, source, ar_id)
+            WHERE b.id = m.bank_entry_id
+        """, ([m.bank_entry_id for m in accepted], [m.source for m in accepted], [m.ar_id for m in accepted]))
+
+    updated_periods = 0
+    for source, table, _ in _AR_TABLES:
+        rows = [(ar_id, p['applied'], period_status(p['amount'], p['fee'], p['received']))
+                for (s, ar_id), p in periods.items() if s == source and p['applied']]
+        if not rows:
+            continue
+        cur.execute(f"""
+            UPDATE {table} a
+            SET received_amount = COALESCE(a.received_amount, 0) + t.applied,
+                payment_status = t.payment_status
+            FROM unnest(%s::int[], %s::numeric[], %s::text[]) AS t(id, applied, payment_status)
+            WHERE a.id = t.id
+        """, ([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows]))
+        updated_periods += len(rows)
+
+    return {
+        "reconciled": len(accepted),
+        "updated_periods": updated_periods,
+        "skipped": skipped,
+        "unapplied_amount": float(unapplied),
+    }
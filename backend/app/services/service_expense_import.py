@@ -0,0 +1,83 @@
+"""服務費用批次匯入 - 以 COPY 寫入暫存表，驗證合約與維修公司後依服務單號 upsert"""
+
+class ServiceExpenseImportError(ValueError):
+    """匯入資料錯誤（index 為 items 中的位置，從 1 起算）"""
+
+    def __init__(self, index: int, message: str):
+        super().__init__(f"第 {index} 筆：{message}")
+        self.index = index
+
+def ingest_service_expenses(cur, items) -> dict:
+    """寫入一批服務費用：同一服務單號（external_id）已存在時更新，否則新增；客戶欄位取自合約"""
+    seen = {}
+    for i, item in enumerate(items, start=1):
+        if item.external_id in seen:
+            raise ServiceExpenseImportError(i, f"服務單號 {item.external_id} 與第 {seen[item.external_id]} 筆重複")
+        seen[item.external_id] = i
+
+    cur.execute("""
+        CREATE TEMP TABLE service_expense_staging (
+            item_no INT, external_id VARCHAR(100), contract_code VARCHAR(50),
+            service_date DATE, confirm_date DATE, service_type VARCHAR(100),
+            repair_company_code VARCHAR(50), total_amount NUMERIC(14, 2), payment_status VARCHAR(20)
+        ) ON COMMIT DROP
+    """)
+    with cur.copy("""
+        COPY service_expense_staging
+        (item_no, external_id, contract_code, service_date, confirm_date, service_type,
+         repair_company_code, total_amount, payment_status)
+        FROM STDIN
+    """) as copy:
+        for i, item in enumerate(items, start=1):
+            copy.write_row((i, item.external_id, item.contract_code, item.service_date, item.confirm_date,
+                            item.service_type, item.repair_company_code, item.total_amount, item.payment_status))
+
+    # 合約與維修公司需已存在（一次查出所有錯誤中的第一筆）
+    cur.execute("""
+        SELECT s.item_no,
+               CASE WHEN l.contract_code IS NULL AND b.contract_code IS NULL
+                    THEN '合約不存在：' || s.contract_code
+                    ELSE '維修公司不存在：' || s.repair_company_code END
+        FROM service_expense_staging s
+        LEFT JOIN contracts_leasing l ON l.contract_code = s.contract_code
+        LEFT JOIN contracts_buyout b ON b.contract_code = s.contract_code
+        LEFT JOIN companies c ON c.company_code = s.repair_company_code
+        WHERE (l.contract_code IS NULL AND b.contract_code IS NULL)
+           OR (s.repair_company_code IS NOT NULL AND c.company_code IS NULL)
+        ORDER BY s.item_no
+        LIMIT 1
+    """)
+    invalid = cur.fetchone()
+    if invalid:
+        raise ServiceExpenseImportError(invalid[0], invalid[1])
+
+    cur.execute("""
+        INSERT INTO service_expense
+        (external_id, contract_code, customer_code, customer_name, service_date, confirm_date,
+         service_type, repair_company_code, total_amount, payment_status)
+        SELECT s.external_id, s.contract_code, c.customer_code, c.customer_name,
+               s.service_date, s.confirm_date, s.service_type, s.repair_company_code,
+               s.total_amount, s.payment_status
+        FROM service_expense_staging s
+        CROSS JOIN LATERAL (
+            SELECT customer_code, customer_name FROM contracts_leasing WHERE contract_code = s.contract_code
+            UNION ALL
+            SELECT customer_code, customer_name FROM contracts_buyout WHERE contract_code = s.contract_code
+            LIMIT 1
+        ) c
+        ORDER BY s.item_no
+        ON CONFLICT (external_id) DO UPDATE
+        SET contract_code = EXCLUDED.contract_code,
+            customer_code = EXCLUDED.customer_code,
+            customer_name = EXCLUDED.customer_name,
+            service_date = EXCLUDED.service_date,
+            confirm_date = EXCLUDED.confirm_date,
+            service_type = EXCLUDED.service_type,
+            repair_company_code = EXCLUDED.repair_company_code,
+            total_amount = EXCLUDED.total_amount,
+            payment_status = EXCLUDED.payment_status
+        RETURNING (xmax = 0)
+    """)
+    inserted = sum(1 for row in cur.fetchall() if row[0])
+
+    return {"total": len(items), "inserted": inserted, "updated": len(items) - inserted}
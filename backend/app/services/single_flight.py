@@ -0,0 +1,77 @@
+"""請求合併 - 相同參數的同時請求只執行一次查詢，其餘請求等待並共用結果"""
+import functools
+import threading
+import time
+from app.config import get_settings
+from app.database import release_current_read
+from app.services.http_cache import current_table_versions
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class SingleFlight:
+    """以 key 合併同時進行的呼叫；ttl > 0 時完成的結果再保留 ttl 秒，
+    其他呼叫等待進行中的呼叫前先執行 on_wait"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._results = {}
+
+    def do(self, key, fn, ttl: float = 0, on_wait=None):
+        with self._lock:
+            cached = self._results.get(key)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if on_wait is not None:
+                on_wait()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if ttl > 0 and call.error is None:
+                    self._prune()
+                    self._results[key] = (time.monotonic() + ttl, call.value)
+            call.done.set()
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self._results.items() if expires <= now]:
+            del self._results[key]
+
+_flight = SingleFlight()
+
+def coalesce(fn):
+    """裝飾報表查詢函式：相同參數的同時呼叫共用一次執行結果（結果保留秒數見 DB_REPORT_CACHE_TTL）
+
+    key 包含本次請求 ETag 使用的資料表版本：資料變動後的請求不會拿到舊結果，回應的 ETag 與資料一致。
+    請求沒有計算 ETag（無法得知版本）時只合併同時進行的呼叫，不保留結果。
+    等待其他請求的結果前先歸還本請求固定的讀取連線：版本已由 key 確定，等待期間不佔用連線池。
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        versions = current_table_versions()
+        key = (fn.__qualname__, versions, args, tuple(sorted(kwargs.items())))
+        ttl = get_settings().report_cache_ttl if versions is not None else 0
+        return _flight.do(key, lambda: fn(*args, **kwargs), ttl, on_wait=release_current_read)
+    return wrapper
@@ -0,0 +1,34 @@
+"""應收帳款封存工具 - 將已收款且超過保存年限的帳款分批移入壓縮的封存表
+
+用法（於 backend 目錄執行，需先執行 sql/007_ar_archive.sql）：
+    python -m scripts.archive_ar --years 3
+    python -m scripts.archive_ar --years 3 --dry-run
+
+每批在同一交易內 DELETE ... RETURNING，依合約與年度打包後併入封存表，中斷後重跑即可接續。
+已封存的帳款可透過 GET /api/accounts/receivables?include_archived=true 查詢。
+"""
+import argparse
+from datetime import date
+import psycopg
+from app.config import get_db_config
+from app.services.ar_archive import ARCHIVE_KEYS, archive_table
+from app.utils.date_utils import add_months
+
+def main():
+    parser = argparse.ArgumentParser(description="應收帳款封存工具")
+    parser.add_argument("--years", type=int, default=3, help="保存年限，早於此年限的已收款帳款移入封存表")
+    parser.add_argument("--table", choices=sorted(ARCHIVE_KEYS), help="只處理指定資料表")
+    parser.add_argument("--dry-run", action="store_true", help="只計算符合條件的筆數")
+    args = parser.parse_args()
+
+    cutoff = add_months(date.today(), -12 * args.years)
+    tables = [args.table] if args.table else list(ARCHIVE_KEYS)
+    with psycopg.connect(**get_db_config()) as conn:
+        for table in tables:
+            count = archive_table(conn, table, cutoff, args.dry_run,
+                                  on_batch=lambda moved, table=table: print(f"{table}: 已封存 {moved} 筆"))
+            label = "符合條件" if args.dry_run else "共封存"
+            print(f"{table}: {label} {count} 筆（{ARCHIVE_KEYS[table]} < {cutoff}）")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""每月發票作業 - 為需開發票的合約開立當月發票並輸出 HTML 文件與 CSV 清單
+
+用法（於 backend 目錄執行，需先執行 sql/009_invoices.sql）：
+    python -m scripts.invoice_run --month 2026-10
+    python -m scripts.invoice_run --month 2026-10 --output-dir /srv/invoices --rerender
+
+同一個月份可重複執行：已開立的期別不會重複開立，中斷後重跑會補齊尚未輸出的文件。
+"""
+import argparse
+from datetime import date
+import psycopg
+from app.config import get_db_config, get_settings
+from app.services.invoice_run import month_start, run_monthly_invoices
+
+def main():
+    parser = argparse.ArgumentParser(description="每月發票作業")
+    parser.add_argument("--month", default=date.today().strftime("%Y-%m"), help="開立月份 (YYYY-MM)，預設本月")
+    parser.add_argument("--output-dir", default=None, help="文件輸出目錄，預設為 DB_INVOICE_DIR")
+    parser.add_argument("--rerender", action="store_true", help="重新輸出當月所有發票文件")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or get_settings().invoice_dir
+    with psycopg.connect(**get_db_config()) as conn:
+        result = run_monthly_invoices(conn, month_start(args.month), output_dir, args.rerender)
+
+    print(f"{result['month']}: 新開立 {result['created']} 張，輸出 {result['rendered']} 份文件，"
+          f"當月共 {result['total']} 張，總計 {result['total_amount']:,.0f}")
+    print(f"清單：{result['summary_path']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""背景工作 worker - 與 API 分開執行 worker 行程（API 設定 DB_JOB_WORKERS=0 時使用）
+
+用法（於 backend 目錄執行，需先執行 sql/010_jobs.sql）：
+    python -m scripts.job_worker --workers 2
+
+Ctrl+C 後會等目前的工作完成再結束。
+"""
+import argparse
+import logging
+import threading
+from app.services.jobs import job_workers
+
+def main():
+    parser = argparse.ArgumentParser(description="背景工作 worker")
+    parser.add_argument("--workers", type=int, default=1, help="worker 行程數")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    job_workers.start(args.workers)
+    print(f"已啟動 {args.workers} 個 worker，Ctrl+C 結束")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print("等待目前的工作完成…")
+    finally:
+        job_workers.stop(timeout=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""負載測試 - 模擬月底的操作組合，找出單一實例可承受的同時使用者數
+
+用法（先啟動 API，例如 uvicorn app.main:app --port 8000，並連到本機測試資料庫）：
+    python -m scripts.loadtest --base-url http://localhost:8000 --levels 1,5,10,20,50 --duration 30
+
+每個同時使用者數（level）各跑 --duration 秒，每位虛擬使用者依權重隨機執行：
+    瀏覽列表、搜尋、帳款報表、合約新增／修改／暫停／恢復（會產生應收帳款）
+輸出每個端點的 p50/p95/p99 延遲、吞吐量與錯誤率，最後列出各 level 的飽和曲線。
+測試產生的客戶與合約代碼以 LT 開頭，結束時自動刪除（加 --keep 保留）。
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+SEARCH_TERMS = ["A", "B", "C", "1", "2", "公司", "科技"]
+
+class Recorder:
+    """收集每個端點的延遲（秒）與錯誤數"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, endpoint: str, seconds: float, ok: bool):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+def _percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class Client:
+    def __init__(self, base_url: str, recorder: Recorder, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.timeout = timeout
+
+    def request(self, method: str, endpoint: str, path: str, params=None, body=None):
+        """送出請求並記錄；endpoint 為統計用的路由名稱，回傳 HTTP 狀態碼（連線失敗為 0）"""
+        url = self.base_url + path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        data = json.dumps(body, default=str).encode() if body is not None else None
+        req = urllib.request.Request(url, data=data, method=method)
+        req.add_header("Accept-Encoding", "identity")
+        if data is not None:
+            req.add_header("Content-Type", "application/json")
+
+        started = time.perf_counter()
+        status = 0
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                status = resp.status
+                resp.read()
+        except urllib.error.HTTPError as e:
+            status = e.code
+            e.read()
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            status = 0
+        self.recorder.add(f"{method} {endpoint}", time.perf_counter() - started, 200 <= status < 400)
+        return status
+
+class Scenario:
+    """月底操作組合；權重總和不必為 100"""
+
+    def __init__(self, client: Client, customer_code: str, run_id: str):
+        self.client = client
+        self.customer_code = customer_code
+        self.run_id = run_id
+        self._counter = 0
+        self._lock = threading.Lock()
+        self.created = []
+        self.actions = [
+            (35, self.browse),
+            (20, self.search),
+            (30, self.reports),
+            (15, self.contract_lifecycle),
+        ]
+
+    def _next_code(self) -> str:
+        with self._lock:
+            self._counter += 1
+            return f"LT{self.run_id}-{self._counter:05d}"
+
+    def pick(self):
+        return random.choices([a for _, a in self.actions], weights=[w for w, _ in self.actions])[0]
+
+    def browse(self):
+        path = random.choice(["/api/customers", "/api/companies", "/api/contracts/leasing", "/api/contracts/buyout"])
+        self.client.request("GET", path, path)
+
+    def search(self):
+        path = random.choice(["/api/customers", "/api/companies", "/api/contracts/leasing"])
+        self.client.request("GET", path + "?search", path, {"search": random.choice(SEARCH_TERMS)})
+
+    def reports(self):
+        today = date.today()
+        path, params = random.choice([
+            ("/api/accounts/receivables", {"from_date": today.replace(month=1, day=1).isoformat()}),
+            ("/api/accounts/receivables", {"payment_status": "未收"}),
+            ("/api/accounts/receivables/aging", {}),
+            ("/api/accounts/payables/unpaid", {}),
+            ("/api/accounts/service", {}),
+        ])
+        self.client.request("GET", path, path, params)
+
+    def contract_lifecycle(self):
+        """新增租賃合約（產生應收帳款）→ 修改 → 暫停 → 恢復"""
+        code = self._next_code()
+        contract = {
+            "contract_code": code,
+            "customer_code": self.customer_code,
+            "start_date": date.today().replace(day=1).isoformat(),
+            "model": "LOADTEST",
+            "monthly_rent": 1000,
+            "payment_cycle_months": random.choice([1, 3]),
+            "contract_months": 36,
+        }
+        status = self.client.request("POST", "/api/contracts/leasing", "/api/contracts/leasing", body=contract)
+        if status != 201:
+            return
+        with self._lock:
+            self.created.append(code)
+        contract["monthly_rent"] = 1200
+        self.client.request("PUT", "/api/contracts/leasing/{code}", f"/api/contracts/leasing/{code}", body=contract)
+        self.client.request("POST", "/api/contracts/leasing/{code}/pause", f"/api/contracts/leasing/{code}/pause")
+        self.client.request("POST", "/api/contracts/leasing/{code}/resume", f"/api/contracts/leasing/{code}/resume", body={})
+
+def run_level(base_url: str, scenario_args, concurrency: int, duration: float, timeout: float):
+    recorder = Recorder()
+    client = Client(base_url, recorder, timeout)
+    scenario = Scenario(client, *scenario_args)
+    deadline = time.monotonic() + duration
+
+    def user():
+        while time.monotonic() < deadline:
+            scenario.pick()()
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(user) for _ in range(concurrency)]
+        for future in futures:
+            future.result()
+    elapsed = time.monotonic() - started
+    return recorder, elapsed, scenario.created
+
+def print_endpoint_table(recorder: Recorder, elapsed: float):
+    print(f"  {'端點':<46}{'次數':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'錯誤率':>9}")
+    for endpoint in sorted(recorder.latencies):
+        values = sorted(recorder.latencies[endpoint])
+        errors = recorder.errors[endpoint]
+        print(f"  {endpoint:<48}{len(values):>7}{len(values) / elapsed:>8.1f}"
+              f"{_percentile(values, 50) * 1000:>8.0f}ms{_percentile(values, 95) * 1000:>7.0f}ms"
+              f"{_percentile(values, 99) * 1000:>7.0f}ms{errors / len(values):>8.1%}")
+
+def summarize(recorder: Recorder, elapsed: float):
+    values = sorted(v for vs in recorder.latencies.values() for v in vs)
+    errors = sum(recorder.errors.values())
+    total = len(values)
+    return {
+        "requests": total,
+        "rps": total / elapsed if elapsed else 0.0,
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+        "p99": _percentile(values, 99),
+        "error_rate": errors / total if total else 0.0,
+    }
+
+def setup(client: Client, run_id: str) -> str:
+    customer_code = f"LT{run_id}"
+    status = client.request("POST", "/api/customers", "/api/customers", body={
+        "customer_code": customer_code, "name": f"負載測試 {run_id}"
+    })
+    if status != 201:
+        raise SystemExit(f"建立測試客戶失敗（HTTP {status}），請確認 API 與資料庫已啟動")
+    return customer_code
+
+def cleanup(client: Client, customer_code: str, contract_codes):
+    for code in contract_codes:
+        client.request("DELETE", "/api/contracts/leasing/{code}", f"/api/contracts/leasing/{code}")
+    client.request("DELETE", "/api/customers/{code}", f"/api/customers/{customer_code}")
+
+def main():
+    parser = argparse.ArgumentParser(description="月底操作組合負載測試")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--levels", default="1,5,10,20,50", help="同時使用者數，以逗號分隔")
+    parser.add_argument("--duration", type=float, default=30, help="每個 level 執行秒數")
+    parser.add_argument("--timeout", type=float, default=30, help="單一請求逾時秒數")
+    parser.add_argument("--keep", action="store_true", help="保留測試產生的客戶與合約")
+    args = parser.parse_args()
+
+    levels = [int(x) for x in args.levels.split(",") if x.strip()]
+    run_id = time.strftime("%m%d%H%M%S")
+    admin = Client(args.base_url, Recorder(), args.timeout)
+    customer_code = setup(admin, run_id)
+
+    curve = []
+    created = []
+    try:
+        for concurrency in levels:
+            print(f"\n=== 同時使用者 {concurrency}，{args.duration:.0f} 秒 ===")
+            recorder, elapsed, codes = run_level(
+                args.base_url, (customer_code, f"{run_id}C{concurrency}"), concurrency, args.duration, args.timeout)
+            created.extend(codes)
+            print_endpoint_table(recorder, elapsed)
+            curve.append((concurrency, summarize(recorder, elapsed)))
+    finally:
+        if not args.keep:
+            cleanup(admin, customer_code, created)
+
+    print("\n=== 飽和曲線 ===")
+    print(f"  {'同時使用者':>10}{'請求數':>9}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'錯誤率':>9}")
+    for concurrency, s in curve:
+        print(f"  {concurrency:>13}{s['requests']:>10}{s['rps']:>9.1f}{s['p50'] * 1000:>7.0f}ms"
+              f"{s['p95'] * 1000:>7.0f}ms{s['p99'] * 1000:>7.0f}ms{s['error_rate']:>8.1%}")
+    # 吞吐量不再隨同時使用者數增加（或錯誤率上升）的 level 即為飽和點
+    best = max(curve, key=lambda item: item[1]["rps"], default=None)
+    if best:
+        print(f"\n最高吞吐量 {best[1]['rps']:.1f} rps，出現在同時使用者 {best[0]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""應收帳款分割表遷移工具 - 將 ar_leasing / ar_buyout 改為依年度分割（線上搬移資料）
+
+用法（於 backend 目錄執行，連線設定與 API 相同）：
+    python -m scripts.partition_ar migrate ar_leasing
+    python -m scripts.partition_ar migrate ar_buyout
+    python -m scripts.partition_ar ensure-partitions --years-ahead 2
+
+migrate 流程：
+    1. 建立 <table>_partitioned（依日期欄位 RANGE 分割，每年一個分割區加上 DEFAULT）與索引
+    2. 在原表掛上同步觸發器，搬移期間的新增／修改／刪除即時寫入新表
+    3. 依 id 分批複製舊資料（每批獨立交易，以 FOR SHARE 避免與同時修改的資料競爭）
+    4. 短暫鎖定原表：移除同步觸發器、改名對調、將原表的觸發器與序號擁有權移到新表
+原表保留為 <table>_old，確認無誤後可自行 DROP。
+
+唯一性限制：分割表的唯一索引必須包含分割鍵。主鍵改為 (id, 分割鍵)，id 仍由序號產生；
+原表不含分割鍵的其他唯一索引無法建立在分割表上，遷移前會列出並中止，
+確認可由應用程式保證唯一後加上 --drop-unique 才會略過這些索引繼續遷移。
+
+ensure-partitions：若 DEFAULT 分割區已有新年度的資料（尚未建立分割區前寫入），
+會在同一交易內卸離 DEFAULT、建立年度分割區、將資料移入後再掛回（期間短暫鎖定資料表）。
+"""
+import argparse
+import sys
+from datetime import date
+import psycopg
+from psycopg import sql
+from app.config import get_db_config
+
+# 分割鍵：租賃以期別起始日、買斷以成交日
+PARTITION_KEYS = {
+    'ar_leasing': 'start_date',
+    'ar_buyout': 'deal_date',
+}
+
+BATCH_SIZE = 5000
+
+def _is_partitioned(cur, table: str) -> bool:
+    cur.execute("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = %s
+    """, (table,))
+    return cur.fetchone() is not None
+
+def _create_year_partition(cur, parent: str, table: str, year: int):
+    """建立 <table>_y<year> 分割區（已存在時略過）"""
+    cur.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {parent}
+        FOR VALUES FROM (%s) TO (%s)
+    """).format(
+        partition=sql.Identifier(f"{table}_y{year}"),
+        parent=sql.Identifier(parent)
+    ), (date(year, 1, 1), date(year + 1, 1, 1)))
+
+def _unique_indexes(cur, table: str, key: str):
+    """原表主鍵以外的唯一索引，依是否包含分割鍵分為可複製與無法建立兩組"""
+    cur.execute("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid),
+               EXISTS (
+                   SELECT 1 FROM pg_attribute a
+                   WHERE a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) AND a.attname = %s
+               )
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = %s::regclass AND i.indisunique AND NOT i.indisprimary
+    """, (key, table))
+    rows = cur.fetchall()
+    keep = [(name, index_def) for name, index_def, has_key in rows if has_key]
+    dropped = [(name, index_def) for name, index_def, has_key in rows if not has_key]
+    return keep, dropped
+
+def _prepare(conn, table: str, new_table: str, key: str, years_ahead: int, drop_unique: bool):
+    """建立分割表、分割區、索引與同步觸發器"""
+    with conn.cursor() as cur:
+        unique_indexes, dropped = _unique_indexes(cur, table, key)
+        if dropped:
+            for _, index_def in dropped:
+                print(f"唯一索引不含分割鍵 {key}，分割表無法建立：{index_def}", file=sys.stderr)
+            if not drop_unique:
+                conn.rollback()
+                sys.exit("中止遷移：確認可略過上列唯一索引後，加上 --drop-unique 重新執行")
+
+        cur.execute(sql.SQL("SELECT MIN({key}), MAX({key}) FROM {table}").format(
+            key=sql.Identifier(key), table=sql.Identifier(table)))
+        min_date, max_date = cur.fetchone()
+        first_year = (min_date or date.today()).year
+        last_year = max((max_date or date.today()).year, date.today().year + years_ahead)
+
+        cur.execute(sql.SQL("""
+            CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE ({key})
+        """).format(new=sql.Identifier(new_table), table=sql.Identifier(table), key=sql.Identifier(key)))
+        cur.execute(sql.SQL("ALTER TABLE {new} ADD PRIMARY KEY (id, {key})").format(
+            new=sql.Identifier(new_table), key=sql.Identifier(key)))
+
+        for year in range(first_year, last_year + 1):
+            _create_year_partition(cur, new_table, table, year)
+        cur.execute(sql.SQL("CREATE TABLE {partition} PARTITION OF {parent} DEFAULT").format(
+            partition=sql.Identifier(f"{table}_default"), parent=sql.Identifier(new_table)))
+
+        # 複製原表的一般索引與包含分割鍵的唯一索引（主鍵改由 (id, 分割鍵) 取代）
+        cur.execute("""
+            SELECT c.relname, pg_get_indexdef(i.indexrelid)
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = %s::regclass AND NOT i.indisunique
+        """, (table,))
+        for index_name, index_def in cur.fetchall() + unique_indexes:
+            on_clause = f" ON public.{table} "
+            if on_clause not in index_def:
+                print(f"略過無法辨識的索引：{index_def}", file=sys.stderr)
+                continue
+            index_def = index_def.replace(on_clause, f" ON public.{new_table} ", 1)
+            index_def = index_def.replace(f"INDEX {index_name} ", f"INDEX {index_name}_p ", 1)
+            cur.execute(index_def)
+
+        # 搬移期間原表的異動同步到新表（新表尚未掛上業務觸發器，不會重複計算彙總）
+        cur.execute(sql.SQL("""
+            CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM {new} WHERE id = OLD.id;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO {new} SELECT NEW.* ON CONFLICT DO NOTHING;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """).format(function=sql.Identifier(f"{table}_partition_sync"), new=sql.Identifier(new_table)))
+        cur.execute(sql.SQL("""
+            CREATE TRIGGER {trigger} AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {function}()
+        """).format(
+            trigger=sql.Identifier(f"trg_{table}_partition_sync"),
+            table=sql.Identifier(table),
+            function=sql.Identifier(f"{table}_partition_sync")
+        ))
+    conn.commit()
+
+def _copy_batches(conn, table: str, new_table: str):
+    """依 id 區間分批複製；同步觸發器上線後的新資料已由觸發器寫入"""
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("SELECT COALESCE(MAX(id), 0) FROM {table}").format(table=sql.Identifier(table)))
+        max_id = cur.fetchone()[0]
+    conn.commit()
+
+    copied = 0
+    for low in range(0, max_id, BATCH_SIZE):
+        with conn.cursor() as cur:
+            # FOR SHARE：等待同時進行的修改提交後讀取最新版本，並阻擋本批提交前的修改
+            cur.execute(sql.SQL("""
+                INSERT INTO {new}
+                SELECT * FROM {table} WHERE id > %s AND id <= %s FOR SHARE
+                ON CONFLICT DO NOTHING
+            """).format(new=sql.Identifier(new_table), table=sql.Identifier(table)),
+                (low, low + BATCH_SIZE))
+            copied += cur.rowcount
+        conn.commit()
+        print(f"{table}: 已複製至 id {min(low + BATCH_SIZE, max_id)} / {max_id}（{copied} 筆）")
+
+def _swap(conn, table: str, new_table: str):
+    """短暫鎖定原表並對調：觸發器與序號擁有權移到新表"""
+    old_table = f"{table}_old"
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE").format(table=sql.Identifier(table)))
+        cur.execute(sql.SQL("DROP TRIGGER {trigger} ON {table}").format(
+            trigger=sql.Identifier(f"trg_{table}_partition_sync"), table=sql.Identifier(table)))
+        cur.execute(sql.SQL("DROP FUNCTION {function}()").format(
+            function=sql.Identifier(f"{table}_partition_sync")))
+
+        cur.execute("""
+            SELECT tgname, pg_get_triggerdef(oid)
+            FROM pg_trigger
+            WHERE tgrelid = %s::regclass AND NOT tgisinternal
+        """, (table,))
+        triggers = cur.fetchall()
+        cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+        sequence = cur.fetchone()[0]
+
+        cur.execute(sql.SQL("ALTER TABLE {table} RENAME TO {old}").format(
+            table=sql.Identifier(table), old=sql.Identifier(old_table)))
+        cur.execute(sql.SQL("ALTER TABLE {new} RENAME TO {table}").format(
+            new=sql.Identifier(new_table), table=sql.Identifier(table)))
+
+        # 觸發器定義中的 public.<table> 現在指向新表
+        for trigger_name, trigger_def in triggers:
+            cur.execute(sql.SQL("DROP TRIGGER {trigger} ON {old}").format(
+                trigger=sql.Identifier(trigger_name), old=sql.Identifier(old_table)))
+            cur.execute(trigger_def)
+
+        if sequence:
+            cur.execute(sql.SQL("ALTER SEQUENCE {sequence} OWNED BY {table}.id").format(
+                sequence=sql.SQL(sequence), table=sql.Identifier(table)))
+    conn.commit()
+
+def migrate(table: str, years_ahead: int, drop_unique: bool = False):
+    key = PARTITION_KEYS[table]
+    new_table = f"{table}_partitioned"
+    with psycopg.connect(**get_db_config()) as conn:
+        with conn.cursor() as cur:
+            if _is_partitioned(cur, table):
+                print(f"{table} 已是分割表，略過")
+                return
+        conn.commit()
+        _prepare(conn, table, new_table, key, years_ahead, drop_unique)
+        _copy_batches(conn, table, new_table)
+        _swap(conn, table, new_table)
+    print(f"{table} 已改為依 {key} 年度分割，原表保留為 {table}_old")
+
+def _add_year_partition(cur, table: str, key: str, year: int):
+    """建立年度分割區；DEFAULT 分割區已有該年度資料時先卸離 DEFAULT，移入資料後再掛回"""
+    partition = f"{table}_y{year}"
+    default = f"{table}_default"
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL, to_regclass(%s) IS NOT NULL", (partition, default))
+    partition_exists, default_exists = cur.fetchone()
+    if partition_exists:
+        return
+
+    bounds = (date(year, 1, 1), date(year + 1, 1, 1))
+    has_rows = False
+    if default_exists:
+        cur.execute(sql.SQL("SELECT EXISTS (SELECT 1 FROM {default} WHERE {key} >= %s AND {key} < %s)").format(
+            default=sql.Identifier(default), key=sql.Identifier(key)), bounds)
+        has_rows = cur.fetchone()[0]
+    if not has_rows:
+        _create_year_partition(cur, table, table, year)
+        return
+
+    # 直接建立會因 DEFAULT 內已有該年度資料而失敗
+    cur.execute(sql.SQL("ALTER TABLE {table} DETACH PARTITION {default}").format(
+        table=sql.Identifier(table), default=sql.Identifier(default)))
+    _create_year_partition(cur, table, table, year)
+    # 直接在分割區間搬移，不經過母表的語句觸發器（資料內容未變動）
+    cur.execute(sql.SQL("""
+        WITH moved AS (
+            DELETE FROM {default} WHERE {key} >= %s AND {key} < %s RETURNING *
+        )
+        INSERT INTO {partition} SELECT * FROM moved
+    """).format(default=sql.Identifier(default), key=sql.Identifier(key),
+                partition=sql.Identifier(partition)), bounds)
+    moved = cur.rowcount
+    cur.execute(sql.SQL("ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT").format(
+        table=sql.Identifier(table), default=sql.Identifier(default)))
+    print(f"{table}: 已將 DEFAULT 分割區內 {year} 年的 {moved} 筆移入 {partition}")
+
+def ensure_partitions(years_ahead: int):
+    """為已分割的應收帳款表預先建立未來年度的分割區"""
+    this_year = date.today().year
+    with psycopg.connect(**get_db_config()) as conn:
+        with conn.cursor() as cur:
+            for table, key in PARTITION_KEYS.items():
+                if not _is_partitioned(cur, table):
+                    continue
+                for year in range(this_year, this_year + years_ahead + 1):
+                    _add_year_partition(cur, table, key, year)
+        conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description="應收帳款分割表遷移工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = sub.add_parser("migrate", help="將資料表改為依年度分割")
+    migrate_parser.add_argument("table", choices=sorted(PARTITION_KEYS))
+    migrate_parser.add_argument("--years-ahead", type=int, default=2, help="預先建立未來幾年的分割區")
+    migrate_parser.add_argument("--drop-unique", action="store_true", help="略過不含分割鍵的唯一索引")
+    ensure_parser = sub.add_parser("ensure-partitions", help="預先建立未來年度的分割區")
+    ensure_parser.add_argument("--years-ahead", type=int, default=2)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate(args.table, args.years_ahead, args.drop_unique)
+    else:
+        ensure_partitions(args.years_ahead)
+
+if __name__ == "__main__":
+    main()
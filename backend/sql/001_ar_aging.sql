@@ -0,0 +1,24 @@
+-- 應收帳款帳齡分析：索引與每日快照表
+-- 執行方式：psql "$DATABASE_URL" -f sql/001_ar_aging.sql
+
+-- 帳齡查詢以 payment_status 過濾未結清帳款，再依到期日計算逾期天數
+CREATE INDEX IF NOT EXISTS idx_ar_leasing_status_due
+    ON ar_leasing (payment_status, end_date);
+
+CREATE INDEX IF NOT EXISTS idx_ar_buyout_status_due
+    ON ar_buyout (payment_status, deal_date);
+
+-- 帳齡快照（POST /api/accounts/receivables/aging/snapshot 寫入，每日一份）
+CREATE TABLE IF NOT EXISTS ar_aging_snapshot (
+    snapshot_date   DATE          NOT NULL,
+    customer_code   VARCHAR(50)   NOT NULL,
+    customer_name   VARCHAR(255),
+    current_amount  NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    days_1_30       NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    days_31_60      NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    days_61_90      NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    days_over_90    NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    total           NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    created_at      TIMESTAMP     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (snapshot_date, customer_code)
+);
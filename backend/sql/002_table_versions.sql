@@ -0,0 +1,51 @@
+-- 資料表版本：列表 API 以此計算 ETag，資料未變動時直接回 304
+-- 每個寫入語句結束後在 table_changes 新增一列（與資料同一交易提交），版本為該表目前看得到的變更 id 集合：
+-- 只新增不更新，並行的寫入交易不會搶同一列的鎖；任何交易提交後集合必定改變（包含提交順序與 id 順序不同時）。
+-- 舊的變更列由之後的寫入以 SKIP LOCKED 清除，正常情況下每張表只留一兩列。
+
+-- 舊版以單列計數，每個寫入交易都要鎖同一列直到提交
+DROP TABLE IF EXISTS table_versions;
+DROP FUNCTION IF EXISTS bump_table_version() CASCADE;
+
+CREATE TABLE IF NOT EXISTS table_changes (
+    id          BIGSERIAL     PRIMARY KEY,
+    table_name  VARCHAR(63)   NOT NULL,
+    changed_at  TIMESTAMP     NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_table_changes_table
+    ON table_changes (table_name, id);
+
+-- TG_ARGV[0]：資料表名稱（分割表的觸發器可能在分割區上觸發，不使用 TG_TABLE_NAME）
+CREATE OR REPLACE FUNCTION record_table_change() RETURNS trigger AS $$
+DECLARE
+    new_id BIGINT;
+BEGIN
+    INSERT INTO table_changes (table_name) VALUES (TG_ARGV[0]) RETURNING id INTO new_id;
+    -- 其他交易正在清除的列直接略過，不等待
+    DELETE FROM table_changes
+    WHERE id IN (
+        SELECT id FROM table_changes
+        WHERE table_name = TG_ARGV[0] AND id < new_id
+        FOR UPDATE SKIP LOCKED
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY[
+        'customers', 'companies', 'contracts_leasing', 'contracts_buyout',
+        'ar_leasing', 'ar_buyout', 'service_expense'
+    ] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_version ON %1$I', t);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%1$s_version
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %1$I
+                FOR EACH STATEMENT EXECUTE FUNCTION record_table_change(%1$L)', t);
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,85 @@
+-- 即時變更通知：每個寫入語句以 NOTIFY 送出一個精簡事件，GET /api/events 轉送給前端
+-- 語句層級觸發器搭配轉移資料表（transition table），批次入帳、COPY 重建帳款、封存等大量寫入也只送一次：
+--   {"table": "ar_leasing", "op": "update", "keys": ["L001", "L002"]}
+-- 影響的代碼超過 notify_max_keys() 筆時改送 {"table": ..., "op": "resync"}，請前端重新載入該表
+-- 同一交易內內容相同的通知只會送出一次
+
+CREATE OR REPLACE FUNCTION notify_max_keys() RETURNS INT AS $$
+    SELECT 50
+$$ LANGUAGE sql IMMUTABLE;
+
+-- TG_ARGV[0]：事件中 key 使用的欄位；TG_ARGV[1]：資料表名稱（分割表的觸發器可能在分割區上觸發，不使用 TG_TABLE_NAME）
+CREATE OR REPLACE FUNCTION notify_change() RETURNS trigger AS $$
+DECLARE
+    keys TEXT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(k) INTO keys FROM (
+            SELECT DISTINCT to_jsonb(n) ->> TG_ARGV[0] AS k FROM new_rows n
+            LIMIT notify_max_keys() + 1
+        ) s;
+    ELSIF TG_OP = 'UPDATE' THEN
+        -- 代碼本身被修改時新舊代碼都要通知
+        SELECT array_agg(k) INTO keys FROM (
+            SELECT to_jsonb(n) ->> TG_ARGV[0] AS k FROM new_rows n
+            UNION
+            SELECT to_jsonb(o) ->> TG_ARGV[0] FROM old_rows o
+            LIMIT notify_max_keys() + 1
+        ) s;
+    ELSE
+        SELECT array_agg(k) INTO keys FROM (
+            SELECT DISTINCT to_jsonb(o) ->> TG_ARGV[0] AS k FROM old_rows o
+            LIMIT notify_max_keys() + 1
+        ) s;
+    END IF;
+
+    IF keys IS NULL THEN
+        RETURN NULL;  -- 語句沒有影響任何資料列
+    END IF;
+
+    IF array_length(keys, 1) > notify_max_keys() THEN
+        PERFORM pg_notify('miracle_changes', json_build_object(
+            'table', TG_ARGV[1], 'op', 'resync'
+        )::text);
+    ELSE
+        PERFORM pg_notify('miracle_changes', json_build_object(
+            'table', TG_ARGV[1], 'op', lower(TG_OP), 'keys', keys
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 轉移資料表的觸發器只能對應一種事件，每張表建立新增／修改／刪除三個觸發器
+DO $$
+DECLARE
+    t RECORD;
+BEGIN
+    FOR t IN SELECT * FROM (VALUES
+        ('customers', 'customer_code'),
+        ('companies', 'company_code'),
+        ('contracts_leasing', 'contract_code'),
+        ('contracts_buyout', 'contract_code'),
+        ('ar_leasing', 'contract_code'),
+        ('ar_buyout', 'contract_code')
+    ) AS v(table_name, key_column) LOOP
+        -- 舊版為逐列觸發器
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_notify ON %1$I', t.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_notify_insert ON %1$I', t.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_notify_update ON %1$I', t.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_notify_delete ON %1$I', t.table_name);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%1$s_notify_insert AFTER INSERT ON %1$I
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_change(%2$L, %1$L)', t.table_name, t.key_column);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%1$s_notify_update AFTER UPDATE ON %1$I
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_change(%2$L, %1$L)', t.table_name, t.key_column);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%1$s_notify_delete AFTER DELETE ON %1$I
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_change(%2$L, %1$L)', t.table_name, t.key_column);
+    END LOOP;
+END;
+$$;
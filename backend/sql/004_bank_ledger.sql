@@ -0,0 +1,22 @@
+-- 銀行帳本：匯入對帳單時以 dedup_key 排除已匯入的交易
+
+CREATE TABLE IF NOT EXISTS bank_ledger (
+    id              SERIAL PRIMARY KEY,
+    txn_date        DATE          NOT NULL,
+    payer           VARCHAR(255),
+    expense         NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    income          NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    note            TEXT,
+    is_reconciled   BOOLEAN       NOT NULL DEFAULT FALSE,
+    created_at      TIMESTAMP     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at      TIMESTAMP     NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- dedup_key = 交易內容雜湊 + '#' + 同內容交易在對帳單中的序號（同日同額的多筆交易不會被合併）
+ALTER TABLE bank_ledger ADD COLUMN IF NOT EXISTS dedup_key VARCHAR(80);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bank_ledger_dedup_key
+    ON bank_ledger (dedup_key);
+
+CREATE INDEX IF NOT EXISTS idx_bank_ledger_txn_date
+    ON bank_ledger (txn_date);
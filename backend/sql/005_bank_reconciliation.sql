@@ -0,0 +1,21 @@
+-- 銀行對帳：記錄銀行入帳對應到哪一筆應收帳款（欄位名稱與前端 BankLedger 頁面相同）
+
+-- 先前版本的欄位名稱為 matched_source / matched_ar_id
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'bank_ledger' AND column_name = 'matched_source')
+       AND NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name = 'bank_ledger' AND column_name = 'reconciled_ar_type') THEN
+        ALTER TABLE bank_ledger RENAME COLUMN matched_source TO reconciled_ar_type;
+        ALTER TABLE bank_ledger RENAME COLUMN matched_ar_id TO reconciled_ar_id;
+    END IF;
+END;
+$$;
+
+ALTER TABLE bank_ledger ADD COLUMN IF NOT EXISTS reconciled_ar_type VARCHAR(10);  -- leasing / buyout
+ALTER TABLE bank_ledger ADD COLUMN IF NOT EXISTS reconciled_ar_id INT;
+
+-- 對帳只掃描尚未對帳的入帳
+CREATE INDEX IF NOT EXISTS idx_bank_ledger_unreconciled
+    ON bank_ledger (txn_date) WHERE NOT is_reconciled AND income > 0;
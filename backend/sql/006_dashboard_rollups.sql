@@ -0,0 +1,211 @@
+-- 首頁儀表板彙總表：由觸發器隨 ar_* / contracts_* 異動增量維護
+-- 資料不一致時可執行 SELECT rebuild_dashboard_rollups(); 全部重算
+
+-- 每個連線寫入自己的分槽（slot = backend pid % dashboard_slots()），讀取時加總所有分槽：
+-- 並行寫入同月份帳款的交易不會搶同一列的鎖直到提交
+CREATE OR REPLACE FUNCTION dashboard_slots() RETURNS INT AS $$
+    SELECT 8
+$$ LANGUAGE sql IMMUTABLE;
+
+-- 應收帳款：依月份（租賃 start_date、買斷 deal_date）與合約類型彙總
+CREATE TABLE IF NOT EXISTS dashboard_ar_monthly (
+    month           DATE          NOT NULL,
+    contract_type   VARCHAR(10)   NOT NULL,
+    slot            SMALLINT      NOT NULL DEFAULT 0,
+    periods         INT           NOT NULL DEFAULT 0,
+    billed          NUMERIC(16, 2) NOT NULL DEFAULT 0,
+    collected       NUMERIC(16, 2) NOT NULL DEFAULT 0,
+    outstanding     NUMERIC(16, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, contract_type, slot)
+);
+
+-- 合約：依類型與狀態統計合約數與尚未支付的業務/維護應付金額
+CREATE TABLE IF NOT EXISTS dashboard_contracts (
+    contract_type   VARCHAR(10)   NOT NULL,
+    status          VARCHAR(20)   NOT NULL,
+    slot            SMALLINT      NOT NULL DEFAULT 0,
+    contracts       INT           NOT NULL DEFAULT 0,
+    payables_due    NUMERIC(16, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (contract_type, status, slot)
+);
+
+-- 舊版沒有分槽，主鍵改為包含 slot
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'dashboard_ar_monthly' AND column_name = 'slot') THEN
+        ALTER TABLE dashboard_ar_monthly ADD COLUMN slot SMALLINT NOT NULL DEFAULT 0;
+        ALTER TABLE dashboard_ar_monthly DROP CONSTRAINT dashboard_ar_monthly_pkey;
+        ALTER TABLE dashboard_ar_monthly ADD PRIMARY KEY (month, contract_type, slot);
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'dashboard_contracts' AND column_name = 'slot') THEN
+        ALTER TABLE dashboard_contracts ADD COLUMN slot SMALLINT NOT NULL DEFAULT 0;
+        ALTER TABLE dashboard_contracts DROP CONSTRAINT dashboard_contracts_pkey;
+        ALTER TABLE dashboard_contracts ADD PRIMARY KEY (contract_type, status, slot);
+    END IF;
+END;
+$$;
+
+-- 舊版為逐列觸發器
+DROP TRIGGER IF EXISTS trg_ar_leasing_rollup ON ar_leasing;
+DROP TRIGGER IF EXISTS trg_ar_buyout_rollup ON ar_buyout;
+DROP TRIGGER IF EXISTS trg_contracts_leasing_rollup ON contracts_leasing;
+DROP TRIGGER IF EXISTS trg_contracts_buyout_rollup ON contracts_buyout;
+DROP FUNCTION IF EXISTS rollup_ar_apply(TEXT, JSONB, TEXT, TEXT, INT);
+DROP FUNCTION IF EXISTS rollup_contract_apply(TEXT, JSONB, INT);
+
+-- 觸發語句異動的資料列（轉移資料表）：sign = 1 加入、-1 移除
+CREATE OR REPLACE FUNCTION rollup_changed_rows(p_op TEXT) RETURNS TEXT AS $$
+    SELECT CASE p_op
+        WHEN 'INSERT' THEN 'SELECT to_jsonb(n), 1 FROM new_rows n'
+        WHEN 'DELETE' THEN 'SELECT to_jsonb(o), -1 FROM old_rows o'
+        ELSE 'SELECT to_jsonb(n), 1 FROM new_rows n UNION ALL SELECT to_jsonb(o), -1 FROM old_rows o'
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+-- 整個語句的異動依月份彙總後一次套用，月份依序鎖定避免交易間死結
+-- p_rows：產生 (帳款 JSONB, sign) 的查詢
+CREATE OR REPLACE FUNCTION rollup_ar_rows(
+    p_rows TEXT, p_contract_type TEXT, p_amount_column TEXT, p_date_column TEXT
+) RETURNS TEXT AS $$
+    SELECT format($q$
+        INSERT INTO dashboard_ar_monthly AS d (month, contract_type, slot, periods, billed, collected, outstanding)
+        SELECT month, %1$L, pg_backend_pid() %% dashboard_slots(),
+               SUM(sign), SUM(sign * billed), SUM(sign * collected),
+               SUM(sign * GREATEST(billed + fee - collected, 0))
+        FROM (
+            SELECT date_trunc('month', (r ->> %3$L)::DATE)::DATE AS month, sign,
+                   COALESCE((r ->> %2$L)::NUMERIC, 0) AS billed,
+                   COALESCE((r ->> 'received_amount')::NUMERIC, 0) AS collected,
+                   COALESCE((r ->> 'fee')::NUMERIC, 0) AS fee
+            FROM (%4$s) AS c(r, sign)
+            WHERE r ->> %3$L IS NOT NULL
+        ) ar
+        GROUP BY month
+        ORDER BY month
+        ON CONFLICT (month, contract_type, slot) DO UPDATE
+            SET periods = d.periods + EXCLUDED.periods,
+                billed = d.billed + EXCLUDED.billed,
+                collected = d.collected + EXCLUDED.collected,
+                outstanding = d.outstanding + EXCLUDED.outstanding
+    $q$, p_contract_type, p_amount_column, p_date_column, p_rows)
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION rollup_ar_statement(
+    p_op TEXT, p_contract_type TEXT, p_amount_column TEXT, p_date_column TEXT
+) RETURNS TEXT AS $$
+    SELECT rollup_ar_rows(rollup_changed_rows(p_op), p_contract_type, p_amount_column, p_date_column)
+$$ LANGUAGE sql IMMUTABLE;
+
+-- TG_ARGV: 合約類型、金額欄位、日期欄位
+CREATE OR REPLACE FUNCTION rollup_ar_change() RETURNS trigger AS $$
+BEGIN
+    EXECUTE rollup_ar_statement(TG_OP, TG_ARGV[0], TG_ARGV[1], TG_ARGV[2]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_contract_statement(p_op TEXT, p_contract_type TEXT) RETURNS TEXT AS $$
+    SELECT format($q$
+        INSERT INTO dashboard_contracts AS d (contract_type, status, slot, contracts, payables_due)
+        SELECT %1$L, status, pg_backend_pid() %% dashboard_slots(), SUM(sign), SUM(sign * payables_due)
+        FROM (
+            SELECT COALESCE(r ->> 'status', 'active') AS status, sign,
+                   CASE WHEN r ->> 'sales_payment_status' <> '已付款'
+                        THEN COALESCE((r ->> 'sales_amount')::NUMERIC, 0) ELSE 0 END +
+                   CASE WHEN r ->> 'service_payment_status' <> '已付款'
+                        THEN COALESCE((r ->> 'service_amount')::NUMERIC, 0) ELSE 0 END AS payables_due
+            FROM (%2$s) AS c(r, sign)
+        ) con
+        GROUP BY status
+        ORDER BY status
+        ON CONFLICT (contract_type, status, slot) DO UPDATE
+            SET contracts = d.contracts + EXCLUDED.contracts,
+                payables_due = d.payables_due + EXCLUDED.payables_due
+    $q$, p_contract_type, rollup_changed_rows(p_op))
+$$ LANGUAGE sql IMMUTABLE;
+
+-- TG_ARGV: 合約類型
+CREATE OR REPLACE FUNCTION rollup_contract_change() RETURNS trigger AS $$
+BEGIN
+    EXECUTE rollup_contract_statement(TG_OP, TG_ARGV[0]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 語句層級觸發器：批次寫入（COPY 重建帳款等）每個語句只更新一次彙總
+-- 轉移資料表的觸發器只能對應一種事件，每張表建立新增／修改／刪除三個觸發器
+DO $$
+DECLARE
+    t RECORD;
+    args TEXT;
+BEGIN
+    FOR t IN SELECT * FROM (VALUES
+        ('ar_leasing', 'rollup_ar_change', '租賃', 'total_rent', 'start_date'),
+        ('ar_buyout', 'rollup_ar_change', '買斷', 'total_amount', 'deal_date'),
+        ('contracts_leasing', 'rollup_contract_change', '租賃', NULL, NULL),
+        ('contracts_buyout', 'rollup_contract_change', '買斷', NULL, NULL)
+    ) AS v(table_name, function_name, contract_type, amount_column, date_column) LOOP
+        args := concat_ws(', ', quote_literal(t.contract_type),
+                          quote_literal(t.amount_column), quote_literal(t.date_column));
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_rollup_insert ON %1$I', t.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_rollup_update ON %1$I', t.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_rollup_delete ON %1$I', t.table_name);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%1$s_rollup_insert AFTER INSERT ON %1$I
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION %2$I(%3$s)', t.table_name, t.function_name, args);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%1$s_rollup_update AFTER UPDATE ON %1$I
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION %2$I(%3$s)', t.table_name, t.function_name, args);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%1$s_rollup_delete AFTER DELETE ON %1$I
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION %2$I(%3$s)', t.table_name, t.function_name, args);
+    END LOOP;
+END;
+$$;
+
+-- 全部重算（修復用）：鎖住來源表避免重算期間有寫入
+CREATE OR REPLACE FUNCTION rebuild_dashboard_rollups() RETURNS void AS $$
+BEGIN
+    LOCK TABLE ar_leasing, ar_buyout, contracts_leasing, contracts_buyout IN SHARE MODE;
+    DELETE FROM dashboard_ar_monthly;
+    DELETE FROM dashboard_contracts;
+
+    INSERT INTO dashboard_ar_monthly (month, contract_type, periods, billed, collected, outstanding)
+    SELECT month, contract_type, COUNT(*), SUM(billed), SUM(collected),
+           SUM(GREATEST(billed + fee - collected, 0))
+    FROM (
+        SELECT date_trunc('month', start_date)::DATE AS month, '租賃' AS contract_type,
+               COALESCE(total_rent, 0) AS billed, COALESCE(received_amount, 0) AS collected,
+               COALESCE(fee, 0) AS fee
+        FROM ar_leasing
+        UNION ALL
+        SELECT date_trunc('month', deal_date)::DATE, '買斷',
+               COALESCE(total_amount, 0), COALESCE(received_amount, 0), COALESCE(fee, 0)
+        FROM ar_buyout
+    ) ar
+    WHERE month IS NOT NULL
+    GROUP BY month, contract_type;
+
+    INSERT INTO dashboard_contracts (contract_type, status, contracts, payables_due)
+    SELECT contract_type, status, COUNT(*), SUM(payables_due)
+    FROM (
+        SELECT '租賃' AS contract_type, COALESCE(status, 'active') AS status,
+               CASE WHEN sales_payment_status <> '已付款' THEN COALESCE(sales_amount, 0) ELSE 0 END +
+               CASE WHEN service_payment_status <> '已付款' THEN COALESCE(service_amount, 0) ELSE 0 END AS payables_due
+        FROM contracts_leasing
+        UNION ALL
+        SELECT '買斷', COALESCE(status, 'active'),
+               CASE WHEN sales_payment_status <> '已付款' THEN COALESCE(sales_amount, 0) ELSE 0 END +
+               CASE WHEN service_payment_status <> '已付款' THEN COALESCE(service_amount, 0) ELSE 0 END
+        FROM contracts_buyout
+    ) c
+    GROUP BY contract_type, status;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_dashboard_rollups();
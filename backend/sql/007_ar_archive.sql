@@ -0,0 +1,310 @@
+-- 應收帳款封存：已收款且超過保存年限的帳款由 scripts/archive_ar.py 分批移入壓縮的封存表
+-- 封存表以「合約 × 年度」打包：每列一個合約一個年度，該年度的期別以 JSONB 陣列存於 periods，
+-- 並設定 toast_tuple_target = 128，打包後的資料列都會嘗試壓縮（可用時使用 lz4，否則為 pglz）。
+-- 同一合約各期的欄位名稱與內容高度重複，壓縮後遠小於逐列儲存；索引也只需每個合約年度一筆。
+-- 查詢時透過 <表>_archive_rows 檢視表展開為原表的查詢欄位（include_archived 查詢、儀表板重算使用）
+
+-- 舊版封存表為與原表相同格式的逐列資料表：先改名，建立打包的封存表後轉入
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['ar_leasing_archive', 'ar_buyout_archive'] LOOP
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = t AND column_name = 'id'
+        ) THEN
+            EXECUTE format('ALTER TABLE %I RENAME TO %I', t, t || '_unpacked');
+        END IF;
+    END LOOP;
+END;
+$$;
+
+CREATE TABLE IF NOT EXISTS ar_leasing_archive (
+    contract_code VARCHAR(50) NOT NULL,
+    period_year INT NOT NULL,
+    customer_code VARCHAR(50),
+    periods JSONB NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (contract_code, period_year)
+) WITH (toast_tuple_target = 128);
+
+CREATE TABLE IF NOT EXISTS ar_buyout_archive (
+    contract_code VARCHAR(50) NOT NULL,
+    period_year INT NOT NULL,
+    customer_code VARCHAR(50),
+    periods JSONB NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (contract_code, period_year)
+) WITH (toast_tuple_target = 128);
+
+-- lz4 壓縮較快（PostgreSQL 14 以上且編譯時支援 lz4），不支援時沿用預設的 pglz
+DO $$
+BEGIN
+    ALTER TABLE ar_leasing_archive ALTER COLUMN periods SET COMPRESSION lz4;
+    ALTER TABLE ar_buyout_archive ALTER COLUMN periods SET COMPRESSION lz4;
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE '封存表使用預設壓縮方式：%', SQLERRM;
+END;
+$$;
+
+-- 轉入舊版逐列封存表的資料（不影響儀表板彙總），轉入後刪除舊表
+DO $$
+DECLARE
+    t RECORD;
+BEGIN
+    PERFORM set_config('app.archiving', 'on', true);
+    FOR t IN SELECT * FROM (VALUES
+        ('ar_leasing_archive', 'end_date'),
+        ('ar_buyout_archive', 'deal_date')
+    ) AS v(archive, archive_key) LOOP
+        IF to_regclass(t.archive || '_unpacked') IS NOT NULL THEN
+            EXECUTE format(
+                'INSERT INTO %1$I AS a (contract_code, period_year, customer_code, periods)
+                 SELECT contract_code, EXTRACT(YEAR FROM %2$I)::INT, MAX(customer_code),
+                        jsonb_agg(to_jsonb(r) - ''archived_at'' ORDER BY id)
+                 FROM %3$I r
+                 WHERE contract_code IS NOT NULL
+                 GROUP BY contract_code, EXTRACT(YEAR FROM %2$I)
+                 ON CONFLICT (contract_code, period_year) DO UPDATE
+                     SET periods = a.periods || EXCLUDED.periods',
+                t.archive, t.archive_key, t.archive || '_unpacked');
+            EXECUTE format('DROP TABLE %I', t.archive || '_unpacked');
+        END IF;
+    END LOOP;
+END;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_ar_leasing_archive_customer ON ar_leasing_archive (customer_code);
+CREATE INDEX IF NOT EXISTS idx_ar_buyout_archive_customer ON ar_buyout_archive (customer_code);
+
+-- 展開為原表的查詢欄位；合約編號與客戶代碼以打包列為準（代碼變更時只改打包列）。
+-- 欄位逐一列出而不引用原表的資料列型別，原表改為分割表（scripts/partition_ar.py）時不受影響
+CREATE OR REPLACE VIEW ar_leasing_archive_rows AS
+SELECT r.id, a.contract_code, a.customer_code, r.customer_name, r.start_date, r.end_date,
+       r.total_rent, r.fee, r.received_amount, r.payment_status, a.archived_at
+FROM ar_leasing_archive a
+CROSS JOIN LATERAL jsonb_array_elements(a.periods) AS p(period)
+CROSS JOIN LATERAL jsonb_to_record(p.period) AS r(
+    id INT, customer_name VARCHAR(255), start_date DATE, end_date DATE,
+    total_rent NUMERIC, fee NUMERIC, received_amount NUMERIC, payment_status VARCHAR(20)
+);
+
+CREATE OR REPLACE VIEW ar_buyout_archive_rows AS
+SELECT r.id, a.contract_code, a.customer_code, r.customer_name, r.deal_date,
+       r.total_amount, r.fee, r.received_amount, r.payment_status, a.archived_at
+FROM ar_buyout_archive a
+CROSS JOIN LATERAL jsonb_array_elements(a.periods) AS p(period)
+CROSS JOIN LATERAL jsonb_to_record(p.period) AS r(
+    id INT, customer_name VARCHAR(255), deal_date DATE,
+    total_amount NUMERIC, fee NUMERIC, received_amount NUMERIC, payment_status VARCHAR(20)
+);
+
+-- 封存時以 SET LOCAL app.archiving = 'on' 搬移，儀表板月彙總仍計入已封存的帳款
+CREATE OR REPLACE FUNCTION rollup_ar_change() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('app.archiving', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    EXECUTE rollup_ar_statement(TG_OP, TG_ARGV[0], TG_ARGV[1], TG_ARGV[2]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 封存打包列異動的期別（展開 periods）：sign = 1 加入、-1 移除
+CREATE OR REPLACE FUNCTION rollup_packed_rows(p_op TEXT) RETURNS TEXT AS $$
+    SELECT CASE p_op
+        WHEN 'INSERT' THEN 'SELECT e, 1 FROM new_rows n, jsonb_array_elements(n.periods) e'
+        WHEN 'DELETE' THEN 'SELECT e, -1 FROM old_rows o, jsonb_array_elements(o.periods) e'
+        ELSE 'SELECT e, 1 FROM new_rows n, jsonb_array_elements(n.periods) e
+              UNION ALL SELECT e, -1 FROM old_rows o, jsonb_array_elements(o.periods) e'
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+-- TG_ARGV: 合約類型、金額欄位、日期欄位
+CREATE OR REPLACE FUNCTION rollup_archive_change() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('app.archiving', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    EXECUTE rollup_ar_rows(rollup_packed_rows(TG_OP), TG_ARGV[0], TG_ARGV[1], TG_ARGV[2]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 全部重算時一併納入封存表
+CREATE OR REPLACE FUNCTION rebuild_dashboard_rollups() RETURNS void AS $$
+BEGIN
+    LOCK TABLE ar_leasing, ar_buyout, ar_leasing_archive, ar_buyout_archive,
+               contracts_leasing, contracts_buyout IN SHARE MODE;
+    DELETE FROM dashboard_ar_monthly;
+    DELETE FROM dashboard_contracts;
+
+    INSERT INTO dashboard_ar_monthly (month, contract_type, periods, billed, collected, outstanding)
+    SELECT month, contract_type, COUNT(*), SUM(billed), SUM(collected),
+           SUM(GREATEST(billed + fee - collected, 0))
+    FROM (
+        SELECT date_trunc('month', start_date)::DATE AS month, '租賃' AS contract_type,
+               COALESCE(total_rent, 0) AS billed, COALESCE(received_amount, 0) AS collected,
+               COALESCE(fee, 0) AS fee
+        FROM ar_leasing
+        UNION ALL
+        SELECT date_trunc('month', start_date)::DATE, '租賃',
+               COALESCE(total_rent, 0), COALESCE(received_amount, 0), COALESCE(fee, 0)
+        FROM ar_leasing_archive_rows
+        UNION ALL
+        SELECT date_trunc('month', deal_date)::DATE, '買斷',
+               COALESCE(total_amount, 0), COALESCE(received_amount, 0), COALESCE(fee, 0)
+        FROM ar_buyout
+        UNION ALL
+        SELECT date_trunc('month', deal_date)::DATE, '買斷',
+               COALESCE(total_amount, 0), COALESCE(received_amount, 0), COALESCE(fee, 0)
+        FROM ar_buyout_archive_rows
+    ) ar
+    WHERE month IS NOT NULL
+    GROUP BY month, contract_type;
+
+    INSERT INTO dashboard_contracts (contract_type, status, contracts, payables_due)
+    SELECT contract_type, status, COUNT(*), SUM(payables_due)
+    FROM (
+        SELECT '租賃' AS contract_type, COALESCE(status, 'active') AS status,
+               CASE WHEN sales_payment_status <> '已付款' THEN COALESCE(sales_amount, 0) ELSE 0 END +
+               CASE WHEN service_payment_status <> '已付款' THEN COALESCE(service_amount, 0) ELSE 0 END AS payables_due
+        FROM contracts_leasing
+        UNION ALL
+        SELECT '買斷', COALESCE(status, 'active'),
+               CASE WHEN sales_payment_status <> '已付款' THEN COALESCE(sales_amount, 0) ELSE 0 END +
+               CASE WHEN service_payment_status <> '已付款' THEN COALESCE(service_amount, 0) ELSE 0 END
+        FROM contracts_buyout
+    ) c
+    GROUP BY contract_type, status;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 封存資料跟著合約與帳款異動，不留下對不到合約或與新帳款重複的封存帳款：
+--   合約刪除 → 刪除該合約的封存帳款；合約編號、客戶代碼變更 → 封存帳款一併改代碼
+--   帳款以合約為單位刪除（暫停、重新產生） → 刪除該合約的封存帳款
+--   新增的帳款與封存帳款為同一合約、同一期別 → 以新帳款為準，從打包列移除封存的那一期
+-- 封存搬移本身（app.archiving = 'on'）不觸發
+
+-- TG_ARGV[0]：封存表
+CREATE OR REPLACE FUNCTION archive_drop_contracts() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('app.archiving', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    EXECUTE format(
+        'DELETE FROM %I WHERE contract_code IN (SELECT contract_code FROM old_rows)', TG_ARGV[0]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- TG_ARGV[0]：封存表；TG_ARGV[1]：期別日期欄位
+CREATE OR REPLACE FUNCTION archive_drop_regenerated() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('app.archiving', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    EXECUTE format(
+        'UPDATE %1$I a
+         SET periods = COALESCE((
+             SELECT jsonb_agg(x.period ORDER BY x.ord)
+             FROM jsonb_array_elements(a.periods) WITH ORDINALITY AS x(period, ord)
+             WHERE NOT EXISTS (
+                 SELECT 1 FROM new_rows n
+                 WHERE n.contract_code = a.contract_code AND n.%2$I = (x.period ->> %2$L)::DATE
+             )
+         ), ''[]''::JSONB)
+         WHERE a.contract_code IN (SELECT contract_code FROM new_rows)
+           AND EXISTS (
+               SELECT 1 FROM jsonb_array_elements(a.periods) AS e(period)
+               JOIN new_rows n ON n.contract_code = a.contract_code
+                              AND n.%2$I = (e.period ->> %2$L)::DATE
+           )', TG_ARGV[0], TG_ARGV[1]);
+    EXECUTE format('DELETE FROM %I WHERE periods = ''[]''::JSONB', TG_ARGV[0]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- TG_ARGV[0]：代碼欄位；TG_ARGV[1...]：封存表（依 id 對應修改前後的資料列）
+CREATE OR REPLACE FUNCTION archive_follow_code_change() RETURNS trigger AS $$
+DECLARE
+    i INT;
+BEGIN
+    FOR i IN 1 .. TG_NARGS - 1 LOOP
+        EXECUTE format(
+            'UPDATE %1$I a SET %2$I = n.%2$I
+             FROM old_rows o JOIN new_rows n ON n.id = o.id
+             WHERE a.%2$I = o.%2$I AND n.%2$I IS DISTINCT FROM o.%2$I', TG_ARGV[i], TG_ARGV[0]);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_contracts_leasing_archive_delete ON contracts_leasing;
+CREATE TRIGGER trg_contracts_leasing_archive_delete AFTER DELETE ON contracts_leasing
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION archive_drop_contracts('ar_leasing_archive');
+
+DROP TRIGGER IF EXISTS trg_contracts_buyout_archive_delete ON contracts_buyout;
+CREATE TRIGGER trg_contracts_buyout_archive_delete AFTER DELETE ON contracts_buyout
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION archive_drop_contracts('ar_buyout_archive');
+
+DROP TRIGGER IF EXISTS trg_ar_leasing_archive_delete ON ar_leasing;
+CREATE TRIGGER trg_ar_leasing_archive_delete AFTER DELETE ON ar_leasing
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION archive_drop_contracts('ar_leasing_archive');
+
+DROP TRIGGER IF EXISTS trg_ar_buyout_archive_delete ON ar_buyout;
+CREATE TRIGGER trg_ar_buyout_archive_delete AFTER DELETE ON ar_buyout
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION archive_drop_contracts('ar_buyout_archive');
+
+DROP TRIGGER IF EXISTS trg_ar_leasing_archive_insert ON ar_leasing;
+CREATE TRIGGER trg_ar_leasing_archive_insert AFTER INSERT ON ar_leasing
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION archive_drop_regenerated('ar_leasing_archive', 'start_date');
+
+DROP TRIGGER IF EXISTS trg_ar_buyout_archive_insert ON ar_buyout;
+CREATE TRIGGER trg_ar_buyout_archive_insert AFTER INSERT ON ar_buyout
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION archive_drop_regenerated('ar_buyout_archive', 'deal_date');
+
+DROP TRIGGER IF EXISTS trg_contracts_leasing_archive_code ON contracts_leasing;
+CREATE TRIGGER trg_contracts_leasing_archive_code AFTER UPDATE ON contracts_leasing
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION archive_follow_code_change('contract_code', 'ar_leasing_archive');
+
+DROP TRIGGER IF EXISTS trg_contracts_buyout_archive_code ON contracts_buyout;
+CREATE TRIGGER trg_contracts_buyout_archive_code AFTER UPDATE ON contracts_buyout
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION archive_follow_code_change('contract_code', 'ar_buyout_archive');
+
+DROP TRIGGER IF EXISTS trg_customers_archive_code ON customers;
+CREATE TRIGGER trg_customers_archive_code AFTER UPDATE ON customers
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION archive_follow_code_change(
+        'customer_code', 'ar_leasing_archive', 'ar_buyout_archive');
+
+-- 封存的期別被移除（刪除打包列或從 periods 移除）時從儀表板月彙總扣除；
+-- 封存搬移時的新增不計（見 rollup_ar_change），代碼變更前後的期別相同，加減後不變
+DROP TRIGGER IF EXISTS trg_ar_leasing_archive_rollup_delete ON ar_leasing_archive;
+CREATE TRIGGER trg_ar_leasing_archive_rollup_delete AFTER DELETE ON ar_leasing_archive
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_archive_change('租賃', 'total_rent', 'start_date');
+
+DROP TRIGGER IF EXISTS trg_ar_leasing_archive_rollup_update ON ar_leasing_archive;
+CREATE TRIGGER trg_ar_leasing_archive_rollup_update AFTER UPDATE ON ar_leasing_archive
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_archive_change('租賃', 'total_rent', 'start_date');
+
+DROP TRIGGER IF EXISTS trg_ar_buyout_archive_rollup_delete ON ar_buyout_archive;
+CREATE TRIGGER trg_ar_buyout_archive_rollup_delete AFTER DELETE ON ar_buyout_archive
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_archive_change('買斷', 'total_amount', 'deal_date');
+
+DROP TRIGGER IF EXISTS trg_ar_buyout_archive_rollup_update ON ar_buyout_archive;
+CREATE TRIGGER trg_ar_buyout_archive_rollup_update AFTER UPDATE ON ar_buyout_archive
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_archive_change('買斷', 'total_amount', 'deal_date');
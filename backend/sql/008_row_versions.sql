@@ -0,0 +1,24 @@
+-- 樂觀鎖版本號：每次 UPDATE 由觸發器自動 +1
+-- 客戶與合約的修改／暫停／恢復以 If-Match 帶入讀取時的 version，版本不符即回 412，不必先鎖定資料列
+
+CREATE OR REPLACE FUNCTION bump_row_version() RETURNS trigger AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['customers', 'contracts_leasing', 'contracts_buyout'] LOOP
+        EXECUTE format('ALTER TABLE %I ADD COLUMN IF NOT EXISTS version INT NOT NULL DEFAULT 1', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_row_version ON %1$I', t);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%1$s_row_version
+                BEFORE UPDATE ON %1$I
+                FOR EACH ROW EXECUTE FUNCTION bump_row_version()', t);
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,44 @@
+-- 每月發票：需開發票（needs_invoice）合約的應收帳款，每一期開立一張
+-- 執行方式：psql "$DATABASE_URL" -f sql/009_invoices.sql
+
+CREATE TABLE IF NOT EXISTS invoices (
+    id              SERIAL        PRIMARY KEY,
+    invoice_no      VARCHAR(20)   NOT NULL UNIQUE,
+    invoice_month   DATE          NOT NULL,
+    source          VARCHAR(10)   NOT NULL,
+    ar_id           INT           NOT NULL,
+    contract_code   VARCHAR(50)   NOT NULL,
+    customer_code   VARCHAR(50),
+    customer_name   VARCHAR(255),
+    period_start    DATE          NOT NULL,
+    period_end      DATE,
+    net_amount      NUMERIC(14, 2) NOT NULL,
+    tax_amount      NUMERIC(14, 2) NOT NULL,
+    total_amount    NUMERIC(14, 2) NOT NULL,
+    document_path   TEXT,
+    rendered_at     TIMESTAMP,
+    created_at      TIMESTAMP     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- 合約修改會重建帳款（ar_id 改變），以合約與期別起日判斷同一期，重跑不會重複開立
+    UNIQUE (source, contract_code, period_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_invoices_month
+    ON invoices (invoice_month, id);
+
+-- 重跑時只產生尚未輸出文件的發票
+CREATE INDEX IF NOT EXISTS idx_invoices_unrendered
+    ON invoices (invoice_month) WHERE rendered_at IS NULL;
+
+-- 開立發票只需要 needs_invoice 的合約
+CREATE INDEX IF NOT EXISTS idx_contracts_leasing_needs_invoice
+    ON contracts_leasing (contract_code) WHERE needs_invoice;
+
+CREATE INDEX IF NOT EXISTS idx_contracts_buyout_needs_invoice
+    ON contracts_buyout (contract_code) WHERE needs_invoice;
+
+-- 依期別起日（租賃）／成交日（買斷）挑出當月帳款
+CREATE INDEX IF NOT EXISTS idx_ar_leasing_start_date
+    ON ar_leasing (start_date);
+
+CREATE INDEX IF NOT EXISTS idx_ar_buyout_deal_date
+    ON ar_buyout (deal_date);
@@ -0,0 +1,33 @@
+-- 背景工作：耗時作業（發票、封存、對帳、重建帳款等）排入 jobs，由 worker 行程執行
+-- 執行方式：psql "$DATABASE_URL" -f sql/010_jobs.sql
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id                BIGSERIAL     PRIMARY KEY,
+    job_type          VARCHAR(50)   NOT NULL,
+    payload           JSONB         NOT NULL DEFAULT '{}',
+    status            VARCHAR(20)   NOT NULL DEFAULT 'queued',  -- queued / running / succeeded / failed / cancelled
+    attempts          INT           NOT NULL DEFAULT 0,
+    max_attempts      INT           NOT NULL DEFAULT 3,
+    run_after         TIMESTAMP     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    progress_done     BIGINT,
+    progress_total    BIGINT,
+    progress_message  TEXT,
+    result            JSONB,
+    error             TEXT,
+    worker            VARCHAR(100),
+    created_at        TIMESTAMP     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at        TIMESTAMP,
+    heartbeat_at      TIMESTAMP,
+    finished_at       TIMESTAMP
+);
+
+-- worker 取下一個工作：只掃描排隊中的工作
+CREATE INDEX IF NOT EXISTS idx_jobs_queued
+    ON jobs (run_after, id) WHERE status = 'queued';
+
+-- 依類型計算執行中的數量（併發上限）與找出停止回應的工作
+CREATE INDEX IF NOT EXISTS idx_jobs_running
+    ON jobs (job_type, heartbeat_at) WHERE status = 'running';
+
+CREATE INDEX IF NOT EXISTS idx_jobs_created
+    ON jobs (created_at DESC);
@@ -0,0 +1,19 @@
+-- 客戶總覽（GET /api/customers/{customer_code}/overview）：各表依 customer_code 取資料的索引
+-- 執行方式：psql "$DATABASE_URL" -f sql/011_customer_overview.sql
+
+CREATE INDEX IF NOT EXISTS idx_contracts_leasing_customer
+    ON contracts_leasing (customer_code);
+
+CREATE INDEX IF NOT EXISTS idx_contracts_buyout_customer
+    ON contracts_buyout (customer_code);
+
+-- 未結清帳款以 customer_code + payment_status 篩選
+CREATE INDEX IF NOT EXISTS idx_ar_leasing_customer_status
+    ON ar_leasing (customer_code, payment_status);
+
+CREATE INDEX IF NOT EXISTS idx_ar_buyout_customer_status
+    ON ar_buyout (customer_code, payment_status);
+
+-- 最近的服務費用：依日期由新到舊取前幾筆
+CREATE INDEX IF NOT EXISTS idx_service_expense_customer_date
+    ON service_expense (customer_code, service_date DESC);
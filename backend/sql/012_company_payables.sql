@@ -0,0 +1,17 @@
+-- 合作公司對帳單（GET /api/companies/{company_code}/statement）：依公司欄位取應付款項的索引
+-- 執行方式：psql "$DATABASE_URL" -f sql/012_company_payables.sql
+
+CREATE INDEX IF NOT EXISTS idx_contracts_leasing_sales_company
+    ON contracts_leasing (sales_company_code, start_date) WHERE sales_amount > 0;
+
+CREATE INDEX IF NOT EXISTS idx_contracts_leasing_service_company
+    ON contracts_leasing (service_company_code, start_date) WHERE service_amount > 0;
+
+CREATE INDEX IF NOT EXISTS idx_contracts_buyout_sales_company
+    ON contracts_buyout (sales_company_code, deal_date) WHERE sales_amount > 0;
+
+CREATE INDEX IF NOT EXISTS idx_contracts_buyout_service_company
+    ON contracts_buyout (service_company_code, deal_date) WHERE service_amount > 0;
+
+CREATE INDEX IF NOT EXISTS idx_service_expense_repair_company
+    ON service_expense (repair_company_code, service_date) WHERE total_amount > 0;
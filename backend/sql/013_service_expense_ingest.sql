@@ -0,0 +1,15 @@
+-- 服務費用批次匯入與彙總（POST /api/accounts/service/batch、GET /api/accounts/service/summary）
+-- 執行方式：psql "$DATABASE_URL" -f sql/013_service_expense_ingest.sql
+
+-- 來源系統的服務單號：重複送出同一張服務單時更新而不是新增（手動建立的資料為 NULL）
+ALTER TABLE service_expense ADD COLUMN IF NOT EXISTS external_id VARCHAR(100);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_service_expense_external_id
+    ON service_expense (external_id);
+
+-- 依合約、月份彙總（依維修公司彙總使用 012 的 idx_service_expense_repair_company）
+CREATE INDEX IF NOT EXISTS idx_service_expense_contract
+    ON service_expense (contract_code, service_date);
+
+CREATE INDEX IF NOT EXISTS idx_service_expense_service_date
+    ON service_expense (service_date);
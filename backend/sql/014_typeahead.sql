@@ -0,0 +1,29 @@
+-- 代碼自動完成（GET /api/typeahead）：代碼與名稱的前綴索引
+-- 執行方式：psql "$DATABASE_URL" -f sql/014_typeahead.sql
+--
+-- 以 COLLATE "C" 建立 lower() 運算式索引：與 text_pattern_ops 一樣可用於 LIKE 'abc%' 前綴查詢，
+-- 另外也能依相同順序輸出，ORDER BY ... LIMIT 取前 N 筆時不必排序所有符合的資料
+
+CREATE INDEX IF NOT EXISTS idx_customers_code_prefix
+    ON customers ((lower(customer_code) COLLATE "C"));
+
+CREATE INDEX IF NOT EXISTS idx_customers_name_prefix
+    ON customers ((lower(name) COLLATE "C"));
+
+CREATE INDEX IF NOT EXISTS idx_companies_code_prefix
+    ON companies ((lower(company_code) COLLATE "C"));
+
+CREATE INDEX IF NOT EXISTS idx_companies_name_prefix
+    ON companies ((lower(name) COLLATE "C"));
+
+CREATE INDEX IF NOT EXISTS idx_contracts_leasing_code_prefix
+    ON contracts_leasing ((lower(contract_code) COLLATE "C"));
+
+CREATE INDEX IF NOT EXISTS idx_contracts_leasing_customer_name_prefix
+    ON contracts_leasing ((lower(customer_name) COLLATE "C"));
+
+CREATE INDEX IF NOT EXISTS idx_contracts_buyout_code_prefix
+    ON contracts_buyout ((lower(contract_code) COLLATE "C"));
+
+CREATE INDEX IF NOT EXISTS idx_contracts_buyout_customer_name_prefix
+    ON contracts_buyout ((lower(customer_name) COLLATE "C"));
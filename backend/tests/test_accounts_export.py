@@ -0,0 +1,65 @@
+"""帳款匯出：CSV 欄位與未收帳款篩選"""
+import csv
+from datetime import date
+import pytest
+from app.services.accounts_export import EXPORT_FILES, export_accounts
+
+class _Cursor:
+    def __init__(self, conn, name=None):
+        self.conn = conn
+        self.name = name
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append(sql)
+        if self.name and "FROM ar_leasing" in sql:
+            self.rows = list(self.conn.leasing)
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+class _Conn:
+    def __init__(self, leasing):
+        self.leasing = leasing
+        self.executed = []
+        self.rolled_back = False
+
+    def cursor(self, name=None):
+        return _Cursor(self, name)
+
+    def rollback(self):
+        self.rolled_back = True
+
+def _read(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return list(csv.reader(f))
+
+def test_exports_all_files_and_filters_unpaid_receivables(tmp_path):
+    conn = _Conn([
+        (1, "租賃", "L001", "C001", "大發印刷", date(2026, 1, 1), date(2026, 1, 31), 1000, 30, 1030, "已收款"),
+        (2, "租賃", "L001", "C001", "大發印刷", date(2026, 2, 1), date(2026, 2, 28), 1000, 30, 500, "部分收款"),
+    ])
+    progress = []
+
+    counts = export_accounts(conn, str(tmp_path), receivables={"type": "租賃"}, on_file=progress.append)
+
+    assert list(counts) == EXPORT_FILES
+    assert counts["receivables.csv"] == 2 and counts["unpaid_receivables.csv"] == 1
+    assert progress == [2, 3, 4, 5]
+    assert conn.rolled_back
+    unpaid = _read(tmp_path / "unpaid_receivables.csv")
+    assert unpaid[0][-3:] == ["應收總額", "未收金額", "繳費狀況"]
+    assert unpaid[1] == ["租賃", "L001", "C001", "大發印刷", "2026-02-01", "2026-02-28",
+                         "1000.0", "30.0", "500.0", "1030.0", "530.0", "部分收款"]
+    assert _read(tmp_path / "service_expenses.csv")[1:] == []
+
+def test_rejects_unknown_filters(tmp_path):
+    with pytest.raises(ValueError):
+        export_accounts(_Conn([]), str(tmp_path), payables={"company": "X"})
@@ -0,0 +1,54 @@
+"""資料庫往返次數：已知語句序列的計數
+
+需要 PostgreSQL：設定 TEST_DATABASE_URL 後才會執行。
+"""
+import os
+import pytest
+from app.database import CountingConnection, round_trip_counter
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="未設定 TEST_DATABASE_URL")
+
+@pytest.fixture
+def conn():
+    with CountingConnection.connect(TEST_DATABASE_URL) as conn:
+        yield conn
+        conn.rollback()
+
+def test_statements_outside_pipeline(conn):
+    with round_trip_counter() as round_trips:
+        conn.execute("SELECT 1")  # BEGIN + 語句
+        conn.execute("SELECT 2")
+        conn.commit()
+        conn.commit()  # 沒有進行中的交易，不送出
+    assert round_trips[0] == 4
+
+def test_pipeline_syncs(conn):
+    with round_trip_counter() as round_trips:
+        with conn.pipeline():
+            conn.execute("SELECT 1")  # BEGIN 立即同步
+            conn.execute("SELECT 2")
+            conn.commit()  # 與排隊中的語句一起同步
+    assert round_trips[0] == 2
+
+    with round_trip_counter() as round_trips:
+        with conn.pipeline() as pipeline:
+            conn.execute("SELECT 1")
+            conn.execute("SELECT 2")
+            pipeline.sync()
+            cur = conn.execute("SELECT 3")
+        assert cur.fetchone() == (3,)
+        conn.rollback()
+    assert round_trips[0] == 4
+
+def test_server_cursor_and_copy(conn):
+    conn.execute("CREATE TEMP TABLE round_trip_copy (n INT)")
+    with round_trip_counter() as round_trips:
+        with conn.cursor() as cur:
+            with cur.copy("COPY round_trip_copy (n) FROM STDIN") as copy:
+                copy.write_row((1,))
+        with conn.cursor(name="round_trip_stream") as stream:
+            stream.execute("SELECT n FROM round_trip_copy")  # DECLARE + 欄位描述
+            assert stream.fetchmany(10) == [(1,)]
+    # COPY 開始與結束 2 次、DECLARE 2 次、FETCH 1 次、關閉游標 1 次
+    assert round_trips[0] == 6
@@ -0,0 +1,75 @@
+"""串流 JSON 回應：讀取失敗的輸出與連線歸還"""
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.services import json_stream
+
+class _Stream:
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.name = name
+        self.rows = None
+
+    def execute(self, sql, params):
+        if sql == "bad sql":
+            raise RuntimeError("syntax error")
+        self.rows = list(params)
+
+    def fetchmany(self, size):
+        if self.rows and self.rows[0] == "boom":
+            raise RuntimeError("division by zero")
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        self.conn.closed_streams.append(self.name)
+
+class _Conn:
+    def __init__(self):
+        self.closed_streams = []
+
+    def cursor(self, name):
+        return _Stream(self, name)
+
+@pytest.fixture
+def conn(monkeypatch):
+    conn = _Conn()
+    returned = []
+    monkeypatch.setattr(json_stream, "take_read_connection", lambda: ("pool", conn))
+    monkeypatch.setattr(json_stream, "return_read_connection", lambda pool, c: returned.append(c))
+    conn.returned = returned
+    return conn
+
+def _client(statements):
+    app = FastAPI()
+
+    @app.get("/report")
+    def report():
+        return json_stream.stream_json_array(statements, lambda row: {"n": row})
+
+    return TestClient(app, raise_server_exceptions=False)
+
+def test_streams_all_statements_and_returns_connection(conn):
+    response = _client([("a", [1, 2]), ("b", [3])]).get("/report")
+
+    assert response.status_code == 200
+    assert response.json() == [{"n": 1}, {"n": 2}, {"n": 3}]
+    assert conn.returned == [conn]
+    assert conn.closed_streams == ["report_stream_0", "report_stream_1"]
+
+def test_query_error_before_output_is_500(conn):
+    response = _client([("a", [1]), ("bad sql", [])]).get("/report")
+
+    assert response.status_code == 500
+    assert conn.returned == [conn]
+
+def test_read_error_after_output_ends_with_error_marker(conn):
+    response = _client([("a", [1]), ("b", ["boom"])]).get("/report")
+
+    # 狀態碼已送出：以結尾的錯誤標記讓整份內容不是合法 JSON
+    assert response.status_code == 200
+    assert response.text.endswith('\n{"error": "讀取資料失敗，結果不完整"}')
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(response.text)
+    assert conn.returned == [conn]
@@ -0,0 +1,60 @@
+"""銀行對帳：候選帳款的篩選與計分"""
+from datetime import date
+from app.services import reconciliation
+from app.services.reconciliation import match_entries
+
+def _ar(ar_id, due_date, balance, customer_code="C001", customer_name="大發印刷"):
+    return {
+        "source": "leasing", "ar_id": ar_id, "contract_code": f"L{ar_id:03d}",
+        "customer_code": customer_code, "customer_name": customer_name,
+        "due_date": due_date, "balance": balance,
+    }
+
+def _entry(entry_id, txn_date, income, payer=None, note=None):
+    return {"bank_entry_id": entry_id, "txn_date": txn_date, "payer": payer, "note": note, "income": income}
+
+def test_ranks_by_amount_date_and_customer_hint():
+    receivables = [
+        _ar(1, date(2026, 3, 1), 1030, customer_code="C002", customer_name="永豐影印"),
+        _ar(2, date(2026, 3, 9), 1030),
+        _ar(3, date(2026, 3, 10), 1030, customer_code="C003", customer_name="長春文具"),
+        _ar(4, date(2026, 3, 10), 2000),
+    ]
+    entries = [_entry(10, date(2026, 3, 10), 1030, payer="大發印刷")]
+
+    [result] = match_entries(receivables, entries, window_days=10)
+
+    # 摘要提到客戶的優先，其次日期較近；金額不同的不列入
+    assert [c["ar_id"] for c in result["candidates"]] == [2, 3, 1]
+    assert result["candidates"][0]["score"] > result["candidates"][1]["score"] > result["candidates"][2]["score"]
+
+def test_tolerance_window_and_limit():
+    receivables = [
+        _ar(1, date(2026, 3, 10), 1015),
+        _ar(2, date(2026, 3, 10), 1000),
+        _ar(3, date(2026, 4, 30), 1000),
+        _ar(4, date(2026, 3, 10), 985),
+        _ar(5, date(2026, 3, 11), 1000),
+    ]
+    entries = [_entry(10, date(2026, 3, 10), 1000)]
+
+    # 入帳只會少於應收（客戶自行扣匯費）；超過 window_days 的帳款不列入
+    [result] = match_entries(receivables, entries, window_days=10, tolerance=15)
+    assert [c["ar_id"] for c in result["candidates"]] == [2, 5, 1]
+
+    [result] = match_entries(receivables, entries, window_days=10, tolerance=15, limit=1)
+    assert [c["ar_id"] for c in result["candidates"]] == [2]
+
+    [result] = match_entries(receivables, entries, window_days=10, tolerance=0)
+    assert [c["ar_id"] for c in result["candidates"]] == [2, 5]
+
+def test_parallel_matches_in_process_result(monkeypatch):
+    receivables = [_ar(i, date(2026, 1, 1 + i % 28), 1000 + i % 7) for i in range(1, 60)]
+    entries = [_entry(i, date(2026, 1, 1 + i % 28), 1000 + i % 5, note="C001") for i in range(40)]
+    expected = match_entries(receivables, entries, tolerance=3)
+
+    monkeypatch.setattr(reconciliation, "PARALLEL_THRESHOLD", 10)
+    try:
+        assert match_entries(receivables, entries, tolerance=3) == expected
+    finally:
+        reconciliation.shutdown_executor()
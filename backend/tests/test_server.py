@@ -0,0 +1,52 @@
+"""啟動入口：web worker 數與連線池大小的分配"""
+from types import SimpleNamespace
+import pytest
+from app import server
+
+def _settings(**overrides):
+    values = dict(max_connections=100, connection_reserve=10, job_workers=2,
+                  web_workers=4, pool_min_size=2, pool_max_size=10)
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+def _total_connections(settings, workers, pool_max_size):
+    return (workers * (pool_max_size + server.WORKER_EXTRA_CONNECTIONS)
+            + settings.job_workers * server.JOB_WORKER_CONNECTIONS + settings.connection_reserve)
+
+def test_pools_fit_within_connection_limit():
+    settings = _settings(max_connections=40, web_workers=8)
+
+    workers, pool_min_size, pool_max_size = server.plan_workers(settings)
+
+    # 可用 40 - 10 - 4 = 26 條：8 個 worker 各 3 條，其中 1 條給 LISTEN
+    assert (workers, pool_min_size, pool_max_size) == (8, 2, 2)
+    assert _total_connections(settings, workers, pool_max_size) <= settings.max_connections
+
+def test_configured_pool_size_kept_when_budget_allows():
+    assert server.plan_workers(_settings()) == (4, 2, 10)
+
+def test_budget_below_one_worker_exits():
+    # 可用 15 - 10 - 4 = 1 條，不足一個 worker 的連線池加 LISTEN
+    with pytest.raises(SystemExit):
+        server.plan_workers(_settings(max_connections=15))
+
+def test_reduces_workers_when_budget_is_small():
+    settings = _settings(max_connections=19, web_workers=8)
+
+    workers, pool_min_size, pool_max_size = server.plan_workers(settings)
+
+    # 可用 5 條：最多 2 個 worker，每個連線池 1 條
+    assert (workers, pool_min_size, pool_max_size) == (2, 1, 1)
+    assert _total_connections(settings, workers, pool_max_size) <= settings.max_connections
+
+def test_zero_web_workers_uses_cpu_count(monkeypatch):
+    monkeypatch.setattr(server.os, "cpu_count", lambda: 6)
+    assert server.plan_workers(_settings(web_workers=0))[0] == 6
+
+    monkeypatch.setattr(server.os, "cpu_count", lambda: None)
+    assert server.plan_workers(_settings(web_workers=0))[0] == 1
+
+def test_pool_min_clamped_to_pool_max():
+    assert server.plan_workers(_settings(pool_min_size=20, pool_max_size=5)) == (4, 5, 5)
+    # 連線池上限被預算壓低時，下限也跟著調整
+    assert server.plan_workers(_settings(max_connections=30, pool_min_size=8)) == (4, 3, 3)
@@ -0,0 +1,75 @@
+"""報表查詢合併：結果只在資料表版本相同時共用，等待時不佔用讀取連線"""
+import contextvars
+import threading
+from types import SimpleNamespace
+from app.services import http_cache, single_flight
+from app.services.single_flight import coalesce
+
+calls = []
+
+@coalesce
+def _report(code):
+    calls.append(code)
+    return len(calls)
+
+def _run_request(versions, code):
+    """模擬一個請求：ETag 讀到 versions 後查詢報表"""
+    def request():
+        if versions is not None:
+            http_cache._table_versions.set(versions)
+        return _report(code)
+    return contextvars.copy_context().run(request)
+
+def test_cached_result_only_reused_for_same_table_versions(monkeypatch):
+    monkeypatch.setattr(single_flight, "get_settings", lambda: SimpleNamespace(report_cache_ttl=60.0))
+    calls.clear()
+
+    v1 = (("ar_leasing", "1"), ("ar_buyout", "2"))
+    v2 = (("ar_leasing", "3"), ("ar_buyout", "2"))
+    assert _run_request(v1, "L001") == 1
+    assert _run_request(v1, "L001") == 1
+    # 資料表有寫入：版本不同，不使用保留的舊結果
+    assert _run_request(v2, "L001") == 2
+    assert _run_request(v1, "L002") == 3
+
+def test_results_not_kept_without_table_versions(monkeypatch):
+    monkeypatch.setattr(single_flight, "get_settings", lambda: SimpleNamespace(report_cache_ttl=60.0))
+    calls.clear()
+
+    assert _run_request(None, "L001") == 1
+    assert _run_request(None, "L001") == 2
+
+def test_waiting_request_releases_its_read_connection_first(monkeypatch):
+    monkeypatch.setattr(single_flight, "get_settings", lambda: SimpleNamespace(report_cache_ttl=0))
+    flight = single_flight.SingleFlight()
+    started, finish = threading.Event(), threading.Event()
+    events = []
+
+    def slow():
+        started.set()
+        finish.wait(5)
+        return "result"
+
+    leader = threading.Thread(target=lambda: events.append(flight.do("k", slow)))
+    leader.start()
+    started.wait(5)
+
+    def on_wait():
+        # 等待開始前歸還連線：此時領頭的查詢仍在進行
+        events.append("released")
+        finish.set()
+
+    assert flight.do("k", lambda: "not called", on_wait=on_wait) == "result"
+    leader.join(5)
+    assert events == ["released", "result"]
+
+def test_coalesce_releases_pinned_read_before_waiting(monkeypatch):
+    released = []
+    monkeypatch.setattr(single_flight, "release_current_read", lambda: released.append(True))
+    monkeypatch.setattr(single_flight.SingleFlight, "do",
+                        lambda self, key, fn, ttl=0, on_wait=None: on_wait() or fn())
+    monkeypatch.setattr(single_flight, "get_settings", lambda: SimpleNamespace(report_cache_ttl=0))
+    calls.clear()
+
+    assert _report("L001") == 1
+    assert released == [True]
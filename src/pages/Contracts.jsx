@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { Tabs, Table, Button, Input, Space, Modal, Form, InputNumber, DatePicker, Select, message, Popconfirm, Tag, Switch } from 'antd'
 import { PlusOutlined, EditOutlined, DeleteOutlined, SearchOutlined } from '@ant-design/icons'
 import dayjs from 'dayjs'
@@ -9,9 +9,52 @@ import {
   deleteLeasingContract, deleteBuyoutContract,
   pauseLeasingContract, resumeLeasingContract,
   pauseBuyoutContract, resumeBuyoutContract,
-  getCustomers, getCompanies
+  typeahead
 } from '../services/api'
 
+// 代碼下拉選單：輸入時依前綴向後端查詢前幾筆，不預先載入完整清單
+// 編輯時表單帶入的代碼不在選項內，先以 currentName（或依代碼查詢名稱）補上，才會顯示「代碼 名稱」
+function CodeSelect({ kind, companyType, currentName, ...props }) {
+  const [options, setOptions] = useState([])
+  const timer = useRef()
+  const value = props.value
+
+  useEffect(() => {
+    if (!value || options.some(o => o.value === value)) return
+    if (currentName) {
+      setOptions([{ value, label: `${value} ${currentName}` }])
+      return
+    }
+    let cancelled = false
+    typeahead(kind, value, { company_type: companyType })
+      .then(data => {
+        const match = data.find(d => d.code === value)
+        if (!cancelled) setOptions([{ value, label: `${value} ${match?.name || ''}` }])
+      })
+      .catch(() => {
+        if (!cancelled) setOptions([{ value, label: value }])
+      })
+    return () => { cancelled = true }
+  }, [value, currentName])
+
+  const handleSearch = (text) => {
+    clearTimeout(timer.current)
+    if (!text) return
+    timer.current = setTimeout(async () => {
+      try {
+        const data = await typeahead(kind, text, { company_type: companyType })
+        setOptions(data.map(d => ({ value: d.code, label: `${d.code} ${d.name || ''}` })))
+      } catch (error) {
+        setOptions([])
+      }
+    }, 150)
+  }
+
+  useEffect(() => () => clearTimeout(timer.current), [])
+
+  return <Select showSearch filterOption={false} onSearch={handleSearch} options={options} {...props} />
+}
+
 function Contracts() {
   const [searchText, setSearchText] = useState('')
   const [activeTab, setActiveTab] = useState('leasing')
@@ -19,27 +62,9 @@ function Contracts() {
   const [editingRecord, setEditingRecord] = useState(null)
   const [leasingData, setLeasingData] = useState([])
   const [buyoutData, setBuyoutData] = useState([])
-  const [customers, setCustomers] = useState([])
-  const [salesCompanies, setSalesCompanies] = useState([])
-  const [serviceCompanies, setServiceCompanies] = useState([])
   const [loading, setLoading] = useState(false)
   const [form] = Form.useForm()
 
-  const loadOptions = async () => {
-    try {
-      const [customersData, salesData, serviceData] = await Promise.all([
-        getCustomers(),
-        getCompanies('sales'),
-        getCompanies('service')
-      ])
-      setCustomers(customersData.map(c => ({ value: c.customer_code, label: c.name })))
-      setSalesCompanies(salesData.map(c => ({ value: c.company_code, label: c.name })))
-      setServiceCompanies(serviceData.map(c => ({ value: c.company_code, label: c.name })))
-    } catch (error) {
-      message.error('載入選項資料失敗')
-    }
-  }
-
   const loadLeasingData = async () => {
     setLoading(true)
     try {
@@ -64,10 +89,6 @@ function Contracts() {
     }
   }
 
-  useEffect(() => {
-    loadOptions()
-  }, [])
-
   useEffect(() => {
     if (activeTab === 'leasing') {
       loadLeasingData()
@@ -166,9 +187,11 @@ function Contracts() {
 
   const handleEdit = (record, type) => {
     setEditingRecord({ ...record, type })
-    const formValues = type === 'leasing' 
-      ? { ...record, start_date: dayjs(record.start_date), needs_invoice: record.needs_invoice ?? false }
-      : { ...record, deal_date: dayjs(record.deal_date), needs_invoice: record.needs_invoice ?? false }
+    // 客戶欄位的值是客戶代碼（送出時轉為 customer_code）
+    const base = { ...record, customer_name: record.customer_code, needs_invoice: record.needs_invoice ?? false }
+    const formValues = type === 'leasing'
+      ? { ...base, start_date: dayjs(record.start_date) }
+      : { ...base, deal_date: dayjs(record.deal_date) }
     form.setFieldsValue(formValues)
     setIsModalOpen(true)
   }
@@ -240,11 +263,11 @@ function Contracts() {
 
       if (editingRecord.contract_code) {
         if (editingRecord.type === 'leasing') {
-          await updateLeasingContract(editingRecord.contract_code, submitData)
+          await updateLeasingContract(editingRecord.contract_code, submitData, editingRecord.version)
           message.success('更新成功！已重新生成應收帳款。')
           loadLeasingData()
         } else {
-          await updateBuyoutContract(editingRecord.contract_code, submitData)
+          await updateBuyoutContract(editingRecord.contract_code, submitData, editingRecord.version)
           message.success('更新成功！已重新生成應收帳款。')
           loadBuyoutData()
         }
@@ -273,7 +296,7 @@ function Contracts() {
         <Input />
       </Form.Item>
       <Form.Item label="客戶名稱" name="customer_name" rules={[{ required: true }]}>
-        <Select options={customers} />
+        <CodeSelect kind="customer" currentName={editingRecord?.customer_name} placeholder="輸入客戶代碼或名稱" />
       </Form.Item>
       <Space.Compact style={{ width: '100%' }}>
         <Form.Item label="合約起始日" name="start_date" rules={[{ required: true }]} style={{ flex: 1 }}>
@@ -310,13 +333,13 @@ function Contracts() {
       </Form.Item>
       <Space.Compact style={{ width: '100%' }}>
         <Form.Item label="業務公司" name="sales_company_code" style={{ flex: 1 }}>
-          <Select options={salesCompanies} placeholder="不指定" allowClear />
+          <CodeSelect kind="company" companyType="sales" placeholder="不指定" allowClear />
         </Form.Item>
         <Form.Item label="業務金額" name="sales_amount" style={{ flex: 1 }}>
           <InputNumber min={0} step={100} style={{ width: '100%' }} />
         </Form.Item>
         <Form.Item label="維護公司" name="service_company_code" style={{ flex: 1 }}>
-          <Select options={serviceCompanies} placeholder="不指定" allowClear />
+          <CodeSelect kind="company" companyType="service" placeholder="不指定" allowClear />
         </Form.Item>
         <Form.Item label="維護金額" name="service_amount" style={{ flex: 1 }}>
           <InputNumber min={0} step={100} style={{ width: '100%' }} />
@@ -331,7 +354,7 @@ function Contracts() {
         <Input />
       </Form.Item>
       <Form.Item label="客戶名稱" name="customer_name" rules={[{ required: true }]}>
-        <Select options={customers} />
+        <CodeSelect kind="customer" currentName={editingRecord?.customer_name} placeholder="輸入客戶代碼或名稱" />
       </Form.Item>
       <Space.Compact style={{ width: '100%' }}>
         <Form.Item label="成交日期" name="deal_date" rules={[{ required: true }]} style={{ flex: 1 }}>
@@ -351,13 +374,13 @@ function Contracts() {
       </Form.Item>
       <Space.Compact style={{ width: '100%' }}>
         <Form.Item label="業務公司" name="sales_company_code" style={{ flex: 1 }}>
-          <Select options={salesCompanies} placeholder="不指定" allowClear />
+          <CodeSelect kind="company" companyType="sales" placeholder="不指定" allowClear />
         </Form.Item>
         <Form.Item label="業務金額" name="sales_amount" style={{ flex: 1 }}>
           <InputNumber min={0} step={100} style={{ width: '100%' }} />
         </Form.Item>
         <Form.Item label="維護公司" name="service_company_code" style={{ flex: 1 }}>
-          <Select options={serviceCompanies} placeholder="不指定" allowClear />
+          <CodeSelect kind="company" companyType="service" placeholder="不指定" allowClear />
         </Form.Item>
         <Form.Item label="維護金額" name="service_amount" style={{ flex: 1 }}>
           <InputNumber min={0} step={100} style={{ width: '100%' }} />
@@ -106,10 +106,10 @@ function Customers() {
         const { customer_code: newCode, ...rest } = values
 
         if (newCode !== originalCode) {
-          await changeCustomerCode(originalCode, newCode)
-          await updateCustomer(newCode, rest)
+          const changed = await changeCustomerCode(originalCode, newCode, editingRecord.version)
+          await updateCustomer(newCode, rest, changed.version)
         } else {
-          await updateCustomer(originalCode, rest)
+          await updateCustomer(originalCode, rest, editingRecord.version)
         }
         message.success('更新成功')
       } else {
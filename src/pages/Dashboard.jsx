@@ -1,7 +1,15 @@
+import { useState, useEffect } from 'react'
 import { Card, Row, Col, Statistic } from 'antd'
 import { UserOutlined, BankOutlined, FileTextOutlined, DollarOutlined } from '@ant-design/icons'
+import { getDashboard } from '../services/api'
 
 function Dashboard() {
+  const [summary, setSummary] = useState(null)
+
+  useEffect(() => {
+    getDashboard().then(setSummary).catch(() => setSummary(null))
+  }, [])
+
   return (
     <div style={{ padding: 24 }}>
       <h1 style={{ marginBottom: 24 }}>📊 首頁</h1>
@@ -28,7 +36,7 @@ function Dashboard() {
           <Card>
             <Statistic
               title="合約總數"
-              value={0}
+              value={summary?.active_contracts ?? 0}
               prefix={<FileTextOutlined />}
             />
           </Card>
@@ -37,7 +45,7 @@ function Dashboard() {
           <Card>
             <Statistic
               title="未收帳款"
-              value={0}
+              value={summary?.outstanding ?? 0}
               prefix="NT$"
               precision={2}
             />
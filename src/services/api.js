@@ -10,6 +10,26 @@ const api = axios.create({
   }
 })
 
+// read-your-writes：寫入回應帶有 X-Last-Write，之後的請求帶回，後端在數秒內改讀主庫（唯讀副本可能尚未同步）
+const READ_AFTER_WRITE_MS = 5000
+let lastWrite = null
+
+api.interceptors.request.use(config => {
+  if (lastWrite && Date.now() - lastWrite.at < READ_AFTER_WRITE_MS) {
+    config.headers['X-Last-Write'] = lastWrite.value
+  }
+  return config
+})
+
+api.interceptors.response.use(res => {
+  const value = res.headers['x-last-write']
+  if (value) lastWrite = { value, at: Date.now() }
+  return res
+})
+
+// 樂觀鎖：帶入讀取時的 version，資料已被其他人修改時後端回 412
+const ifMatch = (version) => (version ? { headers: { 'If-Match': `"${version}"` } } : {})
+
 // 客戶資料
 export const getCustomers = (search) => 
   api.get('/customers', { params: { search } }).then(res => res.data)
@@ -17,17 +37,21 @@ export const getCustomers = (search) =>
 export const getCustomer = (customerCode) => 
   api.get(`/customers/${customerCode}`).then(res => res.data)
 
+// 客戶總覽：客戶、合約、未結清帳款與合計、最近服務費用（一次取得）
+export const getCustomerOverview = (customerCode, serviceLimit) =>
+  api.get(`/customers/${customerCode}/overview`, { params: { service_limit: serviceLimit } }).then(res => res.data)
+
 export const createCustomer = (data) => 
   api.post('/customers', data).then(res => res.data)
 
-export const updateCustomer = (customerCode, data) => 
-  api.put(`/customers/${customerCode}`, data).then(res => res.data)
+export const updateCustomer = (customerCode, data, version) => 
+  api.put(`/customers/${customerCode}`, data, ifMatch(version)).then(res => res.data)
 
 export const deleteCustomer = (customerCode) => 
   api.delete(`/customers/${customerCode}`)
 
-export const changeCustomerCode = (customerCode, newCode) =>
-  api.post(`/customers/${customerCode}/change-code`, { new_customer_code: newCode }).then(res => res.data)
+export const changeCustomerCode = (customerCode, newCode, version) =>
+  api.post(`/customers/${customerCode}/change-code`, { new_customer_code: newCode }, ifMatch(version)).then(res => res.data)
 
 // 公司資料
 export const getCompanies = (type, search) => 
@@ -36,6 +60,13 @@ export const getCompanies = (type, search) =>
 export const getCompany = (companyCode) => 
   api.get(`/companies/${companyCode}`).then(res => res.data)
 
+// 合作公司對帳單與所有公司的應付彙總
+export const getCompanyStatement = (companyCode, filters = {}) =>
+  api.get(`/companies/${companyCode}/statement`, { params: filters }).then(res => res.data)
+
+export const getPayablesSummary = (filters = {}) =>
+  api.get('/companies/payables-summary', { params: filters }).then(res => res.data)
+
 export const createCompany = (data) => 
   api.post('/companies', data).then(res => res.data)
 
@@ -58,11 +89,11 @@ export const createLeasingContract = (data) =>
 export const createBuyoutContract = (data) => 
   api.post('/contracts/buyout', data).then(res => res.data)
 
-export const updateLeasingContract = (contractCode, data) => 
-  api.put(`/contracts/leasing/${contractCode}`, data).then(res => res.data)
+export const updateLeasingContract = (contractCode, data, version) => 
+  api.put(`/contracts/leasing/${contractCode}`, data, ifMatch(version)).then(res => res.data)
 
-export const updateBuyoutContract = (contractCode, data) => 
-  api.put(`/contracts/buyout/${contractCode}`, data).then(res => res.data)
+export const updateBuyoutContract = (contractCode, data, version) => 
+  api.put(`/contracts/buyout/${contractCode}`, data, ifMatch(version)).then(res => res.data)
 
 export const deleteLeasingContract = (contractCode) => 
   api.delete(`/contracts/leasing/${contractCode}`)
@@ -95,6 +126,20 @@ export const getPaidPayables = (filters = {}) =>
 export const getServiceExpenses = (filters = {}) => 
   api.get('/accounts/service', { params: filters }).then(res => res.data)
 
+export const getServiceExpenseSummary = (groupBy, filters = {}) =>
+  api.get('/accounts/service/summary', { params: { group_by: groupBy, ...filters } }).then(res => res.data)
+
+export const postServiceExpenseBatch = (items) =>
+  api.post('/accounts/service/batch', { items }).then(res => res.data)
+
+// 代碼自動完成（kind: customer / company / contract）
+export const typeahead = (kind, q, params = {}) =>
+  api.get('/typeahead', { params: { kind, q, ...params } }).then(res => res.data)
+
+// 儀表板
+export const getDashboard = () =>
+  api.get('/dashboard').then(res => res.data)
+
 // 銀行帳本
 export const getBankLedger = (fromDate, toDate, search) => 
   api.get('/bank-ledger', { params: { from_date: fromDate, to_date: toDate, search } }).then(res => res.data)